@@ -0,0 +1,340 @@
+"""
+Кэш ответов помощника на вопросы студентов.
+
+Состоит из двух уровней:
+1. Точное совпадение нормализованного текста вопроса в рамках одного контекста
+   (например, главы курса).
+2. Семантическое совпадение: если для вопроса доступен вектор эмбеддинга,
+   ищется ранее заданный вопрос с косинусным сходством не ниже порога.
+
+Перед сравнением векторы можно проецировать на главные компоненты
+(см. fit_projection/load_projection): время поиска линейно по размерности,
+а для косинусного сходства вопросов достаточно нескольких десятков компонент.
+
+Функции embed_question/lookup_cached_answer - общий для помощников поиск
+готового ответа: эмбеддинг вопроса вычисляется только при промахе по точному
+совпадению.
+"""
+import asyncio
+import logging
+import re
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = NUMPY_AVAILABLE
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+_PUNCT_RE = re.compile(r'[^\w\s]', re.UNICODE)
+_SPACES_RE = re.compile(r'\s+')
+
+# Порог косинусного сходства для семантического совпадения
+SEMANTIC_THRESHOLD = 0.92
+
+
+def normalize_question(question: str) -> str:
+    """
+    Нормализация текста вопроса для ключа кэша
+
+    Args:
+        question: Текст вопроса
+
+    Returns:
+        Вопрос в нижнем регистре без знаков препинания и лишних пробелов
+    """
+    return _SPACES_RE.sub(' ', _PUNCT_RE.sub(' ', question.lower())).strip()
+
+
+def fit_projection(embeddings: Any, n_components: int = 64) -> Optional[Any]:
+    """
+    Вычисление матрицы проекции на главные компоненты (PCA через SVD)
+
+    Args:
+        embeddings: Матрица эмбеддингов корпуса (N x D), например понятий курса
+        n_components: Количество сохраняемых компонент
+
+    Returns:
+        Матрица компонент (n_components x D, float32) или None, если NumPy недоступен
+    """
+    if not NUMPY_AVAILABLE:
+        return None
+    matrix = np.asarray(embeddings, dtype=np.float32)
+    matrix = matrix - matrix.mean(axis=0)
+    _, _, vt = np.linalg.svd(matrix, full_matrices=False)
+    return np.ascontiguousarray(vt[:n_components], dtype=np.float32)
+
+
+@lru_cache(maxsize=None)
+def load_projection(path: str) -> Optional[Any]:
+    """
+    Загрузка матрицы проекции, сохраненной через numpy.save
+
+    Файл читается один раз за процесс, все кэши используют одну матрицу.
+
+    Args:
+        path: Путь к .npy-файлу с результатом fit_projection (пустая строка - без проекции)
+
+    Returns:
+        Матрица компонент (float32) или None
+    """
+    if not path or not NUMPY_AVAILABLE:
+        return None
+    try:
+        components = np.load(path)
+    except (OSError, ValueError) as e:
+        logger.warning("Не удалось загрузить матрицу проекции %s: %s", path, e)
+        return None
+    logger.info("Загружена матрица проекции эмбеддингов %s", components.shape)
+    return np.ascontiguousarray(components, dtype=np.float32)
+
+
+if NUMBA_AVAILABLE:
+    @njit(cache=True, fastmath=True)
+    def _best_match(matrix, vector):
+        """
+        Поиск строки матрицы с наибольшим скалярным произведением на вектор
+
+        Для нормализованных векторов скалярное произведение равно косинусному
+        сходству. Оценки не сохраняются в промежуточный массив: за один проход
+        по матрице находится только лучшая строка.
+
+        Args:
+            matrix: Матрица нормализованных векторов (N x D, float32)
+            vector: Нормализованный вектор запроса (D, float32)
+
+        Returns:
+            Индекс лучшей строки и ее оценка
+        """
+        best = 0
+        best_score = -2.0
+        for i in range(matrix.shape[0]):
+            score = 0.0
+            for j in range(matrix.shape[1]):
+                score += matrix[i, j] * vector[j]
+            if score > best_score:
+                best = i
+                best_score = score
+        return best, best_score
+
+    # Компиляция при импорте (с кэшем на диске), а не при первом запросе
+    _best_match(np.zeros((1, 1), np.float32), np.zeros(1, np.float32))
+else:
+    def _best_match(matrix, vector):
+        """
+        Поиск строки матрицы с наибольшим скалярным произведением на вектор
+
+        Args:
+            matrix: Матрица нормализованных векторов (N x D, float32)
+            vector: Нормализованный вектор запроса (D, float32)
+
+        Returns:
+            Индекс лучшей строки и ее оценка
+        """
+        scores = matrix @ vector
+        best = int(np.argmax(scores))
+        return best, float(scores[best])
+
+
+class AnswerCache:
+    """
+    Двухуровневый (точный и семантический) LRU-кэш ответов
+    """
+
+    def __init__(self, max_size: int = 1024, threshold: float = SEMANTIC_THRESHOLD,
+                 projection: Any = None):
+        """
+        Инициализация кэша
+
+        Args:
+            max_size: Максимальное количество ответов на каждом уровне кэша
+            threshold: Порог косинусного сходства для семантического совпадения
+            projection: Матрица проекции эмбеддингов (k x D) из load_projection (опционально)
+        """
+        self.max_size = max_size
+        self.threshold = threshold
+        self.projection = projection
+        self._exact: "OrderedDict[Tuple[str, Hashable], str]" = OrderedDict()
+        # Для каждого контекста храним нормализованные векторы вопросов и ответы
+        self._vectors: "OrderedDict[Hashable, List[Tuple[Any, str]]]" = OrderedDict()
+        self._vectors_count = 0
+        # Матрицы векторов по контекстам: собираются при первом поиске
+        # и сбрасываются при добавлении вектора в контекст
+        self._matrices: Dict[Hashable, Any] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+    def _normalize_vector(self, embedding: Any) -> Optional[Any]:
+        """
+        Проекция вектора (если задана) и приведение к единичной длине
+
+        Args:
+            embedding: Вектор эмбеддинга
+
+        Returns:
+            Нормализованный вектор или None, если вектор нулевой или NumPy недоступен
+        """
+        if embedding is None or not NUMPY_AVAILABLE:
+            return None
+        vector = np.asarray(embedding, dtype=np.float32).ravel()
+        if self.projection is not None and self.projection.shape[1] == vector.shape[0]:
+            vector = self.projection @ vector
+        norm = float(np.linalg.norm(vector))
+        if norm == 0.0:
+            return None
+        return vector / norm
+
+    def get(self, question: str, context: Hashable = None, embedding: Any = None) -> Optional[str]:
+        """
+        Поиск ответа в кэше
+
+        Args:
+            question: Текст вопроса
+            context: Контекст вопроса (например, название главы)
+            embedding: Вектор эмбеддинга вопроса (опционально)
+
+        Returns:
+            Закэшированный ответ или None
+        """
+        key = (normalize_question(question), context)
+        with self._lock:
+            answer = self._exact.get(key)
+            if answer is not None:
+                self._exact.move_to_end(key)
+                self.hits += 1
+                return answer
+
+            vector = self._normalize_vector(embedding)
+            entries = self._vectors.get(context)
+            if vector is not None and entries:
+                matrix = self._matrices.get(context)
+                if matrix is None or matrix.shape[1] != vector.shape[0]:
+                    matrix = np.ascontiguousarray(np.stack([entry[0] for entry in entries]))
+                    self._matrices[context] = matrix
+                best, score = _best_match(matrix, vector)
+                if float(score) >= self.threshold:
+                    self._vectors.move_to_end(context)
+                    self.semantic_hits += 1
+                    return entries[best][1]
+
+            self.misses += 1
+            return None
+
+    def put(self, question: str, answer: str, context: Hashable = None, embedding: Any = None) -> None:
+        """
+        Сохранение ответа в кэш
+
+        Args:
+            question: Текст вопроса
+            answer: Ответ на вопрос
+            context: Контекст вопроса (например, название главы)
+            embedding: Вектор эмбеддинга вопроса (опционально)
+        """
+        key = (normalize_question(question), context)
+        vector = self._normalize_vector(embedding)
+        with self._lock:
+            self._exact[key] = answer
+            self._exact.move_to_end(key)
+            while len(self._exact) > self.max_size:
+                self._exact.popitem(last=False)
+
+            if vector is None:
+                return
+            self._vectors.setdefault(context, []).append((vector, answer))
+            self._vectors.move_to_end(context)
+            self._matrices.pop(context, None)
+            self._vectors_count += 1
+            # Вытесняем самые старые контексты целиком
+            while self._vectors_count > self.max_size and self._vectors:
+                removed_context, removed = self._vectors.popitem(last=False)
+                self._matrices.pop(removed_context, None)
+                self._vectors_count -= len(removed)
+
+    def invalidate(self) -> None:
+        """
+        Полная очистка кэша (например, после обновления графа знаний)
+        """
+        with self._lock:
+            self._exact.clear()
+            self._vectors.clear()
+            self._matrices.clear()
+            self._vectors_count = 0
+        logger.info("Кэш ответов очищен")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Возвращает статистику использования кэша
+
+        Returns:
+            Словарь со статистикой кэша
+        """
+        return {
+            "exact_entries": len(self._exact),
+            "semantic_entries": self._vectors_count,
+            "hits": self.hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "threshold": self.threshold
+        }
+
+
+async def embed_question(openrouter_client: Any, question: str) -> Optional[Any]:
+    """
+    Вычисление эмбеддинга вопроса, если клиент LLM это поддерживает
+
+    Вызов модели эмбеддингов блокирующий, поэтому выполняется в отдельном потоке.
+
+    Args:
+        openrouter_client: Клиент LLM (эмбеддинг вычисляется его методом embed)
+        question: Вопрос студента
+
+    Returns:
+        Вектор эмбеддинга или None
+    """
+    embed = getattr(openrouter_client, "embed", None)
+    if not callable(embed):
+        return None
+    try:
+        return await asyncio.to_thread(embed, question)
+    except Exception as e:
+        logger.warning("Не удалось вычислить эмбеддинг вопроса: %s", e)
+        return None
+
+
+async def lookup_cached_answer(cache: AnswerCache, openrouter_client: Any, question: str,
+                               context: Hashable = None) -> Tuple[Optional[str], Optional[Any]]:
+    """
+    Поиск готового ответа в кэше
+
+    Эмбеддинг вычисляется только при промахе по точному совпадению
+    и возвращается для сохранения нового ответа в кэш.
+
+    Args:
+        cache: Кэш ответов помощника
+        openrouter_client: Клиент LLM для вычисления эмбеддинга
+        question: Вопрос студента
+        context: Контекст вопроса (понятие, задача, глава)
+
+    Returns:
+        Кортеж (закэшированный ответ или None, эмбеддинг вопроса или None)
+    """
+    cached_answer = cache.get(question, context)
+    embedding = None
+    if cached_answer is None:
+        embedding = await embed_question(openrouter_client, question)
+        if embedding is not None:
+            cached_answer = cache.get(question, context, embedding)
+    return cached_answer, embedding
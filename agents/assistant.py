@@ -3,16 +3,113 @@
 """
 import logging
 import asyncio
-import traceback
-import re
-from typing import Dict, List, Any, Optional, Set
+import string
+import threading
+import time
+from typing import AsyncIterator, Callable, Dict, Hashable, List, Any, Optional, FrozenSet
+
+try:
+    import numpy as np
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
 
 from ai_tutor.database.neo4j_client import Neo4jClient
+from ai_tutor.database.query_cache import QueryCache, MISSING
+from ai_tutor.agents.answer_cache import AnswerCache, load_projection, lookup_cached_answer
 from ai_tutor.api.openrouter import OpenRouterClient
-from ai_tutor.config.settings import COURSE_NAME
+from ai_tutor.config.settings import (
+    COURSE_NAME, EMBEDDING_PCA_PATH, NEO4J_WARMUP
+)
 
 logger = logging.getLogger(__name__)
 
+# Список стоп-слов на русском (создается один раз при импорте модуля)
+_STOP_WORDS: FrozenSet[str] = frozenset((
+    "и", "в", "на", "с", "по", "к", "у", "о", "это", "что", "как", "кто", "где", "когда",
+    "почему", "зачем", "который", "такой", "этот", "тот", "для", "из", "от", "до", "за",
+    "при", "через", "над", "под", "около", "между", "а", "но", "или", "либо", "ни", "не",
+    "да", "же", "бы", "ли", "если", "то", "чтобы", "хотя", "потому", "так", "поэтому",
+))
+
+# Таблица замены знаков препинания на пробелы для str.translate
+_PUNCT_TABLE = str.maketrans({ch: ' ' for ch in string.punctuation + '«»—–…“”„'})
+
+# Целочисленные идентификаторы стоп-слов; все прочие слова получают идентификатор len(_STOP_IDS)
+_STOP_IDS: Dict[str, int] = {word: i for i, word in enumerate(sorted(_STOP_WORDS))}
+
+# Минимальное число токенов, начиная с которого фильтрация выполняется скомпилированной функцией
+NUMBA_MIN_TOKENS = 64
+
+if NUMBA_AVAILABLE:
+    # Признак стоп-слова по идентификатору токена (последний элемент - "не стоп-слово")
+    _IS_STOP = np.zeros(len(_STOP_IDS) + 1, dtype=np.bool_)
+    _IS_STOP[:len(_STOP_IDS)] = True
+    
+    @njit(cache=True)
+    def _filter_tokens(token_ids, lengths, is_stop, min_len):
+        """
+        Маска токенов, которые не являются стоп-словами и не короче min_len
+        """
+        mask = np.zeros(token_ids.shape[0], dtype=np.bool_)
+        for i in range(token_ids.shape[0]):
+            mask[i] = lengths[i] >= min_len and not is_stop[token_ids[i]]
+        return mask
+
+# Неизменная часть системного промпта. Собирается один раз при импорте,
+# чтобы префикс запроса к LLM был побайтно одинаковым для всех вопросов.
+_SYSTEM_PREFIX = (
+    f"Ты - помощник по курсу '{COURSE_NAME}'. Отвечай на вопросы студентов,\n"
+    "используя ТОЛЬКО информацию из предоставленного контекста понятий.\n"
+    "Если в контексте нет достаточной информации, честно признай это и не выдумывай факты.\n"
+    "Твоя цель - дать точную информацию из курса, помочь студенту разобраться в понятиях\n"
+    "и их взаимосвязях. Язык ответа - русский.\n"
+    "\n"
+    "Контекст понятий:\n"
+)
+
+# Бюджет контекста понятий в токенах (оценка: ~4 символа на токен)
+MAX_CONTEXT_TOKENS = 3000
+
+
+def _estimate_tokens(text: str) -> int:
+    """
+    Грубая оценка количества токенов в тексте
+    
+    Args:
+        text: Текст
+        
+    Returns:
+        Оценка количества токенов
+    """
+    return len(text) // 4 + 1
+
+
+# Прогрев Neo4j выполняется один раз на процесс
+_warmup_started = False
+_warmup_lock = threading.Lock()
+
+# Стандартные ответы помощника
+NOT_FOUND_ANSWER = "К сожалению, я не нашел информации по вашему вопросу в материалах курса. Пожалуйста, попробуйте переформулировать вопрос или уточнить, какой аспект курса вас интересует."
+ERROR_ANSWER = "Произошла ошибка при обработке вашего вопроса. Пожалуйста, попробуйте еще раз позже."
+
+# Параметры кэширования запросов к графу знаний
+QUERY_CACHE_SIZE = 4096
+QUERY_CACHE_TTL = 300  # 5 минут
+# Как часто (в запросах) выводить статистику кэшей в лог
+CACHE_STATS_INTERVAL = 100
+
+# Максимальное время ожидания ответа в синхронной обертке (в секундах)
+SYNC_ANSWER_TIMEOUT = 180
+
+# Долгоживущий цикл событий для синхронных вызовов. Работает в отдельном потоке,
+# поэтому соединения клиентов (HTTP, Neo4j) не пересоздаются на каждый вопрос.
+# Клиенты, создающие асинхронные сессии, должны делать это лениво - при первом
+# вызове внутри этого цикла.
+_LOOP = asyncio.new_event_loop()
+threading.Thread(target=_LOOP.run_forever, name="course-assistant-loop", daemon=True).start()
+
 
 class CourseAssistant:
     """
@@ -29,6 +126,171 @@ class CourseAssistant:
         """
         self.neo4j_client = neo4j_client
         self.openrouter_client = openrouter_client
+        
+        # Кэши результатов запросов к Neo4j
+        self._kw_cache = QueryCache("keywords", QUERY_CACHE_SIZE, QUERY_CACHE_TTL)
+        self._conn_cache = QueryCache("connections", QUERY_CACHE_SIZE, QUERY_CACHE_TTL)
+        self._chapter_cache = QueryCache("chapters", QUERY_CACHE_SIZE, QUERY_CACHE_TTL)
+        self._requests_count = 0
+        
+        # Кэш готовых ответов (точное и семантическое совпадение вопроса)
+        self._answer_cache = AnswerCache(
+            max_size=1024, threshold=0.92, projection=load_projection(EMBEDDING_PCA_PATH)
+        )
+        
+        # Прогреваем кэш страниц Neo4j в фоне, чтобы не задерживать запуск
+        global _warmup_started
+        if NEO4J_WARMUP:
+            with _warmup_lock:
+                if not _warmup_started:
+                    _warmup_started = True
+                    threading.Thread(target=self.prewarm, name="neo4j-warmup", daemon=True).start()
+    
+    def prewarm(self) -> None:
+        """
+        Прогрев кэша страниц Neo4j: загрузка понятий, связей и их свойств в память
+        
+        Используется процедура APOC, а при ее отсутствии - запрос,
+        обходящий все понятия и их связи.
+        """
+        start_time = time.time()
+        try:
+            result = self.neo4j_client.execute_query("CALL apoc.warmup.run(true, true, true)")
+            logger.info("Прогрев Neo4j через APOC завершен за %.2fс: %s", time.time() - start_time, result[0] if result else {})
+            return
+        except Exception as e:
+            logger.info("Процедура apoc.warmup.run недоступна, используется запасной прогрев: %s", e)
+        
+        try:
+            result = self.neo4j_client.execute_query(
+                "MATCH (c:Concept) OPTIONAL MATCH (c)-[r]-() "
+                "RETURN count(DISTINCT c) AS concepts, count(r) AS relations"
+            )
+            logger.info("Прогрев Neo4j завершен за %.2fс: %s", time.time() - start_time, result[0] if result else {})
+        except Exception as e:
+            logger.warning("Ошибка при прогреве Neo4j: %s", e)
+    
+    def invalidate_answer_cache(self) -> None:
+        """
+        Сброс кэша готовых ответов (вызывается после изменения графа знаний)
+        """
+        self._answer_cache.invalidate()
+    
+    async def _cached(self, cache: QueryCache, key: Hashable, func: Callable, *args) -> Any:
+        """
+        Получение результата запроса из кэша или выполнение запроса
+        
+        Асинхронные функции вызываются напрямую, синхронные - в отдельном потоке.
+        
+        Args:
+            cache: Кэш для хранения результата
+            key: Ключ кэша
+            func: Функция запроса к Neo4j
+            *args: Аргументы функции
+            
+        Returns:
+            Результат запроса
+        """
+        value = cache.get(key)
+        if value is MISSING:
+            if asyncio.iscoroutinefunction(func):
+                value = await func(*args)
+            else:
+                value = await asyncio.to_thread(func, *args)
+            cache.set(key, value)
+        return value
+    
+    async def _get_connections_batch(self, names: List[str]) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Получение связей для списка понятий с учетом кэша
+        
+        Понятия, которых нет в кэше, запрашиваются у Neo4j одним пакетным запросом.
+        
+        Args:
+            names: Список названий понятий
+            
+        Returns:
+            Словарь {название понятия: список связей}
+        """
+        relations: Dict[str, List[Dict[str, Any]]] = {}
+        missing = []
+        for name in names:
+            value = self._conn_cache.get(name)
+            if value is MISSING:
+                missing.append(name)
+            else:
+                relations[name] = value
+        
+        if missing:
+            fetched = await self.neo4j_client.async_get_concept_connections_batch(missing)
+            for name in missing:
+                value = fetched.get(name, [])
+                self._conn_cache.set(name, value)
+                relations[name] = value
+        
+        return relations
+    
+    def invalidate(self) -> None:
+        """
+        Сброс кэшей запросов (вызывается после изменения графа знаний)
+        """
+        for cache in (self._kw_cache, self._conn_cache, self._chapter_cache):
+            cache.invalidate()
+    
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """
+        Возвращает статистику использования кэшей
+        
+        Returns:
+            Словарь со статистикой по каждому кэшу
+        """
+        return {
+            cache.name: cache.get_stats()
+            for cache in (self._kw_cache, self._conn_cache, self._chapter_cache)
+        }
+    
+    async def _prepare_messages(self, question: str, chapter_title: Optional[str] = None) -> Optional[List[Dict[str, str]]]:
+        """
+        Подготовка сообщений для LLM: поиск понятий и построение контекста
+        
+        Args:
+            question: Вопрос студента
+            chapter_title: Название главы (опционально)
+            
+        Returns:
+            Список сообщений или None, если релевантные понятия не найдены
+        """
+        # 1. Извлекаем ключевые слова
+        keywords = self._extract_keywords(question)
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("Извлечены ключевые слова: %s", ", ".join(keywords))
+        
+        # 2. Ищем релевантные понятия
+        concepts = await self._cached(
+            self._kw_cache,
+            (tuple(keywords), chapter_title),
+            self.neo4j_client.async_search_concepts_by_keywords,
+            keywords,
+            chapter_title
+        )
+        
+        self._requests_count += 1
+        if self._requests_count % CACHE_STATS_INTERVAL == 0:
+            logger.info("Статистика кэшей запросов: %s", self.get_cache_stats())
+        
+        if not concepts:
+            logger.warning("Не найдено понятий по запросу: %s", question)
+            return None
+        
+        logger.info("Найдено %d релевантных понятий", len(concepts))
+        
+        # 3. Формируем контекст
+        context = await self._build_concept_context(concepts, chapter_title)
+        
+        return [
+            {"role": "system", "content": _SYSTEM_PREFIX + context},
+            {"role": "user", "content": question}
+        ]
     
     async def answer_question(self, question: str, chapter_title: Optional[str] = None) -> str:
         """
@@ -42,47 +304,67 @@ class CourseAssistant:
             Ответ на вопрос
         """
         try:
-            # 1. Извлекаем ключевые слова
-            keywords = self._extract_keywords(question)
-            logger.info(f"Извлечены ключевые слова: {', '.join(keywords)}")
+            # 0. Проверяем кэш готовых ответов
+            cached_answer, embedding = await lookup_cached_answer(self._answer_cache, self.openrouter_client, question, chapter_title)
+            if cached_answer is not None:
+                logger.info("Ответ на вопрос найден в кэше: %.50s...", question)
+                return cached_answer
             
-            # 2. Ищем релевантные понятия
-            concepts = self.neo4j_client.search_concepts_by_keywords(keywords, chapter_title)
+            messages = await self._prepare_messages(question, chapter_title)
+            if messages is None:
+                return NOT_FOUND_ANSWER
             
-            if not concepts:
-                logger.warning(f"Не найдено понятий по запросу: {question}")
-                return "К сожалению, я не нашел информации по вашему вопросу в материалах курса. Пожалуйста, попробуйте переформулировать вопрос или уточнить, какой аспект курса вас интересует."
+            # 4. Генерируем ответ с помощью LLM
+            response = await self.openrouter_client.generate_completion_batched(messages, temperature=0.3)
+            answer = response.content
             
-            logger.info(f"Найдено {len(concepts)} релевантных понятий")
+            if answer:
+                self._answer_cache.put(question, answer, chapter_title, embedding)
             
-            # 3. Формируем контекст
-            context = self._build_concept_context(concepts, chapter_title)
+            logger.info("Сгенерирован ответ на вопрос: %.50s...", question)
+            return answer
             
-            # 4. Генерируем ответ с помощью LLM
-            messages = [
-                {"role": "system", "content": f"""
-                Ты - помощник по курсу '{COURSE_NAME}'. Отвечай на вопросы студентов,
-                используя ТОЛЬКО информацию из предоставленного контекста понятий.
-                Если в контексте нет достаточной информации, честно признай это и не выдумывай факты.
-                Твоя цель - дать точную информацию из курса, помочь студенту разобраться в понятиях
-                и их взаимосвязях. Язык ответа - русский.
-                
-                Контекст понятий:
-                {context}
-                """},
-                {"role": "user", "content": question}
-            ]
+        except Exception as e:
+            logger.error("Ошибка при ответе на вопрос: %s", e, exc_info=True)
+            return ERROR_ANSWER
+    
+    async def answer_question_stream(self, question: str, chapter_title: Optional[str] = None) -> AsyncIterator[str]:
+        """
+        Потоковый ответ на вопрос студента: фрагменты ответа выдаются по мере генерации
+        
+        Args:
+            question: Вопрос студента
+            chapter_title: Название главы (опционально)
             
-            # Отправляем запрос к API
-            response = await self.openrouter_client.generate_completion(messages, temperature=0.3)
-            answer = response["choices"][0]["message"]["content"]
+        Yields:
+            Фрагменты текста ответа
+        """
+        try:
+            cached_answer, embedding = await lookup_cached_answer(self._answer_cache, self.openrouter_client, question, chapter_title)
+            if cached_answer is not None:
+                logger.info("Ответ на вопрос найден в кэше: %.50s...", question)
+                yield cached_answer
+                return
             
-            logger.info(f"Сгенерирован ответ на вопрос: {question[:50]}...")
-            return answer
+            messages = await self._prepare_messages(question, chapter_title)
+            if messages is None:
+                yield NOT_FOUND_ANSWER
+                return
+            
+            answer_parts = []
+            async for delta in self.openrouter_client.stream_completion(messages, temperature=0.3):
+                answer_parts.append(delta)
+                yield delta
+            
+            answer = "".join(answer_parts)
+            if answer:
+                self._answer_cache.put(question, answer, chapter_title, embedding)
+            
+            logger.info("Сгенерирован потоковый ответ на вопрос: %.50s...", question)
             
         except Exception as e:
-            logger.error(f"Ошибка при ответе на вопрос: {str(e)}\n{traceback.format_exc()}")
-            return "Произошла ошибка при обработке вашего вопроса. Пожалуйста, попробуйте еще раз позже."
+            logger.error("Ошибка при потоковом ответе на вопрос: %s", e, exc_info=True)
+            yield ERROR_ANSWER
     
     def answer_question_sync(self, question: str, chapter_title: Optional[str] = None) -> str:
         """
@@ -96,20 +378,14 @@ class CourseAssistant:
             Ответ на вопрос
         """
         try:
-            # Создаем новый цикл событий для этого потока
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            
-            try:
-                # Вызываем асинхронный метод
-                return loop.run_until_complete(
-                    self.answer_question(question, chapter_title)
-                )
-            finally:
-                loop.close()
+            # Передаем корутину в фоновый цикл событий и ждем результата
+            future = asyncio.run_coroutine_threadsafe(
+                self.answer_question(question, chapter_title), _LOOP
+            )
+            return future.result(timeout=SYNC_ANSWER_TIMEOUT)
         except Exception as e:
-            logger.error(f"Ошибка в синхронной обертке answer_question_sync: {str(e)}\n{traceback.format_exc()}")
-            return "Произошла ошибка при обработке вашего вопроса. Пожалуйста, попробуйте еще раз позже."
+            logger.error("Ошибка в синхронной обертке answer_question_sync: %s", e, exc_info=True)
+            return ERROR_ANSWER
     
     def _extract_keywords(self, question: str) -> List[str]:
         """
@@ -119,34 +395,41 @@ class CourseAssistant:
             question: Вопрос студента
             
         Returns:
-            Список ключевых слов
+            Отсортированный список уникальных ключевых слов
         """
         # Простая реализация: удаляем стоп-слова и оставляем существительные и прилагательные
         # В реальном приложении можно использовать более сложные алгоритмы (например, NLTK или spaCy)
         
-        # Список стоп-слов на русском
-        stop_words = {"и", "в", "на", "с", "по", "к", "у", "о", "это", "что", "как", "кто", "где", "когда", 
-                      "почему", "зачем", "который", "такой", "этот", "тот", "для", "из", "от", "до", "за",
-                      "при", "через", "над", "под", "около", "между", "а", "но", "или", "либо", "ни", "не",
-                      "да", "же", "бы", "ли", "если", "то", "чтобы", "хотя", "потому", "так", "поэтому"}
-        
         # Очищаем и токенизируем текст
-        cleaned_text = re.sub(r'[^\w\s]', ' ', question.lower())
-        words = cleaned_text.split()
+        words = question.lower().translate(_PUNCT_TABLE).split()
         
         # Фильтруем стоп-слова и короткие слова
-        keywords = [word for word in words if word not in stop_words and len(word) > 2]
+        if NUMBA_AVAILABLE and len(words) >= NUMBA_MIN_TOKENS:
+            # Для длинных текстов фильтр выполняется скомпилированным циклом
+            not_stop = len(_STOP_IDS)
+            token_ids = np.fromiter((_STOP_IDS.get(word, not_stop) for word in words), dtype=np.int64, count=len(words))
+            lengths = np.fromiter((len(word) for word in words), dtype=np.int64, count=len(words))
+            mask = _filter_tokens(token_ids, lengths, _IS_STOP, 3)
+            keywords = [word for word, keep in zip(words, mask) if keep]
+        else:
+            keywords = [word for word in words if len(word) > 2 and word not in _STOP_WORDS]
         
         # Если ключевых слов меньше 2, возвращаем все слова длиннее 3 символов
         if len(keywords) < 2:
             keywords = [word for word in words if len(word) > 3]
         
-        return keywords
+        # Убираем повторы; упорядочивание делает ключ кэша поиска стабильным
+        return sorted(set(keywords))
     
-    def _build_concept_context(self, concepts: List[Dict[str, Any]], chapter_title: Optional[str] = None) -> str:
+    async def _build_concept_context(self, concepts: List[Dict[str, Any]], chapter_title: Optional[str] = None) -> str:
         """
         Построение контекста из понятий
         
+        Размер контекста ограничен бюджетом MAX_CONTEXT_TOKENS: понятия добавляются
+        в порядке релевантности, а не поместившиеся пропускаются. Связи запрашиваются
+        одним пакетным запросом только для вошедших в контекст понятий,
+        параллельно с запросом информации о главе.
+        
         Args:
             concepts: Список понятий
             chapter_title: Название главы (опционально)
@@ -154,50 +437,94 @@ class CourseAssistant:
         Returns:
             Строка с контекстом
         """
+        # Отбираем понятия, которые помещаются в бюджет без учета связей
+        selected = []
+        used_tokens = 0
+        for concept in concepts:
+            concept_text = self._format_concept(concept)
+            tokens = _estimate_tokens(concept_text)
+            if selected and used_tokens + tokens > MAX_CONTEXT_TOKENS:
+                break
+            selected.append((concept.get('name', ''), concept_text))
+            used_tokens += tokens
+        
+        # Связи понятий запрашиваются одним запросом, параллельно с информацией о главе
+        tasks = [self._get_connections_batch([name for name, _ in selected])]
+        if chapter_title:
+            tasks.append(self._cached(
+                self._chapter_cache,
+                chapter_title,
+                self.neo4j_client.async_get_chapter_info,
+                chapter_title
+            ))
+        
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        
+        all_relations = results[0]
+        if isinstance(all_relations, Exception):
+            logger.warning("Ошибка при получении связей понятий: %s", all_relations)
+            all_relations = {}
+        
         context_parts = []
+        used_tokens = 0
         
-        # Добавляем информацию о каждом понятии
-        for concept in concepts:
-            name = concept.get('name', '')
-            definition = concept.get('definition', '')
-            example = concept.get('example', '')
-            
-            # Формируем текст понятия
-            concept_text = f"Понятие: {name}\nОпределение: {definition}"
-            
-            if example:
-                concept_text += f"\nПример: {example}"
-            
-            # Получаем связи с другими понятиями
-            try:
-                relations = self.neo4j_client.get_concept_connections(name)
-                if relations:
-                    relation_text = "Связи с другими понятиями:\n"
-                    for relation in relations[:5]:  # Ограничиваем до 5 связей
-                        rel_type = relation.get('type', '')
-                        rel_concept = relation.get('concept', '')
-                        if rel_type and rel_concept:
-                            relation_text += f"- {rel_type} {rel_concept}\n"
-                    
-                    concept_text += f"\n{relation_text}"
-            except Exception as e:
-                logger.warning(f"Ошибка при получении связей для понятия {name}: {str(e)}")
+        # Добавляем информацию о главе, если указана
+        if chapter_title:
+            chapter_info = results[-1]
+            if isinstance(chapter_info, Exception):
+                logger.warning("Ошибка при получении информации о главе %s: %s", chapter_title, chapter_info)
+            elif chapter_info and 'main_ideas' in chapter_info:
+                chapter_text = f"Информация о главе '{chapter_title}':\n"
+                chapter_text += f"Основные идеи: {chapter_info['main_ideas']}\n"
+                context_parts.append(chapter_text)
+                used_tokens += _estimate_tokens(chapter_text)
+        
+        # Добавляем информацию о каждом понятии, пока не исчерпан бюджет
+        included = 0
+        for name, concept_text in selected:
+            relations = all_relations.get(name, [])
+            if relations:
+                relation_text = "Связи с другими понятиями:\n"
+                for relation in relations[:5]:  # Ограничиваем до 5 связей
+                    rel_type = relation.get('type', '')
+                    rel_concept = relation.get('concept', '')
+                    if rel_type and rel_concept:
+                        relation_text += f"- {rel_type} {rel_concept}\n"
+                
+                concept_text += f"\n{relation_text}"
             
+            tokens = _estimate_tokens(concept_text)
+            if included and used_tokens + tokens > MAX_CONTEXT_TOKENS:
+                break
             context_parts.append(concept_text)
+            used_tokens += tokens
+            included += 1
         
-        # Добавляем информацию о главе, если указана
-        if chapter_title:
-            try:
-                chapter_info = self.neo4j_client.get_chapter_info(chapter_title)
-                if chapter_info and 'main_ideas' in chapter_info:
-                    chapter_text = f"Информация о главе '{chapter_title}':\n"
-                    chapter_text += f"Основные идеи: {chapter_info['main_ideas']}\n"
-                    context_parts.insert(0, chapter_text)
-            except Exception as e:
-                logger.warning(f"Ошибка при получении информации о главе {chapter_title}: {str(e)}")
+        skipped = len(concepts) - included
+        if skipped > 0:
+            context_parts.append(f"... и ещё {skipped} понятий пропущено")
         
         return "\n\n".join(context_parts)
     
+    @staticmethod
+    def _format_concept(concept: Dict[str, Any]) -> str:
+        """
+        Форматирование понятия для контекста (без связей)
+        
+        Args:
+            concept: Понятие
+            
+        Returns:
+            Текст понятия
+        """
+        concept_text = f"Понятие: {concept.get('name', '')}\nОпределение: {concept.get('definition', '')}"
+        
+        example = concept.get('example', '')
+        if example:
+            concept_text += f"\nПример: {example}"
+        
+        return concept_text
+    
     def log_interaction(self, student_id: str, question: str, answer: str, chapter_title: Optional[str] = None) -> None:
         """
         Сохранение взаимодействия в базе данных
@@ -211,6 +538,6 @@ class CourseAssistant:
         try:
             # Вызываем метод Neo4j клиента для логирования
             self.neo4j_client.save_assistant_interaction(student_id, question, answer, chapter_title)
-            logger.info(f"Сохранено взаимодействие с помощником для студента {student_id}")
+            logger.info("Сохранено взаимодействие с помощником для студента %s", student_id)
         except Exception as e:
-            logger.error(f"Ошибка при логировании взаимодействия: {str(e)}") 
\ No newline at end of file
+            logger.error("Ошибка при логировании взаимодействия: %s", e, exc_info=True) 
\ No newline at end of file
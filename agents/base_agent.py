@@ -5,11 +5,17 @@ from typing import Dict, List, Any, Optional
 import logging
 
 from crewai import Agent
+from pydantic import ConfigDict
 
-from ai_tutor.database.neo4j_client import Neo4jClient
+from ai_tutor.database.neo4j_client import Neo4jClient, get_shared_client
 
 logger = logging.getLogger(__name__)
 
+# Конфигурация схем входных данных инструментов агентов: входные данные
+# неизменяемы и не проверяются при присваивании, лишние поля из вызова
+# агента отбрасываются
+TOOL_INPUT_CONFIG = ConfigDict(frozen=True, extra="ignore", validate_assignment=False)
+
 
 class BaseAgent:
     """
@@ -40,7 +46,7 @@ class BaseAgent:
         self.verbose = verbose
         self.allow_delegation = allow_delegation
         self.tools = tools or []
-        self.db_client = Neo4jClient()
+        self.db_client = get_shared_client()
         
     def create_agent(self) -> Agent:
         """
@@ -67,7 +73,10 @@ class BaseAgent:
         """
         Получение клиента Neo4j
         
+        Возвращает общий для процесса клиент, поэтому может вызываться
+        и до инициализации базового класса (при создании инструментов).
+        
         Returns:
             Клиент Neo4j
         """
-        return self.db_client
+        return get_shared_client()
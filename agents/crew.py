@@ -4,17 +4,156 @@
 from typing import Dict, List, Any, Optional
 import logging
 import json
-import random
-import traceback
 import asyncio
-from neo4j.exceptions import ServiceUnavailable
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from neo4j.exceptions import Neo4jError, ServiceUnavailable
+from openai import OpenAIError
+from pydantic import ValidationError
 
-from ai_tutor.api.openrouter import OpenRouterClient
-from ai_tutor.database.neo4j_client import Neo4jClient
-from ai_tutor.config.settings import COURSE_NAME
+from ai_tutor.api.openrouter import OpenRouterClient, STREAM_IDLE_TIMEOUT
+from ai_tutor.api.circuit_breaker import CircuitBreaker, CircuitOpenError
+from ai_tutor.agents.schemas import CheckResult, GeneratedTask
+from ai_tutor.database.neo4j_client import Neo4jClient, get_shared_client
+from ai_tutor.database.query_cache import QueryCache, MISSING
+from ai_tutor.config.settings import COURSE_NAME, NEO4J_EXECUTOR_WORKERS
 
 logger = logging.getLogger(__name__)
 
+# Хранилище циклов событий синхронных оберток: по одному циклу на поток
+_thread_local = threading.local()
+
+# Максимальное количество студентов, для которых хранится серия правильных ответов
+MAX_TRACKED_STUDENTS = 10000
+
+# Общий для всех экземпляров TutorCrew выключатель вызовов OpenRouter API:
+# при недоступности API задачи сразу заменяются заглушками вместо ожидания тайм-аута
+_breaker = CircuitBreaker("openrouter", fail_threshold=5, reset_timeout=60)
+
+# Ожидаемые ошибки асинхронных методов (недоступность Neo4j или API, тайм-ауты,
+# некорректные данные). Прочие исключения передаются вызывающему коду: бот
+# ожидает асинхронные методы напрямую, и их обрабатывают обработчики бота
+_EXPECTED_ERRORS = (
+    ServiceUnavailable, Neo4jError, OpenAIError, asyncio.TimeoutError,
+    ValueError, KeyError, TypeError
+)
+
+
+def _run_sync(coro):
+    """
+    Выполнение корутины из синхронного кода
+    
+    Цикл событий создается один раз для каждого потока и переиспользуется
+    между вызовами, вместо создания и закрытия цикла на каждый запрос.
+    
+    Args:
+        coro: Корутина для выполнения
+        
+    Returns:
+        Результат корутины
+    """
+    loop = getattr(_thread_local, "loop", None)
+    if loop is None or loop.is_closed():
+        loop = asyncio.new_event_loop()
+        _thread_local.loop = loop
+    return loop.run_until_complete(coro)
+
+
+def _index_options(task: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """
+    Построение индекса вариантов ответа шаблонной задачи по меткам
+    
+    Индекс сохраняется в задаче под ключом "_options_by_label", чтобы
+    проверка ответа выполнялась поиском по словарю, а не перебором вариантов.
+    
+    Args:
+        task: Шаблонная задача
+        
+    Returns:
+        Словарь {метка в верхнем регистре: вариант ответа}
+    """
+    options_by_label = {
+        str(option.get("label", "")).strip().upper(): option
+        for option in task.get("options", [])
+        if isinstance(option, dict)
+    }
+    task["_options_by_label"] = options_by_label
+    return options_by_label
+
+
+# Неизменяемые части заглушек задач: создаются один раз при импорте модуля,
+# в _generate_fallback_task подставляется только название главы
+_FALLBACK_CONCEPT_NAME = "Ключевое понятие главы"
+
+_TEMPLATE_FALLBACK_QUESTION = "Какое из следующих определений лучше всего описывает ключевое понятие из главы '{chapter_title}'?"
+
+_TEMPLATE_FALLBACK_OPTIONS = (
+    {"label": "A", "text": "Ключевое понятие из главы '{chapter_title}' - это система взаимосвязанных элементов, работающих для достижения общей цели", "is_correct": True, 
+     "explanation": "Это обобщенное определение системного подхода, который является фундаментальным для понимания материала главы."},
+    {"label": "B", "text": "Это изолированный элемент, который не взаимодействует с другими компонентами", "is_correct": False, 
+     "explanation": "Это противоречит системному подходу, который подчеркивает взаимосвязь элементов."},
+    {"label": "C", "text": "Это только теоретическая концепция, не имеющая практического применения", "is_correct": False, 
+     "explanation": "Понятия системного менеджмента имеют важное практическое применение."},
+    {"label": "D", "text": "Это простая совокупность элементов без определенной структуры", "is_correct": False, 
+     "explanation": "Системный подход подразумевает наличие структуры и организации элементов."}
+)
+
+_CREATIVE_FALLBACK_QUESTION = "Объясните своими словами, как ключевые понятия из главы '{chapter_title}' формируют систему знаний и как они могут быть применены в реальной жизни или профессиональной деятельности."
+
+_CREATIVE_FALLBACK_EXAMPLE = "В главе '{chapter_title}' представлены важные системные понятия, которые взаимосвязаны следующим образом... Эти понятия могут быть применены в таких ситуациях, как..."
+
+_CREATIVE_FALLBACK_CRITERIA = (
+    "Точность определения понятий",
+    "Понимание взаимосвязей между понятиями",
+    "Глубина анализа практического применения"
+)
+
+_CREATIVE_FALLBACK_HINTS = (
+    "Сначала определите ключевые понятия из главы",
+    "Подумайте о том, как эти понятия связаны между собой",
+    "Приведите конкретные примеры, где эти понятия могут быть применены"
+)
+
+
+def _build_fallback_task(chapter_title: str, task_type: str, difficulty: str) -> Dict[str, Any]:
+    """
+    Построение заглушки задачи
+    
+    Args:
+        chapter_title: Название главы
+        task_type: Тип задачи
+        difficulty: Уровень сложности
+        
+    Returns:
+        Заглушка задачи
+    """
+    fields = {"chapter_title": chapter_title}
+    
+    if task_type == "template":
+        # Копируем варианты ответа, чтобы задачи не разделяли общие словари
+        options = [dict(option) for option in _TEMPLATE_FALLBACK_OPTIONS]
+        options[0]["text"] = options[0]["text"].format_map(fields)
+        task = {
+            "question": _TEMPLATE_FALLBACK_QUESTION.format_map(fields),
+            "options": options,
+            "concept_name": _FALLBACK_CONCEPT_NAME,
+            "task_type": task_type,
+            "difficulty": difficulty
+        }
+        _index_options(task)
+        return task
+    else:  # creative
+        return {
+            "question": _CREATIVE_FALLBACK_QUESTION.format_map(fields),
+            "criteria": list(_CREATIVE_FALLBACK_CRITERIA),
+            "example_answer": _CREATIVE_FALLBACK_EXAMPLE.format_map(fields),
+            "hints": list(_CREATIVE_FALLBACK_HINTS),
+            "concept_name": _FALLBACK_CONCEPT_NAME,
+            "task_type": task_type,
+            "difficulty": difficulty
+        }
+
 
 class TutorCrew:
     """
@@ -31,9 +170,108 @@ class TutorCrew:
         """
         self.verbose = verbose
         self.openrouter_client = openrouter_client
-        self.neo4j_client = Neo4jClient()
+        self.neo4j_client = get_shared_client()
         # Словарь для отслеживания последовательных правильных ответов студентов
-        self.correct_answers_count = {}  # Формат: {student_id: count}
+        # Ограничен MAX_TRACKED_STUDENTS: дольше всех неактивные студенты вытесняются
+        self.correct_answers_count: "OrderedDict[str, int]" = OrderedDict()  # Формат: {student_id: count}
+        self._streak_lock = threading.Lock()
+        # Кэш редко меняющихся данных графа знаний (потокобезопасный,
+        # т.к. синхронные обертки вызываются из разных потоков)
+        self._concept_cache = QueryCache("concepts", max_size=1024, ttl=300)
+        # Отдельный ограниченный пул потоков для синхронных запросов к Neo4j,
+        # чтобы они не конкурировали с остальными задачами пула по умолчанию
+        self._db_pool = ThreadPoolExecutor(
+            max_workers=NEO4J_EXECUTOR_WORKERS, thread_name_prefix="neo4j"
+        )
+    
+    def _get_concept_by_name_cached(self, concept_name: str, chapter_title: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Получение понятия по названию с использованием кэша
+        
+        Args:
+            concept_name: Название понятия
+            chapter_title: Название главы (опционально)
+            
+        Returns:
+            Понятие
+        """
+        key = (concept_name, chapter_title)
+        concept = self._concept_cache.get(key)
+        if concept is MISSING:
+            concept = self.neo4j_client.get_concept_by_name(concept_name, chapter_title)
+            self._concept_cache.set(key, concept)
+        return concept
+    
+    def _increment_streak(self, student_id: str) -> int:
+        """
+        Увеличение счетчика правильных ответов подряд
+        
+        Args:
+            student_id: ID студента
+            
+        Returns:
+            Новое значение счетчика
+        """
+        with self._streak_lock:
+            count = self.correct_answers_count.pop(student_id, 0) + 1
+            self.correct_answers_count[student_id] = count
+            while len(self.correct_answers_count) > MAX_TRACKED_STUDENTS:
+                self.correct_answers_count.popitem(last=False)
+        return count
+    
+    def reset_streak(self, student_id: str) -> None:
+        """
+        Сброс счетчика правильных ответов подряд
+        
+        Args:
+            student_id: ID студента
+        """
+        with self._streak_lock:
+            self.correct_answers_count.pop(student_id, None)
+    
+    def invalidate_cache(self) -> None:
+        """
+        Сброс кэша понятий (вызывается после изменения графа знаний)
+        """
+        self._concept_cache.invalidate()
+    
+    def close(self) -> None:
+        """
+        Освобождение ресурсов команды (пула потоков для запросов к Neo4j)
+        """
+        self._db_pool.shutdown(wait=False)
+    
+    async def _call_openrouter(self, coro, timeout: Optional[float] = None) -> Any:
+        """
+        Вызов OpenRouter API через общий выключатель
+        
+        Корутина должна передавать ошибки API наружу (raise_errors=True у методов
+        OpenRouterClient): запасной ответ вместо исключения выключатель считает успехом.
+        
+        Args:
+            coro: Корутина вызова API
+            timeout: Тайм-аут в секундах (опционально)
+            
+        Returns:
+            Результат вызова API
+            
+        Raises:
+            CircuitOpenError: Если выключатель разомкнут и вызов не выполнялся
+        """
+        if _breaker.is_open():
+            coro.close()
+            raise CircuitOpenError("OpenRouter API временно недоступен")
+        try:
+            result = await (asyncio.wait_for(coro, timeout=timeout) if timeout else coro)
+        except asyncio.CancelledError:
+            # Отмена вызова (студент ушел, остановка бота) не говорит о состоянии API
+            _breaker.release_trial()
+            raise
+        except Exception:
+            _breaker.record_failure()
+            raise
+        _breaker.record_success()
+        return result
     
     async def async_full_tutor_process(self, student_id: str, chapter_title: str, 
                          task_type: str, difficulty: str) -> Dict[str, Any]:
@@ -50,96 +288,79 @@ class TutorCrew:
             Словарь с задачей и метаданными
         """
         try:
-            logger.info(f"Начинаем генерацию задачи: глава={chapter_title}, тип={task_type}, сложность={difficulty}")
-            
-            # Убедимся, что подключение к Neo4j активно
-            try:
-                self.neo4j_client.connect()
-                logger.info("Соединение с Neo4j проверено")
-            except Exception as db_error:
-                logger.error(f"Ошибка при подключении к Neo4j: {str(db_error)}")
-                raise ValueError(f"Не удалось подключиться к базе данных: {str(db_error)}")
+            logger.info("Начинаем генерацию задачи: глава=%s, тип=%s, сложность=%s", chapter_title, task_type, difficulty)
             
-            # Пытаемся получить понятия - синхронный метод, выполняем в другом потоке
-            logger.info("Получаем понятия из базы данных Neo4j")
+            # Случайное понятие выбирается на стороне Neo4j - синхронный метод, выполняем в другом потоке
+            logger.info("Выбираем случайное понятие главы в базе данных Neo4j")
             try:
-                loop = asyncio.get_event_loop()
-                concepts = await loop.run_in_executor(
-                    None, 
-                    lambda: self.neo4j_client.get_concepts_by_chapter(chapter_title)
+                loop = asyncio.get_running_loop()
+                concept = await loop.run_in_executor(
+                    self._db_pool, self.neo4j_client.pick_random_concept, chapter_title
                 )
-                logger.info(f"Понятия успешно получены: {len(concepts) if concepts else 0} понятий")
             except Exception as concept_error:
-                logger.error(f"Ошибка при получении понятий: {str(concept_error)}")
+                logger.error("Ошибка при получении понятий: %s", concept_error)
                 raise ValueError(f"Не удалось получить понятия для главы {chapter_title}: {str(concept_error)}")
             
-            if not concepts:
-                logger.warning(f"Понятия для главы {chapter_title} не найдены. Используем заглушку.")
+            if not concept:
+                logger.warning("Понятия для главы %s не найдены. Используем заглушку.", chapter_title)
                 task = self._generate_fallback_task(chapter_title, task_type, difficulty)
                 logger.info("Заглушка задачи создана успешно")
             else:
-                logger.info(f"Получено {len(concepts)} понятий для главы {chapter_title}")
+                logger.info("Выбрано случайное понятие: %s", concept.get('name', 'Безымянное понятие'))
                 
-                # Выбираем случайное понятие из списка
-                concept = random.choice(concepts)
-                logger.info(f"Выбрано случайное понятие: {concept.get('name', 'Безымянное понятие')}")
-                
-                # Получаем связанные понятия - синхронный метод, выполняем в другом потоке
-                logger.info(f"Получаем понятия, связанные с {concept.get('name', 'Безымянное понятие')}")
-                try:
-                    related_concepts = await loop.run_in_executor(
-                        None,
-                        lambda: self.neo4j_client.get_related_concepts(concept.get('name', ''), chapter_title)
-                    )
-                    logger.info(f"Получено {len(related_concepts)} связанных понятий")
-                except Exception as related_error:
-                    logger.error(f"Ошибка при получении связанных понятий: {str(related_error)}")
-                    # В случае ошибки просто продолжаем с пустым списком связанных понятий
-                    related_concepts = []
-                    logger.info("Продолжаем без связанных понятий")
+                # Связанные понятия получены тем же запросом, что и понятие
+                related_concepts = concept.get("related") or []
+                logger.info("Получено %d связанных понятий", len(related_concepts))
+                has_api_key = bool(self.openrouter_client.api_key)
                 
                 # Пробуем сгенерировать задачу через OpenRouter API (Grok)
                 try:
                     logger.info("Пытаемся вызвать OpenRouter API для генерации задачи через Grok")
                     
                     # Проверяем API ключ OpenRouter
-                    if not self.openrouter_client.api_key:
+                    if not has_api_key:
                         logger.error("API ключ OpenRouter не задан")
                         raise ValueError("Отсутствует API ключ для доступа к OpenRouter")
                     
-                    # Максимальное время ожидания - 45 секунд
-                    timeout_seconds = 45
+                    # Ответ модели получаем потоком: тайм-аут ограничивает паузу между
+                    # фрагментами, а не общее время генерации
+                    timeout_seconds = STREAM_IDLE_TIMEOUT
                     
-                    # Создаем и запускаем задачу с таймаутом
                     try:
                         # Преобразуем объекты в словари для API - используем напрямую, т.к. это уже словари
                         concept_dict = concept
-                        related_concepts_dicts = [rc.get("concept", {}) for rc in related_concepts]
-                        
-                        task = await asyncio.wait_for(
+                        task = await self._call_openrouter(
                             self.openrouter_client.generate_task(
                                 concept_dict,
-                                related_concepts_dicts,
+                                related_concepts,
                                 task_type,
-                                difficulty
-                            ),
-                            timeout=timeout_seconds
+                                difficulty,
+                                stream=True,
+                                raise_errors=True
+                            )
                         )
                         logger.info("Задача успешно сгенерирована через OpenRouter API")
+                    except CircuitOpenError:
+                        logger.warning("OpenRouter API временно отключен после серии ошибок, используем заглушку")
+                        task = self._generate_fallback_task(chapter_title, task_type, difficulty)
                     except asyncio.TimeoutError:
-                        logger.warning(f"Тайм-аут при обращении к OpenRouter API после {timeout_seconds} секунд")
+                        logger.warning("Тайм-аут потокового ответа OpenRouter API: нет данных %s секунд", timeout_seconds)
                         # Используем заглушку
                         task = self._generate_fallback_task(chapter_title, task_type, difficulty)
                         logger.info("Заглушка задачи создана из-за тайм-аута")
                 except Exception as api_error:
-                    logger.exception(f"Ошибка при вызове OpenRouter API: {str(api_error)}")
+                    logger.exception("Ошибка при вызове OpenRouter API: %s", api_error)
                     # Используем заглушку в случае ошибки
                     task = self._generate_fallback_task(chapter_title, task_type, difficulty)
                     logger.info("Заглушка задачи создана из-за ошибки API")
             
             # Проверяем структуру задачи перед возвратом
-            if not isinstance(task, dict):
-                logger.error(f"Некорректный формат задачи: {type(task)}")
+            try:
+                task = GeneratedTask.model_validate(task).model_dump(exclude_unset=True)
+                if task["task_type"] == "template":
+                    _index_options(task)
+            except ValidationError as validation_error:
+                logger.error("Некорректный формат задачи: %s", validation_error)
                 task = self._generate_fallback_task(chapter_title, task_type, difficulty)
                 logger.info("Заглушка задачи создана из-за некорректного формата")
             
@@ -157,8 +378,8 @@ class TutorCrew:
             
             logger.info("Задача успешно создана и готова к отправке")
             return result
-        except Exception as e:
-            logger.error(f"Ошибка в полном процессе репетитора: {str(e)}\n{traceback.format_exc()}")
+        except _EXPECTED_ERRORS as e:
+            logger.exception("Ошибка в полном процессе репетитора: %s", e)
             # Возвращаем заглушку с информацией об ошибке
             return {
                 "task": {
@@ -178,52 +399,10 @@ class TutorCrew:
     
     def full_tutor_process(self, student_id: str, chapter_title: str, 
                          task_type: str, difficulty: str) -> Dict[str, Any]:
-        """
-        Полный процесс работы репетитора: генерация задачи с метаданными
-        (Синхронная обертка для async_full_tutor_process)
-        
-        Args:
-            student_id: ID студента
-            chapter_title: Название главы
-            task_type: Тип задачи
-            difficulty: Уровень сложности
-            
-        Returns:
-            Словарь с задачей и метаданными
-        """
-        try:
-            # Создаем новый цикл событий для этого потока
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            
-            try:
-                # Вызываем асинхронный метод
-                return loop.run_until_complete(
-                    self.async_full_tutor_process(student_id, chapter_title, task_type, difficulty)
-                )
-            finally:
-                try:
-                    loop.close()
-                except Exception as loop_error:
-                    logger.warning(f"Ошибка при закрытии цикла: {str(loop_error)}")
-        except Exception as e:
-            logger.error(f"Ошибка в синхронной обертке full_tutor_process: {str(e)}\n{traceback.format_exc()}")
-            # Возвращаем заглушку с информацией об ошибке
-            return {
-                "task": {
-                    "error": f"Ошибка при генерации задачи: {str(e)}",
-                    "concept_name": "Ошибка",
-                    "task_type": task_type,
-                    "difficulty": difficulty
-                },
-                "metadata": {
-                    "student_id": student_id,
-                    "chapter_title": chapter_title,
-                    "task_type": task_type,
-                    "difficulty": difficulty,
-                    "course_name": COURSE_NAME
-                }
-            }
+        """Синхронная обертка для async_full_tutor_process (только для синхронного кода)."""
+        return _run_sync(
+            self.async_full_tutor_process(student_id, chapter_title, task_type, difficulty)
+        )
     
     async def async_generate_task(self, chapter_title: str, task_type: str, difficulty: str, 
                     excluded_concepts: Optional[List[str]] = None) -> Dict[str, Any]:
@@ -240,40 +419,48 @@ class TutorCrew:
             Сгенерированная задача
         """
         try:
-            loop = asyncio.get_event_loop()
+            loop = asyncio.get_running_loop()
             
-            # Получаем все понятия из главы - синхронный метод, запускаем в отдельном потоке
-            concepts = await loop.run_in_executor(
-                None,
-                lambda: self.neo4j_client.get_concepts_by_chapter(chapter_title)
+            # Выбираем случайное понятие главы (кроме исключенных) на стороне Neo4j -
+            # синхронный метод, запускаем в отдельном потоке
+            concept = await loop.run_in_executor(
+                self._db_pool, self.neo4j_client.pick_random_concept, chapter_title, excluded_concepts
             )
             
-            if not concepts:
+            if not concept:
                 # Если понятий не найдено, возвращаем заглушку
-                logger.warning(f"Понятия для главы {chapter_title} не найдены. Используем заглушку.")
+                logger.warning("Понятия для главы %s не найдены. Используем заглушку.", chapter_title)
                 return self._generate_fallback_task(chapter_title, task_type, difficulty)
             
-            # Выбираем случайное понятие из списка
-            concept = random.choice(concepts)
-            
-            # Получаем связанные понятия - синхронный метод, запускаем в отдельном потоке
-            related_concepts = await loop.run_in_executor(
-                None,
-                lambda: self.neo4j_client.get_related_concepts(concept.get('name', ''), chapter_title)
-            )
+            # Связанные понятия получены тем же запросом, что и понятие
+            related_concepts = concept.get("related") or []
             
-            # Генерируем задачу
-            task = await self.openrouter_client.generate_task(
-                concept,
-                [rc.get("concept", {}) for rc in related_concepts],
-                task_type,
-                difficulty
-            )
+            # Генерируем задачу: ошибки API учитываются выключателем, затем заменяются заглушкой
+            try:
+                task = await self._call_openrouter(
+                    self.openrouter_client.generate_task(
+                        concept,
+                        related_concepts,
+                        task_type,
+                        difficulty,
+                        raise_errors=True
+                    )
+                )
+            except CircuitOpenError:
+                raise
+            except Exception as api_error:
+                logger.exception("Ошибка при вызове OpenRouter API: %s", api_error)
+                return self._generate_fallback_task(chapter_title, task_type, difficulty)
+            if isinstance(task, dict) and task.get("task_type", task_type) == "template":
+                _index_options(task)
             
             return task
         
-        except Exception as e:
-            logger.error(f"Ошибка при генерации задачи: {str(e)}\n{traceback.format_exc()}")
+        except CircuitOpenError:
+            logger.warning("OpenRouter API временно отключен после серии ошибок, используем заглушку")
+            return self._generate_fallback_task(chapter_title, task_type, difficulty)
+        except _EXPECTED_ERRORS as e:
+            logger.exception("Ошибка при генерации задачи: %s", e)
             return self._generate_fallback_task(chapter_title, task_type, difficulty)
     
     def generate_task(
@@ -283,22 +470,10 @@ class TutorCrew:
         difficulty: str = "basic",
         excluded_concepts: Optional[List[str]] = None
     ) -> Dict[str, Any]:
-        """Синхронная обертка для async_generate_task."""
-        try:
-            # Создаем новый цикл событий для этого потока
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            
-            try:
-                # Вызываем асинхронный метод
-                return loop.run_until_complete(
-                    self.async_generate_task(chapter_title, task_type, difficulty, excluded_concepts)
-                )
-            finally:
-                loop.close()
-        except Exception as e:
-            logger.error(f"Ошибка в синхронной обертке generate_task: {str(e)}\n{traceback.format_exc()}")
-            return self._generate_fallback_task(chapter_title, task_type, difficulty)
+        """Синхронная обертка для async_generate_task (только для синхронного кода)."""
+        return _run_sync(
+            self.async_generate_task(chapter_title, task_type, difficulty, excluded_concepts)
+        )
     
     def _generate_fallback_task(self, chapter_title: str, task_type: str, difficulty: str) -> Dict[str, Any]:
         """
@@ -312,43 +487,7 @@ class TutorCrew:
         Returns:
             Заглушка задачи
         """
-        concept_name = "Ключевое понятие главы"
-        
-        if task_type == "template":
-            return {
-                "question": f"Какое из следующих определений лучше всего описывает ключевое понятие из главы '{chapter_title}'?",
-                "options": [
-                    {"label": "A", "text": f"Ключевое понятие из главы '{chapter_title}' - это система взаимосвязанных элементов, работающих для достижения общей цели", "is_correct": True, 
-                    "explanation": "Это обобщенное определение системного подхода, который является фундаментальным для понимания материала главы."},
-                    {"label": "B", "text": "Это изолированный элемент, который не взаимодействует с другими компонентами", "is_correct": False, 
-                    "explanation": "Это противоречит системному подходу, который подчеркивает взаимосвязь элементов."},
-                    {"label": "C", "text": "Это только теоретическая концепция, не имеющая практического применения", "is_correct": False, 
-                    "explanation": "Понятия системного менеджмента имеют важное практическое применение."},
-                    {"label": "D", "text": "Это простая совокупность элементов без определенной структуры", "is_correct": False, 
-                    "explanation": "Системный подход подразумевает наличие структуры и организации элементов."}
-                ],
-                "concept_name": concept_name,
-                "task_type": task_type,
-                "difficulty": difficulty
-            }
-        else:  # creative
-            return {
-                "question": f"Объясните своими словами, как ключевые понятия из главы '{chapter_title}' формируют систему знаний и как они могут быть применены в реальной жизни или профессиональной деятельности.",
-                "criteria": [
-                    "Точность определения понятий",
-                    "Понимание взаимосвязей между понятиями",
-                    "Глубина анализа практического применения"
-                ],
-                "example_answer": f"В главе '{chapter_title}' представлены важные системные понятия, которые взаимосвязаны следующим образом... Эти понятия могут быть применены в таких ситуациях, как...",
-                "hints": [
-                    "Сначала определите ключевые понятия из главы",
-                    "Подумайте о том, как эти понятия связаны между собой",
-                    "Приведите конкретные примеры, где эти понятия могут быть применены"
-                ],
-                "concept_name": concept_name,
-                "task_type": task_type,
-                "difficulty": difficulty
-            }
+        return _build_fallback_task(chapter_title, task_type, difficulty)
     
     async def async_check_answer(
         self,
@@ -370,125 +509,124 @@ class TutorCrew:
             Результат проверки
         """
         try:
-            logger.info(f"Начинаем проверку ответа для задачи по теме: {task.get('concept_name', '')}")
+            logger.info("Начинаем проверку ответа для задачи по теме: %s", task.get('concept_name', ''))
             
             # Для шаблонных задач реализуем простую проверку
             if task["task_type"] == "template":
                 logger.info("Проверка ответа для шаблонной задачи")
                 # Проверяем, совпадает ли ответ с правильным вариантом
-                student_answer = student_answer.strip().upper()
-                for option in task.get("options", []):
-                    if option.get("is_correct", False) and option.get("label", "") == student_answer:
-                        is_correct = True
-                        explanation = option.get("explanation", "Это правильный ответ.")
-                        logger.info(f"Ответ правильный: {student_answer}")
-                        
-                        # Увеличиваем счетчик правильных ответов
-                        self.correct_answers_count[student_id] = self.correct_answers_count.get(student_id, 0) + 1
-                        
-                        # Проверяем, достиг ли студент 5 правильных ответов подряд
-                        next_steps = []
-                        if self.correct_answers_count.get(student_id, 0) >= 5:
-                            # Предлагаем изменить параметры обучения
-                            next_steps = [
-                                {"action": "change_chapter", "text": "Перейти к следующей главе"},
-                                {"action": "increase_difficulty", "text": "Повысить сложность задач"},
-                                {"action": "change_task_type", "text": "Попробовать творческую задачу"}
-                            ]
-                            # Сбрасываем счетчик
-                            self.correct_answers_count[student_id] = 0
-                            
-                        return {
-                            "is_correct": is_correct,
-                            "explanation": explanation,
-                            "recommendations": ["Отлично! Продолжайте изучение."],
-                            "next_steps": next_steps
-                        }
-                        break
-                else:
-                    is_correct = False
-                    explanation = "Выбран неверный вариант ответа."
-                    logger.info(f"Ответ неверный: {student_answer}")
-                    
-                    # Сбрасываем счетчик правильных ответов
-                    self.correct_answers_count[student_id] = 0
+                options_by_label = task.get("_options_by_label") or _index_options(task)
+                student_answer = student_answer.strip()
+                option = options_by_label.get(student_answer)
+                if option is None:
+                    # Метки в индексе хранятся в верхнем регистре; приводим ответ
+                    # только если он не совпал с меткой как есть
+                    student_answer = student_answer.upper()
+                    option = options_by_label.get(student_answer)
+                
+                if option is not None and option.get("is_correct", False):
+                    explanation = option.get("explanation", "Это правильный ответ.")
+                    logger.info("Ответ правильный: %s", student_answer)
                     
-                    # Предлагаем опции для неправильного ответа
-                    next_steps = [
-                        {"action": "discuss", "text": "Обсудить задачу"},
-                        {"action": "try_again", "text": "Попробовать ещё раз"},
-                        {"action": "skip", "text": "Пропустить задачу"}
-                    ]
+                    # Увеличиваем счетчик правильных ответов
+                    count = self._increment_streak(student_id)
                     
+                    # Проверяем, достиг ли студент 5 правильных ответов подряд
+                    next_steps = []
+                    if count >= 5:
+                        # Предлагаем изменить параметры обучения
+                        next_steps = [
+                            {"action": "change_chapter", "text": "Перейти к следующей главе"},
+                            {"action": "increase_difficulty", "text": "Повысить сложность задач"},
+                            {"action": "change_task_type", "text": "Попробовать творческую задачу"}
+                        ]
+                        # Сбрасываем счетчик
+                        self.reset_streak(student_id)
+                        
                     return {
-                        "is_correct": is_correct,
+                        "is_correct": True,
                         "explanation": explanation,
-                        "recommendations": ["Изучите материалы по данной теме."],
+                        "recommendations": ["Отлично! Продолжайте изучение."],
                         "next_steps": next_steps
                     }
+                
+                # Ответ неверный: выбран неправильный вариант или метки нет среди вариантов
+                if option is None:
+                    logger.info("Вариант ответа %s отсутствует в задаче", student_answer)
+                explanation = "Выбран неверный вариант ответа."
+                logger.info("Ответ неверный: %s", student_answer)
+                
+                # Сбрасываем счетчик правильных ответов
+                self.reset_streak(student_id)
+                
+                # Предлагаем опции для неправильного ответа
+                next_steps = [
+                    {"action": "discuss", "text": "Обсудить задачу"},
+                    {"action": "try_again", "text": "Попробовать ещё раз"},
+                    {"action": "skip", "text": "Пропустить задачу"}
+                ]
+                
+                return {
+                    "is_correct": False,
+                    "explanation": explanation,
+                    "recommendations": ["Изучите материалы по данной теме."],
+                    "next_steps": next_steps
+                }
             
             # Для творческих задач или других типов задач используем API
             logger.info("Проверка творческого ответа через OpenRouter API")
             
             # Получаем информацию о понятии
             concept_name = task.get("concept_name", "")
-            logger.info(f"Получаем информацию о понятии: {concept_name}")
+            logger.info("Получаем информацию о понятии: %s", concept_name)
             
             try:
                 # Используем синхронный метод get_concept_by_name в отдельном потоке
-                loop = asyncio.get_event_loop()
+                loop = asyncio.get_running_loop()
                 if hasattr(self.neo4j_client, 'get_concept_by_name'):
                     concept = await loop.run_in_executor(
-                        None, 
-                        lambda: self.neo4j_client.get_concept_by_name(concept_name, chapter_title)
+                        self._db_pool, self._get_concept_by_name_cached, concept_name, chapter_title
                     )
                 else:
                     # Fallback, если метод отсутствует
-                    logger.warning(f"Метод get_concept_by_name не найден, используем заглушку")
+                    logger.warning("Метод get_concept_by_name не найден, используем заглушку")
                     concept = None
                 
                 if not concept:
-                    logger.warning(f"Понятие {concept_name} не найдено")
+                    logger.warning("Понятие %s не найдено", concept_name)
                     concept_dict = {"name": concept_name, "definition": "Определение отсутствует"}
                 else:
                     concept_dict = concept if isinstance(concept, dict) else concept.__dict__
-                    logger.info(f"Понятие {concept_name} получено успешно")
+                    logger.info("Понятие %s получено успешно", concept_name)
                 
                 # Максимальное время ожидания - 45 секунд
                 timeout_seconds = 45
                 
                 try:
                     # Проверяем ответ через OpenRouter API (Grok) с таймаутом
-                    check_result = await asyncio.wait_for(
+                    check_result = await self._call_openrouter(
                         self.openrouter_client.check_answer(
                             task,
                             student_answer,
-                            concept_dict
+                            concept_dict,
+                            raise_errors=True
                         ),
                         timeout=timeout_seconds
                     )
                     logger.info("Ответ успешно проверен через OpenRouter API")
                     
-                    # Убедимся, что результат содержит правильные ключи
-                    if not check_result.get("feedback") and check_result.get("explanation"):
-                        check_result["feedback"] = check_result["explanation"]
-                    
-                    if "recommendations" not in check_result:
-                        check_result["recommendations"] = []
-                    
-                    # Добавляем оценку по 10-балльной шкале, если её нет
-                    if "score" not in check_result:
-                        # Если ответ правильный, даем оценку 7, иначе 4
-                        check_result["score"] = 7 if check_result.get("is_correct", False) else 4
+                    # Приводим результат к схеме: отзыв, рекомендации и оценка
+                    # заполняются значениями по умолчанию, если их нет
+                    check_result = CheckResult.model_validate(check_result).model_dump()
                     
                     # Добавляем next_steps в зависимости от правильности ответа
                     if check_result.get("is_correct", False):
                         # Увеличиваем счетчик правильных ответов для творческих заданий
-                        self.correct_answers_count[student_id] = self.correct_answers_count.get(student_id, 0) + 1
+                        count = self._increment_streak(student_id)
                         
                         # Проверяем, достиг ли студент 5 правильных ответов подряд
                         next_steps = []
-                        if self.correct_answers_count.get(student_id, 0) >= 5:
+                        if count >= 5:
                             # Предлагаем изменить параметры обучения
                             next_steps = [
                                 {"action": "change_chapter", "text": "Перейти к следующей главе"},
@@ -496,12 +634,12 @@ class TutorCrew:
                                 {"action": "change_task_type", "text": "Попробовать шаблонную задачу"}
                             ]
                             # Сбрасываем счетчик
-                            self.correct_answers_count[student_id] = 0
+                            self.reset_streak(student_id)
                         
                         check_result["next_steps"] = next_steps
                     else:
                         # Сбрасываем счетчик правильных ответов
-                        self.correct_answers_count[student_id] = 0
+                        self.reset_streak(student_id)
                         
                         # Предлагаем опции для неправильного ответа
                         check_result["next_steps"] = [
@@ -512,7 +650,7 @@ class TutorCrew:
                     
                     return check_result
                 except asyncio.TimeoutError:
-                    logger.warning(f"Тайм-аут при обращении к OpenRouter API после {timeout_seconds} секунд")
+                    logger.warning("Тайм-аут при обращении к OpenRouter API после %s секунд", timeout_seconds)
                     # Используем простой ответ из-за тайм-аута
                     return {
                         "is_correct": True,  # При тайм-ауте считаем ответ условно правильным
@@ -522,8 +660,18 @@ class TutorCrew:
                         "recommendations": ["Продолжайте работу с материалом."],
                         "next_steps": []
                     }
+            except CircuitOpenError:
+                logger.warning("OpenRouter API временно отключен после серии ошибок, ответ принимается без проверки")
+                return {
+                    "is_correct": True,  # Без проверки считаем ответ условно правильным
+                    "score": 5,
+                    "explanation": "Сервис проверки временно недоступен, ваш ответ принят.",
+                    "feedback": "Сервис проверки временно недоступен, ваш ответ принят.",
+                    "recommendations": ["Продолжайте изучение материала."],
+                    "next_steps": []
+                }
             except Exception as api_error:
-                logger.exception(f"Ошибка при проверке ответа через API: {str(api_error)}")
+                logger.exception("Ошибка при проверке ответа через API: %s", api_error)
                 # Простой ответ в случае ошибки
                 return {
                     "is_correct": True,  # При ошибке считаем ответ условно правильным
@@ -534,8 +682,8 @@ class TutorCrew:
                     "next_steps": []
                 }
                 
-        except Exception as e:
-            logger.error(f"Ошибка при проверке ответа: {str(e)}\n{traceback.format_exc()}")
+        except _EXPECTED_ERRORS as e:
+            logger.exception("Ошибка при проверке ответа: %s", e)
             return {
                 "is_correct": False,
                 "score": 0,
@@ -554,34 +702,10 @@ class TutorCrew:
         task: Dict[str, Any],
         student_answer: str
     ) -> Dict[str, Any]:
-        """Синхронная обертка для async_check_answer."""
-        try:
-            logger.info(f"Начинаем проверку ответа для задачи по теме: {task.get('concept_name', '')}")
-            
-            # Создаем новый цикл событий для этого потока
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            
-            try:
-                # Вызываем асинхронный метод
-                return loop.run_until_complete(
-                    self.async_check_answer(student_id, chapter_title, task, student_answer)
-                )
-            finally:
-                logger.info("Закрываем цикл событий")
-                loop.close()
-                
-        except Exception as e:
-            logger.error(f"Ошибка при проверке ответа: {str(e)}\n{traceback.format_exc()}")
-            return {
-                "is_correct": False,
-                "explanation": f"Ошибка при проверке ответа: {str(e)}",
-                "feedback": f"Извините, не удалось проверить ваш ответ. Попробуйте еще раз.",
-                "recommendations": ["Попробуйте еще раз с другой задачей."],
-                "next_steps": [
-                    {"action": "skip", "text": "Пропустить задачу"}
-                ]
-            }
+        """Синхронная обертка для async_check_answer (только для синхронного кода)."""
+        return _run_sync(
+            self.async_check_answer(student_id, chapter_title, task, student_answer)
+        )
     
     def adapt_task_difficulty(
         self,
@@ -590,35 +714,28 @@ class TutorCrew:
         student_performance: Optional[List[Dict[str, Any]]] = None,
         current_difficulty: Optional[str] = None
     ) -> Dict[str, Any]:
-        """Синхронная обертка для adapt_task_difficulty."""
+        """Адаптация сложности задач (синхронная, без асинхронных вызовов)."""
         try:
-            # Создаем новый цикл событий для этого потока
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
+            # Упрощенная версия адаптации без асинхронных вызовов
+            # Всегда рекомендуем стандартный уровень для простоты, если не указан текущий
+            if not current_difficulty:
+                current_difficulty = "standard"
             
-            try:
-                # Упрощенная версия адаптации без асинхронных вызовов
-                # Всегда рекомендуем стандартный уровень для простоты, если не указан текущий
-                if not current_difficulty:
-                    current_difficulty = "standard"
-                
-                # Если текущий уровень standard и у студента хорошие показатели, рекомендуем advanced
-                recommended_difficulty = "advanced" if current_difficulty == "standard" else "standard"
-                
-                return {
-                    "student_id": student_id,
-                    "chapter_title": chapter_title,
-                    "recommended_difficulty": recommended_difficulty,
-                    "recommended_task_type": "template" if current_difficulty == "creative" else "creative",
-                    "reasoning": f"Рекомендован {'продвинутый' if recommended_difficulty == 'advanced' else 'стандартный'} уровень для вашего текущего прогресса.",
-                    "problem_concepts": [],
-                    "strong_concepts": []
-                }
-            finally:
-                loop.close()
+            # Если текущий уровень standard и у студента хорошие показатели, рекомендуем advanced
+            recommended_difficulty = "advanced" if current_difficulty == "standard" else "standard"
+            
+            return {
+                "student_id": student_id,
+                "chapter_title": chapter_title,
+                "recommended_difficulty": recommended_difficulty,
+                "recommended_task_type": "template" if current_difficulty == "creative" else "creative",
+                "reasoning": f"Рекомендован {'продвинутый' if recommended_difficulty == 'advanced' else 'стандартный'} уровень для вашего текущего прогресса.",
+                "problem_concepts": [],
+                "strong_concepts": []
+            }
                 
         except Exception as e:
-            logger.error(f"Ошибка при адаптации сложности: {str(e)}\n{traceback.format_exc()}")
+            logger.exception("Ошибка при адаптации сложности: %s", e)
             return {
                 "student_id": student_id,
                 "chapter_title": chapter_title,
@@ -628,38 +745,3 @@ class TutorCrew:
                 "problem_concepts": [],
                 "strong_concepts": []
             }
-
-    def _extract_json_from_text(self, text: str) -> Dict[str, Any]:
-        """
-        Извлекает JSON из текстового ответа.
-        
-        Args:
-            text: Текстовый ответ.
-            
-        Returns:
-            Словарь, извлеченный из JSON.
-        """
-        try:
-            # Попытка найти JSON в тексте
-            json_start = text.find("{")
-            json_end = text.rfind("}")
-            
-            if json_start != -1 and json_end != -1:
-                json_str = text[json_start:json_end + 1]
-                return json.loads(json_str)
-            
-            # Если не удалось найти JSON в формате {...}, ищем в формате [...]
-            json_start = text.find("[")
-            json_end = text.rfind("]")
-            
-            if json_start != -1 and json_end != -1:
-                json_str = text[json_start:json_end + 1]
-                return {"data": json.loads(json_str)}
-            
-            # Если не удалось найти JSON, пытаемся преобразовать весь текст
-            return json.loads(text)
-            
-        except json.JSONDecodeError as e:
-            logger.error(f"Ошибка при извлечении JSON из ответа: {str(e)}\n{text}")
-            # Возвращаем пустой словарь с текстовым ответом
-            return {"raw_text": text}
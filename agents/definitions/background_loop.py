@@ -0,0 +1,32 @@
+"""
+Фоновый цикл событий для синхронных инструментов агентов.
+
+Инструменты CrewAI вызываются синхронно (метод _run), а клиент OpenRouter
+асинхронный. Вместо создания нового цикла событий на каждый вызов корутины
+выполняются в одном долгоживущем цикле, работающем в отдельном потоке:
+HTTP-соединения клиентов переиспользуются между вызовами, а цикл
+вызывающего кода (если он есть) не блокируется и не подменяется.
+"""
+import asyncio
+import threading
+from typing import Any, Coroutine, Optional
+
+# Максимальное время ожидания результата корутины (в секундах)
+DEFAULT_TIMEOUT = 180
+
+_LOOP = asyncio.new_event_loop()
+threading.Thread(target=_LOOP.run_forever, name="agent-tools-loop", daemon=True).start()
+
+
+def run_coroutine(coro: Coroutine[Any, Any, Any], timeout: Optional[float] = DEFAULT_TIMEOUT) -> Any:
+    """
+    Выполнение корутины в фоновом цикле событий с ожиданием результата
+
+    Args:
+        coro: Корутина для выполнения
+        timeout: Максимальное время ожидания в секундах
+
+    Returns:
+        Результат корутины
+    """
+    return asyncio.run_coroutine_threadsafe(coro, _LOOP).result(timeout=timeout)
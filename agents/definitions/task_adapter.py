@@ -1,7 +1,7 @@
 """
 Агент-адаптер задач
 """
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Tuple
 import logging
 import json
 
@@ -9,17 +9,190 @@ from crewai import Agent, Task
 from crewai.tools import BaseTool
 from pydantic import BaseModel, Field
 
-from ai_tutor.agents.base_agent import BaseAgent
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = NUMPY_AVAILABLE
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+from ai_tutor.agents.base_agent import BaseAgent, TOOL_INPUT_CONFIG
 from ai_tutor.agents.prompts.task_adapter_prompt import TASK_ADAPTER_PROMPT
 from ai_tutor.database.neo4j_client import Neo4jClient
+from ai_tutor.database.query_cache import QueryCache, MISSING
 
 logger = logging.getLogger(__name__)
 
+# Кэш прогресса студентов по ключу (student_id, chapter_title). Сбрасывается
+# инструментом UpdateStudentProgressTool после записи нового ответа
+student_progress_cache = QueryCache("student_progress", max_size=1024, ttl=60)
+
+# Неизменяемая часть описания задачи адаптации (общий префикс промпта для всех
+# студентов); ID студента и глава добавляются после нее
+_ADAPTER_PROMPT_PREFIX = """Проанализируй прогресс студента по главе курса (ID студента и глава приведены ниже) и предложи 
+оптимальный уровень сложности и тип задач для дальнейшего обучения.
+
+Для этого:
+1. Получи информацию о прогрессе студента 
+2. Определи рекомендуемый уровень сложности
+3. Проанализируй, с какими понятиями у студента возникли трудности
+4. Определи, какой тип задач (с множественным выбором или творческие) лучше подходит студенту
+5. Объясни свое решение
+
+Результат представь в формате JSON:
+```json
+{
+  "student_id": "ID студента",
+  "chapter_title": "Название главы",
+  "recommended_difficulty": "basic/advanced",
+  "recommended_task_type": "multiple_choice/creative",
+  "reasoning": "Объяснение, почему данная рекомендация предложена",
+  "problem_concepts": ["Понятие 1", "Понятие 2"],
+  "strong_concepts": ["Понятие 3", "Понятие 4"]
+}
+```"""
+
+# Минимальное количество записей прогресса, начиная с которого используется NumPy
+# (на коротких списках создание массивов дороже обычного цикла)
+NUMPY_MIN_ITEMS = 256
+
+
+def get_student_progress_cached(
+    neo4j_client: Neo4jClient, student_id: str, chapter_title: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    """
+    Получение прогресса студента с использованием кэша
+    
+    Args:
+        neo4j_client: Клиент Neo4j
+        student_id: ID студента
+        chapter_title: Название главы (опционально)
+        
+    Returns:
+        Прогресс студента
+    """
+    key = (student_id, chapter_title)
+    progress = student_progress_cache.get(key)
+    if progress is MISSING:
+        progress = neo4j_client.get_student_progress(
+            student_id=student_id,
+            chapter_title=chapter_title
+        )
+        student_progress_cache.set(key, progress)
+    return progress
+
+
+def invalidate_student_progress(student_id: str, chapter_title: Optional[str] = None) -> None:
+    """
+    Сброс кэшированного прогресса студента после его изменения
+    
+    Args:
+        student_id: ID студента
+        chapter_title: Название главы (опционально)
+    """
+    student_progress_cache.pop((student_id, chapter_title))
+    # Прогресс по всем главам тоже устарел
+    student_progress_cache.pop((student_id, None))
+
+
+if NUMBA_AVAILABLE:
+    @njit(cache=True)
+    def _bucket_by_ratio(correct, attempts):
+        """
+        Маски проблемных (доля < 0.5) и хорошо усвоенных (доля > 0.8) понятий
+        
+        Компилируется Numba: при пакетной адаптации по всему потоку студентов
+        цикл выполняется без накладных расходов интерпретатора и без
+        промежуточных массивов.
+        
+        Args:
+            correct: Количество правильных ответов по понятиям (int64)
+            attempts: Количество попыток по понятиям (int64, не меньше 1)
+            
+        Returns:
+            Две булевы маски: проблемные и хорошо усвоенные понятия
+        """
+        count = correct.shape[0]
+        problem = np.zeros(count, np.bool_)
+        strong = np.zeros(count, np.bool_)
+        for i in range(count):
+            problem[i] = 2 * correct[i] < attempts[i]
+            strong[i] = 5 * correct[i] > 4 * attempts[i]
+        return problem, strong
+    
+    # Компиляция при импорте (с кэшем на диске), а не при первом запросе
+    _bucket_by_ratio(np.zeros(1, np.int64), np.ones(1, np.int64))
+
+
+def _split_concepts_by_ratio(progress: List[Dict[str, Any]]) -> Tuple[List[Any], List[Any]]:
+    """
+    Разделение понятий на проблемные и хорошо усвоенные по доле правильных ответов
+    
+    Args:
+        progress: Записи прогресса студента (concept_name, correct, attempts)
+        
+    Returns:
+        Проблемные понятия (доля < 0.5) и хорошо усвоенные понятия (доля > 0.8)
+    """
+    if NUMPY_AVAILABLE and len(progress) >= NUMPY_MIN_ITEMS:
+        count = len(progress)
+        names = np.array([item.get('concept_name') for item in progress], dtype=object)
+        # Счетчики целые, поэтому пороги доли проверяются без деления:
+        # correct / attempts < 0.5  <=>  2 * correct < attempts,
+        # correct / attempts > 0.8  <=>  5 * correct > 4 * attempts
+        correct = np.fromiter((item.get('correct', 0) for item in progress), dtype=np.int64, count=count)
+        attempts = np.fromiter((item.get('attempts', 1) for item in progress), dtype=np.int64, count=count)
+        np.maximum(attempts, 1, out=attempts)
+        if NUMBA_AVAILABLE:
+            problem_mask, strong_mask = _bucket_by_ratio(correct, attempts)
+        else:
+            problem_mask = 2 * correct < attempts
+            strong_mask = 5 * correct > 4 * attempts
+        return names[problem_mask].tolist(), names[strong_mask].tolist()
+    
+    problem_concepts = []
+    strong_concepts = []
+    for item in progress:
+        ratio = item.get('correct', 0) / max(item.get('attempts', 1), 1)
+        if ratio < 0.5:
+            problem_concepts.append(item.get('concept_name'))
+        elif ratio > 0.8:
+            strong_concepts.append(item.get('concept_name'))
+    return problem_concepts, strong_concepts
+
+
+def _suggest_difficulty(progress: List[Dict[str, Any]]) -> str:
+    """
+    Рекомендуемый уровень сложности по прогрессу студента в главе
+    
+    Повторяет правило Neo4jClient.suggest_difficulty_level: продвинутый уровень
+    предлагается, если доля правильных ответов по главе больше 70%.
+    
+    Args:
+        progress: Записи прогресса студента по главе (correct, attempts)
+        
+    Returns:
+        Рекомендуемый уровень сложности (basic/advanced)
+    """
+    total_correct = sum(item.get('correct') or 0 for item in progress)
+    total_attempts = sum(item.get('attempts') or 0 for item in progress)
+    
+    if not total_attempts:
+        return "basic"  # По умолчанию базовый уровень
+    return "advanced" if total_correct / total_attempts > 0.7 else "basic"
+
 
 class GetStudentProgressInput(BaseModel):
     """
     Входные данные для получения прогресса студента
     """
+    model_config = TOOL_INPUT_CONFIG
+    
     student_id: str = Field(description="ID студента")
     chapter_title: Optional[str] = Field(
         default=None, 
@@ -57,10 +230,7 @@ class GetStudentProgressTool(BaseTool):
             Прогресс студента
         """
         try:
-            progress = self.neo4j_client.get_student_progress(
-                student_id=student_id,
-                chapter_title=chapter_title
-            )
+            progress = get_student_progress_cached(self.neo4j_client, student_id, chapter_title)
             
             # Получаем статистику по главам
             chapter_stats = self.neo4j_client.get_student_chapter_stats(student_id)
@@ -70,7 +240,7 @@ class GetStudentProgressTool(BaseTool):
                 "chapter_stats": chapter_stats
             }
         except Exception as e:
-            logger.error(f"Ошибка при получении прогресса студента: {str(e)}")
+            logger.error("Ошибка при получении прогресса студента: %s", e, exc_info=True)
             return {
                 "error": f"Ошибка при получении прогресса студента: {str(e)}",
                 "progress": [],
@@ -82,6 +252,8 @@ class SuggestDifficultyInput(BaseModel):
     """
     Входные данные для рекомендации уровня сложности
     """
+    model_config = TOOL_INPUT_CONFIG
+    
     student_id: str = Field(description="ID студента")
     chapter_title: str = Field(description="Название главы курса")
 
@@ -116,27 +288,15 @@ class SuggestDifficultyTool(BaseTool):
             Рекомендуемый уровень сложности
         """
         try:
-            # Получаем рекомендованный уровень сложности
-            difficulty = self.neo4j_client.suggest_difficulty_level(
-                student_id=student_id,
-                chapter_title=chapter_title
-            )
+            # Получаем статистику по главе (общую с инструментом get_student_progress)
+            progress = get_student_progress_cached(self.neo4j_client, student_id, chapter_title)
             
-            # Получаем статистику по главе
-            progress = self.neo4j_client.get_student_progress(
-                student_id=student_id,
-                chapter_title=chapter_title
-            )
+            # Рекомендованный уровень сложности считаем по тем же данным,
+            # без отдельного запроса suggest_difficulty_level
+            difficulty = _suggest_difficulty(progress)
             
             # Анализируем, с какими понятиями были проблемы
-            problem_concepts = []
-            strong_concepts = []
-            
-            for item in progress:
-                if item.get('correct', 0) / max(item.get('attempts', 1), 1) < 0.5:
-                    problem_concepts.append(item.get('concept_name'))
-                elif item.get('correct', 0) / max(item.get('attempts', 1), 1) > 0.8:
-                    strong_concepts.append(item.get('concept_name'))
+            problem_concepts, strong_concepts = _split_concepts_by_ratio(progress)
             
             return {
                 "recommended_difficulty": difficulty,
@@ -144,7 +304,7 @@ class SuggestDifficultyTool(BaseTool):
                 "strong_concepts": strong_concepts
             }
         except Exception as e:
-            logger.error(f"Ошибка при определении рекомендуемого уровня сложности: {str(e)}")
+            logger.error("Ошибка при определении рекомендуемого уровня сложности: %s", e, exc_info=True)
             return {
                 "error": f"Ошибка при определении рекомендуемого уровня сложности: {str(e)}",
                 "recommended_difficulty": "basic",  # По умолчанию базовый уровень
@@ -174,10 +334,11 @@ class TaskAdapterAgent(BaseAgent):
         сложности задач, чтобы обеспечить эффективное обучение без перегрузки или недогрузки.
         """
         
-        # Создаем инструменты агента
+        # Создаем инструменты агента с одним общим клиентом Neo4j
+        neo4j_client = self.get_neo4j_client()
         tools = [
-            GetStudentProgressTool(self.get_neo4j_client()),
-            SuggestDifficultyTool(self.get_neo4j_client())
+            GetStudentProgressTool(neo4j_client),
+            SuggestDifficultyTool(neo4j_client)
         ]
         
         super().__init__(
@@ -187,7 +348,7 @@ class TaskAdapterAgent(BaseAgent):
             prompt=TASK_ADAPTER_PROMPT,
             backstory=backstory,
             verbose=verbose,
-            allow_delegation=True,
+            allow_delegation=False,  # Агент работает только со своими инструментами
             tools=tools
         )
     
@@ -202,30 +363,10 @@ class TaskAdapterAgent(BaseAgent):
         Returns:
             Задача для выполнения агентом
         """
-        task_description = f"""
-        Проанализируй прогресс студента с ID "{student_id}" по главе "{chapter_title}" и предложи 
-        оптимальный уровень сложности и тип задач для дальнейшего обучения.
-        
-        Для этого:
-        1. Получи информацию о прогрессе студента 
-        2. Определи рекомендуемый уровень сложности
-        3. Проанализируй, с какими понятиями у студента возникли трудности
-        4. Определи, какой тип задач (с множественным выбором или творческие) лучше подходит студенту
-        5. Объясни свое решение
-        
-        Результат представь в формате JSON:
-        ```json
-        {{
-          "student_id": "{student_id}",
-          "chapter_title": "{chapter_title}",
-          "recommended_difficulty": "basic/advanced",
-          "recommended_task_type": "multiple_choice/creative",
-          "reasoning": "Объяснение, почему данная рекомендация предложена",
-          "problem_concepts": ["Понятие 1", "Понятие 2"],
-          "strong_concepts": ["Понятие 3", "Понятие 4"]
-        }}
-        ```
-        """
+        task_description = _ADAPTER_PROMPT_PREFIX + (
+            f"\n\nID студента: {student_id}\n"
+            f"Глава: {chapter_title}"
+        )
         
         return Task(
             description=task_description,
@@ -3,25 +3,111 @@
 """
 from typing import Dict, List, Any, Optional
 import logging
-import asyncio
 import json
+import copy
 
 from crewai import Agent, Task
 from crewai.tools import BaseTool
 from pydantic import BaseModel, Field
 
-from ai_tutor.agents.base_agent import BaseAgent
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+from ai_tutor.agents.base_agent import BaseAgent, TOOL_INPUT_CONFIG
 from ai_tutor.agents.prompts.task_checker_prompt import TASK_CHECKER_PROMPT
 from ai_tutor.database.neo4j_client import Neo4jClient
 from ai_tutor.api.openrouter import OpenRouterClient
+from ai_tutor.agents.definitions.background_loop import run_coroutine
+from ai_tutor.agents.definitions.task_adapter import invalidate_student_progress
+from ai_tutor.database.query_cache import QueryCache, MISSING
+from ai_tutor.agents.answer_cache import AnswerCache
 
 logger = logging.getLogger(__name__)
 
+def _dump_task_json(task: Dict[str, Any]) -> str:
+    """
+    Сериализация задачи в JSON для описания задачи агента
+    
+    Служебные поля (начинающиеся с "_") в описание не попадают.
+    При наличии orjson используется он, иначе стандартный json.
+    
+    Args:
+        task: Задача
+        
+    Returns:
+        JSON-строка задачи с отступами
+    """
+    public_task = {key: value for key, value in task.items() if not str(key).startswith("_")}
+    if ORJSON_AVAILABLE:
+        try:
+            return orjson.dumps(
+                public_task, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS
+            ).decode("utf-8")
+        except TypeError as e:
+            # orjson не умеет сериализовать некоторые типы, с которыми справляется json
+            logger.debug("orjson не смог сериализовать задачу: %s", e)
+    return json.dumps(public_task, ensure_ascii=False, indent=2)
+
+
+# Результаты проверки творческих ответов. Контекстом служат задача и определение
+# понятия, поэтому после изменения определения старые оценки не используются.
+# Оценка переиспользуется только для того же ответа (после нормализации):
+# по сходству эмбеддингов ответ с отрицанием или подменой факта почти
+# не отличается от исходного и получил бы чужую оценку
+creative_answer_cache = AnswerCache(max_size=1024)
+
+
+def _creative_cache_context(task: Dict[str, Any], concept: Dict[str, Any]) -> tuple:
+    """
+    Контекст кэша проверки творческого ответа
+    
+    Args:
+        task: Творческая задача
+        concept: Понятие из графа знаний
+        
+    Returns:
+        Кортеж из текста задачи, названия и определения понятия
+    """
+    return (
+        task.get('question', ''),
+        task.get('concept_name', ''),
+        concept.get('definition', '')
+    )
+
+
+# Допустимые ответы на задачу с множественным выбором
+_VALID_CHOICES = frozenset({"1", "2", "3", "4"})
+
+# Неизменяемая часть описания задачи проверки. Стоит в начале промпта, чтобы
+# совпадать байт в байт для всех студентов (кэширование префикса у провайдера);
+# данные конкретного ответа добавляются после нее
+_CHECKER_PROMPT_PREFIX = """Проверь ответ студента на задачу из главы курса. Данные студента, задача и ответ приведены ниже.
+
+Для проверки:
+1. Получи детальную информацию о понятии, указанном в задаче, из графа знаний
+2. Проверь ответ студента в зависимости от типа задачи:
+   - Для задачи с множественным выбором ("multiple_choice") используй инструмент check_multiple_choice_answer
+   - Для творческой задачи ("creative") используй инструмент check_creative_answer
+3. Предоставь подробную обратную связь с объяснением
+4. Дай рекомендации по дальнейшему обучению
+5. Обнови прогресс студента в базе данных
+
+Представь результат в формате JSON в зависимости от типа задачи."""
+
+# Кэш понятий со связями: одно и то же понятие запрашивается
+# при проверке ответов разных студентов
+concept_cache = QueryCache("concepts_with_relations", max_size=1024, ttl=60)
+
 
 class CheckMultipleChoiceAnswerInput(BaseModel):
     """
     Входные данные для проверки ответа с множественным выбором
     """
+    model_config = TOOL_INPUT_CONFIG
+    
     task: Dict[str, Any] = Field(description="Задача с множественным выбором")
     student_answer: str = Field(description="Ответ студента (1, 2, 3 или 4)")
 
@@ -48,16 +134,19 @@ class CheckMultipleChoiceAnswerTool(BaseTool):
         try:
             # Проверяем формат ответа
             student_choice = student_answer.strip()
-            if student_choice not in ["1", "2", "3", "4"]:
+            if student_choice not in _VALID_CHOICES:
                 return {
                     "is_correct": False,
                     "explanation": f"Ответ '{student_choice}' не соответствует формату задачи с множественным выбором (1, 2, 3, 4)."
                 }
             
-            # Находим правильный вариант
-            correct_option = next(
-                (opt for opt in task['options'] if opt['is_correct']), None
-            )
+            # Индексируем варианты по меткам и находим правильный за один проход
+            options_by_label = {}
+            correct_option = None
+            for option in task['options']:
+                options_by_label[option['label']] = option
+                if correct_option is None and option['is_correct']:
+                    correct_option = option
             
             if not correct_option:
                 return {
@@ -65,13 +154,8 @@ class CheckMultipleChoiceAnswerTool(BaseTool):
                     "explanation": "Не удалось определить правильный ответ в задаче."
                 }
             
-            # Проверяем ответ
-            is_correct = student_choice == correct_option['label']
-            
             # Находим выбранный вариант
-            selected_option = next(
-                (opt for opt in task['options'] if opt['label'] == student_choice), None
-            )
+            selected_option = options_by_label.get(student_choice)
             
             if not selected_option:
                 return {
@@ -79,6 +163,9 @@ class CheckMultipleChoiceAnswerTool(BaseTool):
                     "explanation": f"Ответ '{student_choice}' не соответствует ни одному из вариантов."
                 }
             
+            # Проверяем ответ
+            is_correct = selected_option is correct_option
+            
             # Формируем объяснение
             if is_correct:
                 explanation = f"Верно! {selected_option['explanation']}"
@@ -98,7 +185,7 @@ class CheckMultipleChoiceAnswerTool(BaseTool):
                 "recommendations": recommendations
             }
         except Exception as e:
-            logger.error(f"Ошибка при проверке ответа с множественным выбором: {str(e)}")
+            logger.error("Ошибка при проверке ответа с множественным выбором: %s", e, exc_info=True)
             return {
                 "is_correct": False,
                 "explanation": f"Произошла ошибка при проверке ответа: {str(e)}",
@@ -110,6 +197,8 @@ class CheckCreativeAnswerInput(BaseModel):
     """
     Входные данные для проверки творческого ответа
     """
+    model_config = TOOL_INPUT_CONFIG
+    
     task: Dict[str, Any] = Field(description="Творческая задача")
     student_answer: str = Field(description="Ответ студента в виде текста")
     concept: Dict[str, Any] = Field(description="Понятие из графа знаний")
@@ -145,10 +234,15 @@ class CheckCreativeAnswerTool(BaseTool):
         Returns:
             Результат проверки
         """
+        context = _creative_cache_context(task, concept)
+        cached_result = creative_answer_cache.get(student_answer, context)
+        if cached_result is not None:
+            logger.debug("Результат проверки творческого ответа взят из кэша")
+            return copy.deepcopy(cached_result)
+        
         try:
             # Запускаем асинхронную проверку ответа
-            loop = asyncio.get_event_loop()
-            check_result = loop.run_until_complete(
+            check_result = run_coroutine(
                 self.openrouter_client.check_answer(
                     task=task,
                     student_answer=student_answer,
@@ -175,9 +269,13 @@ class CheckCreativeAnswerTool(BaseTool):
                 check_result['recommendations'].append(f"Изучите понятие '{task['concept_name']}' более внимательно.")
                 check_result['recommendations'].append(f"Обратите внимание на критерии оценки: {', '.join(task['criteria'])}")
             
+            # Технические ошибки проверки не кэшируем
+            if 'error' not in check_result:
+                creative_answer_cache.put(student_answer, copy.deepcopy(check_result), context)
+            
             return check_result
         except Exception as e:
-            logger.error(f"Ошибка при проверке творческого ответа: {str(e)}")
+            logger.error("Ошибка при проверке творческого ответа: %s", e, exc_info=True)
             return {
                 "is_correct": False,
                 "score": 0,
@@ -191,6 +289,8 @@ class GetConceptInput(BaseModel):
     """
     Входные данные для получения понятия
     """
+    model_config = TOOL_INPUT_CONFIG
+    
     concept_name: str = Field(description="Название понятия")
 
 
@@ -223,12 +323,15 @@ class GetConceptTool(BaseTool):
             Понятие со связями
         """
         try:
-            result = self.neo4j_client.get_concept_with_relations(concept_name)
+            result = concept_cache.get(concept_name)
+            if result is MISSING:
+                result = self.neo4j_client.get_concept_with_relations(concept_name)
+                concept_cache.set(concept_name, result)
             if not result:
                 return {"error": f"Понятие '{concept_name}' не найдено в базе данных."}
             return result
         except Exception as e:
-            logger.error(f"Ошибка при получении понятия: {str(e)}")
+            logger.error("Ошибка при получении понятия: %s", e, exc_info=True)
             return {"error": f"Ошибка при получении понятия: {str(e)}"}
 
 
@@ -236,6 +339,8 @@ class UpdateStudentProgressInput(BaseModel):
     """
     Входные данные для обновления прогресса студента
     """
+    model_config = TOOL_INPUT_CONFIG
+    
     student_id: str = Field(description="ID студента")
     chapter_title: str = Field(description="Название главы")
     concept_name: str = Field(description="Название понятия")
@@ -284,13 +389,14 @@ class UpdateStudentProgressTool(BaseTool):
                 correct=correct,
                 difficulty=difficulty
             )
+            invalidate_student_progress(student_id, chapter_title)
             
             return {
                 "success": True,
                 "message": f"Прогресс студента {student_id} успешно обновлен."
             }
         except Exception as e:
-            logger.error(f"Ошибка при обновлении прогресса студента: {str(e)}")
+            logger.error("Ошибка при обновлении прогресса студента: %s", e, exc_info=True)
             return {
                 "success": False,
                 "error": f"Ошибка при обновлении прогресса студента: {str(e)}"
@@ -320,12 +426,13 @@ class TaskCheckerAgent(BaseAgent):
         Я внимателен к деталям и умею выявлять как сильные, так и слабые стороны в ответах.
         """
         
-        # Создаем инструменты агента
+        # Создаем инструменты агента с одним общим клиентом Neo4j
+        neo4j_client = self.get_neo4j_client()
         tools = [
             CheckMultipleChoiceAnswerTool(),
             CheckCreativeAnswerTool(openrouter_client),
-            GetConceptTool(self.get_neo4j_client()),
-            UpdateStudentProgressTool(self.get_neo4j_client())
+            GetConceptTool(neo4j_client),
+            UpdateStudentProgressTool(neo4j_client)
         ]
         
         super().__init__(
@@ -335,7 +442,7 @@ class TaskCheckerAgent(BaseAgent):
             prompt=TASK_CHECKER_PROMPT,
             backstory=backstory,
             verbose=verbose,
-            allow_delegation=True,
+            allow_delegation=False,  # Агент работает только со своими инструментами
             tools=tools
         )
     
@@ -354,29 +461,15 @@ class TaskCheckerAgent(BaseAgent):
             Задача для выполнения агентом
         """
         # Преобразуем задачу в JSON-строку для передачи в описание задачи
-        task_json = json.dumps(task, ensure_ascii=False, indent=2)
-        
-        task_description = f"""
-        Проверь ответ студента с ID "{student_id}" на задачу из главы "{chapter_title}".
+        task_json = _dump_task_json(task)
         
-        Задача:
-        ```json
-        {task_json}
-        ```
-        
-        Ответ студента: {student_answer}
-        
-        Для проверки:
-        1. Получи детальную информацию о понятии "{task['concept_name']}" из графа знаний
-        2. Проверь ответ студента в зависимости от типа задачи:
-           - Для задачи с множественным выбором ("multiple_choice") используй инструмент check_multiple_choice_answer
-           - Для творческой задачи ("creative") используй инструмент check_creative_answer
-        3. Предоставь подробную обратную связь с объяснением
-        4. Дай рекомендации по дальнейшему обучению
-        5. Обнови прогресс студента в базе данных
-        
-        Представь результат в формате JSON в зависимости от типа задачи.
-        """
+        task_description = _CHECKER_PROMPT_PREFIX + (
+            f"\n\nID студента: {student_id}\n"
+            f"Глава: {chapter_title}\n"
+            f"Понятие: {task['concept_name']}\n"
+            f"Задача:\n```json\n{task_json}\n```\n"
+            f"Ответ студента: {student_answer}"
+        )
         
         return Task(
             description=task_description,
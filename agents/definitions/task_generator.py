@@ -1,27 +1,42 @@
 """
 Агент-генератор задач
 """
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Sequence
 import logging
-import asyncio
 from functools import partial
 
 from crewai import Agent, Task
 from crewai.tools import BaseTool
 from pydantic import BaseModel, Field
 
-from ai_tutor.agents.base_agent import BaseAgent
+from ai_tutor.agents.base_agent import BaseAgent, TOOL_INPUT_CONFIG
 from ai_tutor.agents.prompts.task_generator_prompt import TASK_GENERATOR_PROMPT
 from ai_tutor.database.neo4j_client import Neo4jClient
 from ai_tutor.api.openrouter import OpenRouterClient
+from ai_tutor.agents.definitions.background_loop import run_coroutine
 
 logger = logging.getLogger(__name__)
 
+# Неизменяемая часть описания задачи генерации (общий префикс промпта);
+# параметры конкретной задачи добавляются после нее
+_GENERATOR_PROMPT_PREFIX = """Создай учебную задачу для проверки знаний по главе курса. Параметры задачи приведены ниже.
+
+Тип задачи: "multiple_choice" - с множественным выбором, "creative" - творческая.
+
+Уровень сложности: "basic" - базовый, доступный со средним образованием; "advanced" - продвинутый, требующий высшего образования.
+
+Исключённые понятия не должны использоваться в задаче.
+
+Задача должна проверять понимание понятий из данной главы, а не просто запоминание определений.
+Убедись, что уровень сложности соответствует указанному."""
+
 
 class GenerateTaskInput(BaseModel):
     """
     Входные данные для генерации задачи
     """
+    model_config = TOOL_INPUT_CONFIG
+    
     chapter_title: str = Field(description="Название главы курса")
     task_type: str = Field(description="Тип задачи (multiple_choice или creative)")
     difficulty: str = Field(description="Уровень сложности задачи (basic или advanced)")
@@ -52,7 +67,7 @@ class GenerateTaskTool(BaseTool):
         self.openrouter_client = openrouter_client
     
     def _run(self, chapter_title: str, task_type: str, difficulty: str,
-            excluded_concepts: Optional[List[str]] = None) -> Dict[str, Any]:
+            excluded_concepts: Optional[Sequence[str]] = None) -> Dict[str, Any]:
         """
         Запуск инструмента
         
@@ -65,30 +80,25 @@ class GenerateTaskTool(BaseTool):
         Returns:
             Сгенерированная задача
         """
-        excluded = excluded_concepts or []
-        
         # Получаем случайное понятие из главы с учетом сложности
-        concept = self.neo4j_client.get_random_concept_by_chapter_and_difficulty(
+        # вместе со связанными понятиями одним запросом
+        concept = self.neo4j_client.get_random_concept_with_related(
             chapter_title=chapter_title,
             difficulty=difficulty, 
-            excluded_concepts=excluded
+            excluded_concepts=excluded_concepts,
+            limit=5
         )
         
         if not concept:
-            logger.error(f"Не удалось найти понятия в главе {chapter_title} для уровня {difficulty}")
+            logger.error("Не удалось найти понятия в главе %s для уровня %s", chapter_title, difficulty)
             return {
                 "error": f"Не удалось найти понятия в главе {chapter_title} для уровня {difficulty}"
             }
         
-        # Получаем связанные понятия
-        related_concepts = self.neo4j_client.get_related_concepts(
-            concept_name=concept["name"],
-            limit=5
-        )
+        related_concepts = concept.pop("related", [])
         
         # Запускаем асинхронную генерацию задачи
-        loop = asyncio.get_event_loop()
-        task = loop.run_until_complete(
+        task = run_coroutine(
             self.openrouter_client.generate_task(
                 concept=concept,
                 related_concepts=related_concepts,
@@ -123,7 +133,6 @@ class TaskGeneratorAgent(BaseAgent):
         под разные уровни подготовки студентов.
         """
         
-        self.db_client = None
         self.openrouter_client = openrouter_client
         
         # Создаем инструменты агента
@@ -138,21 +147,10 @@ class TaskGeneratorAgent(BaseAgent):
             prompt=TASK_GENERATOR_PROMPT,
             backstory=backstory,
             verbose=verbose,
-            allow_delegation=True,
+            allow_delegation=False,  # Агент работает только со своими инструментами
             tools=tools
         )
     
-    def get_neo4j_client(self) -> Neo4jClient:
-        """
-        Получение клиента Neo4j
-        
-        Returns:
-            Клиент Neo4j
-        """
-        if not self.db_client:
-            self.db_client = Neo4jClient()
-        return self.db_client
-    
     def create_generation_task(self, chapter_title: str, task_type: str, 
                              difficulty: str, excluded_concepts: Optional[List[str]] = None) -> Task:
         """
@@ -170,20 +168,12 @@ class TaskGeneratorAgent(BaseAgent):
         excluded = excluded_concepts or []
         excluded_str = ", ".join(excluded) if excluded else "нет"
         
-        task_description = f"""
-        Создай учебную задачу для проверки знаний по главе "{chapter_title}".
-        
-        Тип задачи: {task_type} 
-        ("multiple_choice" - с множественным выбором, "creative" - творческая)
-        
-        Уровень сложности: {difficulty} 
-        ("basic" - базовый, доступный со средним образованием; "advanced" - продвинутый, требующий высшего образования)
-        
-        Исключённые понятия: {excluded_str}
-        
-        Задача должна проверять понимание понятий из данной главы, а не просто запоминание определений.
-        Убедись, что уровень сложности соответствует указанному.
-        """
+        task_description = _GENERATOR_PROMPT_PREFIX + (
+            f"\n\nГлава: {chapter_title}\n"
+            f"Тип задачи: {task_type}\n"
+            f"Уровень сложности: {difficulty}\n"
+            f"Исключённые понятия: {excluded_str}"
+        )
         
         return Task(
             description=task_description,
@@ -3,39 +3,337 @@
 """
 import logging
 import asyncio
-import traceback
-from typing import Dict, List, Any, Optional
+from typing import AsyncIterator, Dict, Hashable, List, Any, Optional, Tuple
 
-from ai_tutor.database.neo4j_client import Neo4jClient
-from ai_tutor.api.openrouter import OpenRouterClient
+from neo4j.exceptions import ServiceUnavailable, SessionExpired, TransientError
+
+from ai_tutor.agents.answer_cache import AnswerCache, load_projection, lookup_cached_answer, normalize_question
+from ai_tutor.agents.interaction_log import InteractionLogWriter, get_shared_log_writer
+from ai_tutor.database.neo4j_client import ChapterTable, Neo4jClient
+from ai_tutor.api.openrouter import OpenRouterClient, system_message
 from ai_tutor.agents.prompts.tutor_assistant_prompt import (
-    DISCUSSION_SYSTEM_PROMPT,
-    DISCUSSION_ANSWER_PROMPT,
-    INCORRECT_ANSWER_GUIDANCE_PROMPT,
-    EXPLANATION_AFTER_ATTEMPTS_PROMPT,
+    split_discussion_system_prompt,
+    DISCUSSION_ANSWER_TEMPLATE,
+    INCORRECT_ANSWER_GUIDANCE_TEMPLATE,
+    EXPLANATION_AFTER_ATTEMPTS_TEMPLATE,
     GENERAL_CONSULTATION_SYSTEM_PROMPT,
-    GENERAL_CONSULTATION_PROMPT
+    GENERAL_CONSULTATION_TEMPLATE
+)
+from ai_tutor.config.settings import (
+    COURSE_NAME,
+    CHAPTERS,
+    CONSULTATION_BATCH_CONCURRENCY,
+    CONSULTATION_BATCH_MAX_SIZE,
+    EMBEDDING_PCA_PATH,
+    LLM_ROUTES,
+    MAX_QUESTION_LENGTH
 )
-from ai_tutor.config.settings import COURSE_NAME, CHAPTERS
 
 logger = logging.getLogger(__name__)
 
+# Ошибки недоступности Neo4j, при которых консультация продолжается без контекста
+# из графа; остальные ошибки не маскируются
+_NEO4J_UNAVAILABLE_ERRORS = (ServiceUnavailable, SessionExpired, TransientError)
+
+# Контекст кэша ответов для общей консультации (ответ не зависит от студента)
+_GENERAL_CONSULTATION_CONTEXT = ("general_consultation",)
+
+_EMPTY_CONSULTATION_QUESTION_ANSWER = (
+    "Пожалуйста, задайте ваш вопрос о системном мышлении. "
+    "Я могу рассказать о понятиях курса, объяснить взаимосвязи между ними "
+    "или помочь разобраться с конкретной темой."
+)
+_CONSULTATION_ERROR_ANSWER = "Произошла ошибка при обработке вашего вопроса. Пожалуйста, попробуйте еще раз позже."
+_INVALID_QUESTION_ANSWER = (
+    f"Не удалось обработать вопрос: он должен быть текстом длиной не более {MAX_QUESTION_LENGTH} символов. "
+    "Пожалуйста, сформулируйте его короче."
+)
+_GUIDANCE_ERROR_ANSWER = "Произошла ошибка при анализе вашего ответа. Попробуйте ещё раз или задайте вопрос."
+_EXPLANATION_ERROR_ANSWER = "Произошла ошибка при подготовке объяснения. Пожалуйста, обратитесь к преподавателю."
+
+
+def _is_invalid_question(text: Any) -> bool:
+    """
+    Проверка текста студента до обращения к модели
+    
+    Пустые значения не считаются некорректными: они обрабатываются
+    в методах помощника отдельно.
+    
+    Args:
+        text: Вопрос или ответ студента
+        
+    Returns:
+        True, если текст не строка или длиннее MAX_QUESTION_LENGTH
+    """
+    return text is not None and (not isinstance(text, str) or len(text) > MAX_QUESTION_LENGTH)
+
+
+# Список глав курса для системного промпта (не меняется между запросами)
+_CHAPTERS_LIST = "\n".join(f"- {chapter}" for chapter in CHAPTERS)
+
+# Системный промпт общей консультации, разделенный по месту контекста запроса:
+# начало со структурой курса заполняется один раз при импорте, при каждом
+# запросе подставляются только контекст и вопрос студента
+_CONSULTATION_PROMPT_HEAD, _, _CONSULTATION_PROMPT_TAIL = GENERAL_CONSULTATION_SYSTEM_PROMPT.partition("{query_context}")
+_CONSULTATION_PROMPT_HEAD = _CONSULTATION_PROMPT_HEAD.format(
+    course_name=COURSE_NAME,
+    chapters_list=_CHAPTERS_LIST
+)
+
+# Отбор понятий для контекста общей консультации: не больше CONSULTATION_MAX_CONCEPTS,
+# и только с оценкой не ниже оценки лучшего понятия минус CONSULTATION_SCORE_DELTA
+CONSULTATION_MAX_CONCEPTS = 3
+CONSULTATION_SCORE_DELTA = 0.15
+
+# Максимальная длина контекста запроса в системном промпте (в символах)
+QUERY_CONTEXT_MAX_CHARS = 2000
+
+
+def _concept_score(concept: Dict[str, Any]) -> Optional[float]:
+    """
+    Оценка релевантности понятия из результатов semantic_search
+    
+    Args:
+        concept: Найденное понятие
+        
+    Returns:
+        Взвешенная оценка (или сходство, если ее нет) либо None
+    """
+    score = concept.get('weighted_score')
+    if score is None:
+        score = concept.get('similarity')
+    return score
+
+
+def _select_top_concepts(concepts: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Отбор наиболее релевантных понятий для контекста консультации
+    
+    Результаты semantic_search отсортированы по убыванию оценки; понятия,
+    заметно уступающие лучшему, только увеличивают промпт.
+    
+    Args:
+        concepts: Найденные понятия (по убыванию релевантности)
+        
+    Returns:
+        Не более CONSULTATION_MAX_CONCEPTS понятий с оценкой, близкой к лучшей
+    """
+    if not concepts:
+        return []
+    top_score = _concept_score(concepts[0])
+    if top_score is None:
+        return concepts[:CONSULTATION_MAX_CONCEPTS]
+    threshold = top_score - CONSULTATION_SCORE_DELTA
+    selected = [
+        concept for concept in concepts
+        if (_concept_score(concept) or 0) >= threshold
+    ]
+    return selected[:CONSULTATION_MAX_CONCEPTS]
+
+
+def _format_query_context(concepts: List[Dict[str, Any]],
+                          concept_context: Dict[str, Dict[str, Any]],
+                          chapter_ids: List[int],
+                          chapter_table: Optional[ChapterTable]) -> str:
+    """
+    Формирование текста контекста запроса для общей консультации
+    
+    Части текста собираются в список и объединяются один раз.
+    
+    Args:
+        concepts: Найденные релевантные понятия
+        concept_context: Главы и связанные понятия по названию понятия
+        chapter_ids: ID глав, в которых упоминаются понятия (в порядке вывода)
+        chapter_table: Таблица глав курса
+        
+    Returns:
+        Текст контекста запроса
+    """
+    parts = ["Информация по запросу:\n"]
+    
+    # Добавляем информацию о найденных понятиях
+    if concepts:
+        parts.append("\nНайденные релевантные понятия:\n")
+        for i, concept in enumerate(concepts):
+            parts.append(f"\n{i+1}. {concept['name']}\n")
+            parts.append(f"   Определение: {concept.get('definition', 'Не указано')}\n")
+            if concept.get('example'):
+                parts.append(f"   Пример: {concept['example']}\n")
+            
+            # Добавляем связанные понятия, если есть
+            related = concept_context.get(concept['name'], {}).get('related', [])
+            if related:
+                parts.append("   Связанные понятия: ")
+                parts.append(", ".join([f"{r['name']} ({r.get('relation_type', 'связано с')})" for r in related]))
+                parts.append("\n")
+    else:
+        parts.append("\nНе найдено релевантных понятий в базе данных.\n")
+    
+    # Добавляем информацию о главах
+    if chapter_ids:
+        parts.append("\nГлавы, в которых упоминаются эти понятия:\n")
+        for chapter_id in chapter_ids:
+            parts.append(f"\n- {chapter_table.titles[chapter_id]}\n")
+            main_ideas = chapter_table.main_ideas[chapter_id]
+            if main_ideas:
+                parts.append(f"  Основные идеи: {main_ideas}\n")
+    
+    return "".join(parts)
+
 
 class TutorAssistant:
     """
     Агент-репетитор для обсуждения задач со студентами
     """
     
-    def __init__(self, neo4j_client: Neo4jClient, openrouter_client: OpenRouterClient):
+    def __init__(self, neo4j_client: Neo4jClient, openrouter_client: OpenRouterClient,
+                 log_writer: Optional[InteractionLogWriter] = None):
         """
         Инициализация агента-репетитора
         
         Args:
             neo4j_client: Клиент для работы с Neo4j
             openrouter_client: Клиент для работы с OpenRouter API
+            log_writer: Очередь записи взаимодействий (по умолчанию - общая для процесса)
         """
         self.neo4j_client = neo4j_client
         self.openrouter_client = openrouter_client
+        
+        # Кэш готовых ответов (точное и семантическое совпадение вопроса)
+        self._answer_cache = AnswerCache(
+            max_size=1024, threshold=0.92, projection=load_projection(EMBEDDING_PCA_PATH)
+        )
+        
+        # Ограничение одновременных запросов при пакетной консультации
+        self._batch_semaphore = asyncio.Semaphore(CONSULTATION_BATCH_CONCURRENCY)
+        # Очередь обсуждений для записи в Neo4j пакетами (общая для всех помощников)
+        self._log_writer = log_writer if log_writer is not None else get_shared_log_writer()
+        # Выполняющиеся обсуждения задач: одинаковые вопросы, пришедшие
+        # одновременно, ждут один и тот же запрос к модели
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+    
+    async def _get_chapter_info(self, chapter_title: Optional[str]) -> Dict[str, Any]:
+        """
+        Получение информации о главе через асинхронный драйвер Neo4j
+        
+        Args:
+            chapter_title: Название главы (опционально)
+            
+        Returns:
+            Информация о главе или пустой словарь, если глава не указана или не найдена
+        """
+        if not chapter_title:
+            return {}
+        try:
+            return await self.neo4j_client.async_get_chapter_info(chapter_title)
+        except Exception as e:
+            logger.warning("Ошибка при получении информации о главе %s: %s", chapter_title, e)
+            return {}
+    
+    async def _get_chapter_table(self, concept_context: Dict[str, Dict[str, Any]]) -> ChapterTable:
+        """
+        Получение таблицы глав; если в ней нет какой-либо из глав найденных
+        понятий (глава добавлена после загрузки), таблица перезагружается
+        
+        Args:
+            concept_context: Главы и связанные понятия по названию понятия
+            
+        Returns:
+            Таблица глав
+        """
+        chapter_table = await asyncio.to_thread(self.neo4j_client.get_chapter_table)
+        for context in concept_context.values():
+            if any(title not in chapter_table.id_of for title in context.get('chapters', [])):
+                return await asyncio.to_thread(self.neo4j_client.get_chapter_table, True)
+        return chapter_table
+    
+    def invalidate_answer_cache(self) -> None:
+        """
+        Сброс кэша готовых ответов (вызывается после изменения графа знаний)
+        """
+        self._answer_cache.invalidate()
+    
+    async def _prepare_consultation_messages(self, student_question: str,
+                                             embedding: Any = None) -> List[Dict[str, str]]:
+        """
+        Подготовка сообщений для модели: поиск релевантных понятий, их глав
+        и связей в графе знаний и формирование промпта
+        
+        Args:
+            student_question: Вопрос студента
+            embedding: Эмбеддинг вопроса (опционально)
+            
+        Returns:
+            Сообщения для модели
+        """
+        # 1. Поиск релевантных понятий: по эмбеддингу вопроса в матрице
+        # эмбеддингов понятий, а если он недоступен или ничего не найдено -
+        # поиском по ключевым словам
+        relevant_concepts = []
+        try:
+            if embedding is not None:
+                relevant_concepts = await asyncio.to_thread(
+                    self.neo4j_client.semantic_search_fast,
+                    embedding,
+                    top_k=5,
+                    min_similarity=0.5
+                )
+            if not relevant_concepts:
+                relevant_concepts = await asyncio.to_thread(
+                    self.neo4j_client.semantic_search,
+                    query=student_question,
+                    limit=5,
+                    min_similarity=0.5
+                )
+            logger.info("Найдено %d релевантных понятий", len(relevant_concepts))
+        except _NEO4J_UNAVAILABLE_ERRORS as e:
+            logger.warning("Ошибка при семантическом поиске: %s", e)
+        
+        # Оставляем только понятия, близкие по релевантности к лучшему
+        relevant_concepts = _select_top_concepts(relevant_concepts)
+        
+        # 2. Поиск глав и связанных понятий одним запросом; основные идеи глав
+        # берутся из таблицы глав, загружаемой клиентом один раз
+        chapter_ids = []
+        chapter_table = None
+        concept_context = {}
+        
+        if relevant_concepts:
+            try:
+                concept_context = await asyncio.to_thread(
+                    self.neo4j_client.get_concept_context_bulk,
+                    [concept['name'] for concept in relevant_concepts]
+                )
+                chapter_table = await self._get_chapter_table(concept_context)
+            except _NEO4J_UNAVAILABLE_ERRORS as e:
+                logger.warning("Ошибка при получении глав и связей понятий: %s", e)
+            
+            # ID глав в порядке релевантности понятий без повторов
+            if chapter_table is not None:
+                seen = set()
+                for concept in relevant_concepts:
+                    for title in concept_context.get(concept['name'], {}).get('chapters', []):
+                        chapter_id = chapter_table.id_of.get(title)
+                        if chapter_id is not None and chapter_id not in seen:
+                            seen.add(chapter_id)
+                            chapter_ids.append(chapter_id)
+        
+        # 3. Формирование контекста запроса
+        query_context = _format_query_context(relevant_concepts, concept_context, chapter_ids, chapter_table)
+        if len(query_context) > QUERY_CONTEXT_MAX_CHARS:
+            # Обрезаем по границе строки, чтобы не оставлять оборванных определений
+            cut = query_context.rfind("\n", 0, QUERY_CONTEXT_MAX_CHARS)
+            query_context = query_context[:cut if cut > 0 else QUERY_CONTEXT_MAX_CHARS] + "\n…\n"
+        
+        # 4. Формируем системный промпт: начало со структурой курса одинаково
+        # для всех запросов и кэшируется провайдером
+        prompt_tail = query_context + _CONSULTATION_PROMPT_TAIL.format(student_question=student_question)
+        
+        # 5. Формируем сообщения для модели
+        return [
+            system_message(_CONSULTATION_PROMPT_HEAD, prompt_tail),
+            {"role": "user", "content": GENERAL_CONSULTATION_TEMPLATE.format(student_question=student_question)}
+        ]
     
     async def general_consultation(self, student_question: str, student_id: Optional[str] = None) -> str:
         """
@@ -48,112 +346,148 @@ class TutorAssistant:
         Returns:
             Ответ консультанта
         """
+        if _is_invalid_question(student_question):
+            logger.warning("Некорректный вопрос в запросе на консультацию отклонен")
+            return _INVALID_QUESTION_ANSWER
+        
         try:
             # Проверяем, что вопрос не пустой
             if not student_question or student_question.strip() == "":
                 logger.warning("Пустой вопрос в запросе на консультацию")
-                return ("Пожалуйста, задайте ваш вопрос о системном мышлении. "
-                        "Я могу рассказать о понятиях курса, объяснить взаимосвязи между ними "
-                        "или помочь разобраться с конкретной темой.")
+                return _EMPTY_CONSULTATION_QUESTION_ANSWER
                 
-            logger.info(f"Запрос на общую консультацию: {student_question[:50]}...")
-            
-            # 1. Поиск релевантных понятий через семантический поиск
-            relevant_concepts = []
-            try:
-                relevant_concepts = self.neo4j_client.semantic_search(
-                    query=student_question,
-                    limit=5,
-                    min_similarity=0.5
-                )
-                logger.info(f"Найдено {len(relevant_concepts)} релевантных понятий")
-            except Exception as e:
-                logger.warning(f"Ошибка при семантическом поиске: {str(e)}")
+            logger.info("Запрос на общую консультацию: %s...", student_question[:50])
             
-            # 2. Поиск релевантных глав
-            relevant_chapters = []
-            chapter_info = {}
-            
-            # Если найдены понятия, определяем, к каким главам они относятся
-            if relevant_concepts:
-                for concept in relevant_concepts:
-                    try:
-                        chapters = self.neo4j_client.get_chapters_for_concept(concept['name'])
-                        for chapter in chapters:
-                            if chapter not in relevant_chapters:
-                                relevant_chapters.append(chapter)
-                                # Получаем информацию о главе
-                                chapter_info[chapter] = self.neo4j_client.get_chapter_info(chapter)
-                    except Exception as e:
-                        logger.warning(f"Ошибка при поиске глав для понятия {concept['name']}: {str(e)}")
-            
-            # 3. Формирование контекста запроса
-            query_context = "Информация по запросу:\n"
-            
-            # Добавляем информацию о найденных понятиях
-            if relevant_concepts:
-                query_context += "\nНайденные релевантные понятия:\n"
-                for i, concept in enumerate(relevant_concepts):
-                    query_context += f"\n{i+1}. {concept['name']}\n"
-                    query_context += f"   Определение: {concept.get('definition', 'Не указано')}\n"
-                    if concept.get('example'):
-                        query_context += f"   Пример: {concept['example']}\n"
-                    
-                    # Добавляем связанные понятия, если есть
-                    try:
-                        related = self.neo4j_client.get_related_concepts(concept['name'])
-                        if related:
-                            query_context += "   Связанные понятия: "
-                            query_context += ", ".join([f"{r['name']} ({r.get('relation_type', 'связано с')})" for r in related])
-                            query_context += "\n"
-                    except Exception as e:
-                        logger.warning(f"Ошибка при получении связанных понятий: {str(e)}")
-            else:
-                query_context += "\nНе найдено релевантных понятий в базе данных.\n"
-            
-            # Добавляем информацию о главах
-            if relevant_chapters:
-                query_context += "\nГлавы, в которых упоминаются эти понятия:\n"
-                for chapter in relevant_chapters:
-                    info = chapter_info.get(chapter, {})
-                    query_context += f"\n- {chapter}\n"
-                    if info.get('main_ideas'):
-                        query_context += f"  Основные идеи: {info['main_ideas']}\n"
-            
-            # 4. Формируем системный промпт
-            system_prompt = GENERAL_CONSULTATION_SYSTEM_PROMPT.format(
-                course_name=COURSE_NAME,
-                chapters_list="\n".join([f"- {chapter}" for chapter in CHAPTERS]),
-                query_context=query_context,
-                student_question=student_question
+            cached_answer, embedding = await lookup_cached_answer(
+                self._answer_cache, self.openrouter_client, student_question, _GENERAL_CONSULTATION_CONTEXT
             )
+            if cached_answer is not None:
+                logger.info("Ответ на общую консультацию взят из кэша")
+                self._log_consultation(student_question, cached_answer, student_id)
+                return cached_answer
             
-            # 5. Формируем сообщения для модели
-            messages = [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": GENERAL_CONSULTATION_PROMPT.format(student_question=student_question)}
-            ]
+            messages = await self._prepare_consultation_messages(student_question, embedding)
             
-            # 6. Отправляем запрос к модели
+            # Отправляем запрос к модели
             response = await self.openrouter_client.generate_completion(messages, temperature=0.7, max_tokens=1500)
-            answer = response["choices"][0]["message"]["content"]
+            answer = response.content
             
-            logger.info(f"Сгенерирован ответ на общую консультацию: {student_question[:50]}...")
+            logger.info("Сгенерирован ответ на общую консультацию: %s...", student_question[:50])
+            self._answer_cache.put(student_question, answer, _GENERAL_CONSULTATION_CONTEXT, embedding)
+            self._log_consultation(student_question, answer, student_id)
+            return answer
             
-            # 7. Логируем взаимодействие, если указан ID студента
-            if student_id:
-                self.log_discussion(
-                    student_id=student_id,
-                    concept_name="Общая консультация",
-                    question=student_question,
-                    answer=answer
-                )
+        except Exception as e:
+            logger.error("Ошибка при общей консультации: %s", e, exc_info=logger.isEnabledFor(logging.DEBUG))
+            return _CONSULTATION_ERROR_ANSWER
+    
+    async def general_consultation_stream(self, student_question: str,
+                                          student_id: Optional[str] = None) -> AsyncIterator[str]:
+        """
+        Потоковая общая консультация: фрагменты ответа выдаются по мере генерации
+        
+        Ответ кэшируется и логируется после получения последнего фрагмента.
+        
+        Args:
+            student_question: Вопрос студента
+            student_id: ID студента (опционально)
             
-            return answer
+        Yields:
+            Фрагменты текста ответа
+        """
+        if _is_invalid_question(student_question):
+            logger.warning("Некорректный вопрос в запросе на консультацию отклонен")
+            yield _INVALID_QUESTION_ANSWER
+            return
+        
+        try:
+            if not student_question or student_question.strip() == "":
+                logger.warning("Пустой вопрос в запросе на консультацию")
+                yield _EMPTY_CONSULTATION_QUESTION_ANSWER
+                return
+            
+            logger.info("Потоковый запрос на общую консультацию: %s...", student_question[:50])
+            
+            cached_answer, embedding = await lookup_cached_answer(
+                self._answer_cache, self.openrouter_client, student_question, _GENERAL_CONSULTATION_CONTEXT
+            )
+            if cached_answer is not None:
+                logger.info("Ответ на общую консультацию взят из кэша")
+                self._log_consultation(student_question, cached_answer, student_id)
+                yield cached_answer
+                return
+            
+            messages = await self._prepare_consultation_messages(student_question, embedding)
+            
+            answer_parts = []
+            async for delta in self.openrouter_client.stream_completion(messages, temperature=0.7, max_tokens=1500):
+                answer_parts.append(delta)
+                yield delta
+            
+            answer = "".join(answer_parts)
+            logger.info("Сгенерирован потоковый ответ на общую консультацию: %s...", student_question[:50])
+            if answer:
+                self._answer_cache.put(student_question, answer, _GENERAL_CONSULTATION_CONTEXT, embedding)
+                self._log_consultation(student_question, answer, student_id)
             
         except Exception as e:
-            logger.error(f"Ошибка при общей консультации: {str(e)}\n{traceback.format_exc()}")
-            return "Произошла ошибка при обработке вашего вопроса. Пожалуйста, попробуйте еще раз позже."
+            logger.error("Ошибка при потоковой общей консультации: %s", e, exc_info=logger.isEnabledFor(logging.DEBUG))
+            yield _CONSULTATION_ERROR_ANSWER
+    
+    def _log_consultation(self, student_question: str, answer: str, student_id: Optional[str]) -> None:
+        """
+        Постановка консультации в очередь записи обсуждений
+        
+        Args:
+            student_question: Вопрос студента
+            answer: Ответ консультанта
+            student_id: ID студента (опционально)
+        """
+        # Логируем взаимодействие, если указан ID студента (в фоне,
+        # чтобы запись в Neo4j не задерживала ответ)
+        if student_id:
+            self._schedule_log_discussion(
+                student_id=student_id,
+                concept_name="Общая консультация",
+                question=student_question,
+                answer=answer
+            )
+    
+    async def general_consultation_batch(self, requests: List[Dict[str, Any]]) -> List[str]:
+        """
+        Общая консультация сразу по нескольким запросам
+        
+        Запросы обрабатываются одновременно (не более CONSULTATION_BATCH_CONCURRENCY
+        за раз), ответы возвращаются в порядке запросов.
+        
+        Args:
+            requests: Список запросов с ключами student_question и student_id (опционально)
+            
+        Returns:
+            Список ответов консультанта
+        """
+        if len(requests) > CONSULTATION_BATCH_MAX_SIZE:
+            raise ValueError(
+                f"Слишком много запросов в пакете: {len(requests)} "
+                f"(максимум {CONSULTATION_BATCH_MAX_SIZE})"
+            )
+        
+        async def _consult(request: Dict[str, Any]) -> str:
+            async with self._batch_semaphore:
+                return await self.general_consultation(
+                    student_question=request.get("student_question", ""),
+                    student_id=request.get("student_id")
+                )
+        
+        results = await asyncio.gather(*[_consult(request) for request in requests], return_exceptions=True)
+        answers = []
+        for result in results:
+            if isinstance(result, BaseException):
+                logger.error("Ошибка при пакетной консультации: %s", result)
+                answers.append(_CONSULTATION_ERROR_ANSWER)
+            else:
+                answers.append(result)
+        return answers
     
     async def discuss_task(self, 
                           student_question: str, 
@@ -163,6 +497,9 @@ class TutorAssistant:
         """
         Обсуждение задачи со студентом
         
+        Одинаковые (после нормализации) вопросы по одной задаче, пришедшие
+        одновременно, обрабатываются одним запросом к модели.
+        
         Args:
             student_question: Вопрос студента
             concept_name: Название понятия
@@ -172,73 +509,204 @@ class TutorAssistant:
         Returns:
             Ответ репетитора
         """
-        try:
-            # Проверяем, что concept_name не пустой
-            if not concept_name or concept_name.strip() == "":
-                logger.warning("Пустое имя понятия в запросе")
-                
-                # Попробуем получить информацию о главе
-                chapter_info_text = ""
-                if chapter_title:
-                    try:
-                        chapter_info = self.neo4j_client.get_chapter_info(chapter_title)
-                        if chapter_info:
-                            chapter_info_text = f"\n\nМы обсуждаем главу '{chapter_title}'. "
-                            if 'main_ideas' in chapter_info:
-                                chapter_info_text += f"Основные идеи главы: {chapter_info['main_ideas']}"
-                    except Exception as e:
-                        logger.warning(f"Ошибка при получении информации о главе: {str(e)}")
-                
-                return (f"Я не могу определить, о каком понятии идет речь. "
-                        f"Пожалуйста, уточните название понятия, которое вы хотите обсудить.{chapter_info_text}")
-            
-            # Получаем информацию о понятии
-            concept = self.neo4j_client.get_concept_by_name(concept_name, chapter_title)
-            
-            if not concept:
-                logger.warning(f"Не найдено понятие: {concept_name}")
-                return f"К сожалению, я не нашел информации о понятии '{concept_name}'. Пожалуйста, уточните название понятия."
-            
-            concept_definition = concept.get('definition', 'Определение отсутствует')
-            
-            # Получаем контекст главы, если указана
-            chapter_context = "Информация о главе отсутствует."
-            if chapter_title:
-                try:
-                    chapter_info = self.neo4j_client.get_chapter_info(chapter_title)
-                    if chapter_info:
-                        chapter_context = (
-                            f"Название главы: {chapter_title}\n"
-                            f"Основные идеи: {chapter_info.get('main_ideas', 'Не указаны')}\n"
-                        )
-                except Exception as e:
-                    logger.warning(f"Ошибка при получении информации о главе {chapter_title}: {str(e)}")
-            
-            # Формируем системный промпт
-            system_prompt = DISCUSSION_SYSTEM_PROMPT.format(
-                concept_name=concept_name,
-                concept_definition=concept_definition,
-                task_question=task_question,
-                chapter_context=chapter_context,
-                student_question=student_question
+        if _is_invalid_question(student_question):
+            logger.warning("Некорректный вопрос по задаче отклонен")
+            return _INVALID_QUESTION_ANSWER
+        
+        key = (concept_name, task_question, chapter_title, normalize_question(student_question or ""))
+        task = self._inflight.get(key)
+        if task is None or task.get_loop() is not asyncio.get_running_loop():
+            task = asyncio.ensure_future(
+                self._discuss_task(student_question, concept_name, task_question, chapter_title)
             )
+            self._inflight[key] = task
+            task.add_done_callback(lambda done, key=key: self._forget_inflight(key, done))
+        else:
+            logger.info("Вопрос по задаче уже обрабатывается, ожидаем готовый ответ")
+        # shield: отмена одного из ожидающих не прерывает общий запрос
+        return await asyncio.shield(task)
+    
+    def _forget_inflight(self, key: Hashable, task: asyncio.Task) -> None:
+        """
+        Удаление завершенного обсуждения из списка выполняющихся
+        
+        Args:
+            key: Ключ обсуждения
+            task: Завершенная задача
+        """
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+    
+    async def _discuss_task(self, 
+                            student_question: str, 
+                            concept_name: str, 
+                            task_question: str, 
+                            chapter_title: Optional[str] = None) -> str:
+        """
+        Обсуждение задачи со студентом (без объединения одинаковых запросов)
+        
+        Args:
+            student_question: Вопрос студента
+            concept_name: Название понятия
+            task_question: Вопрос задачи
+            chapter_title: Название главы (опционально)
             
-            # Формируем сообщения для модели
-            messages = [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": DISCUSSION_ANSWER_PROMPT.format(student_question=student_question)}
-            ]
+        Returns:
+            Ответ репетитора
+        """
+        try:
+            ready_answer, messages, cache_context, embedding = await self._prepare_discussion(
+                student_question, concept_name, task_question, chapter_title
+            )
+            if ready_answer is not None:
+                return ready_answer
             
             # Отправляем запрос к модели
-            response = await self.openrouter_client.generate_completion(messages, temperature=0.7)
-            answer = response["choices"][0]["message"]["content"]
+            response = await self.openrouter_client.generate_completion_batched(
+                messages, temperature=0.7, **LLM_ROUTES["discussion"]
+            )
+            answer = response.content
             
-            logger.info(f"Сгенерирован ответ на вопрос по задаче: {student_question[:50]}...")
+            logger.info("Сгенерирован ответ на вопрос по задаче: %s...", student_question[:50])
+            self._answer_cache.put(student_question, answer, cache_context, embedding)
             return answer
             
         except Exception as e:
-            logger.error(f"Ошибка при обсуждении задачи: {str(e)}\n{traceback.format_exc()}")
-            return "Произошла ошибка при обработке вашего вопроса. Пожалуйста, попробуйте еще раз позже."
+            logger.error("Ошибка при обсуждении задачи: %s", e, exc_info=logger.isEnabledFor(logging.DEBUG))
+            return _CONSULTATION_ERROR_ANSWER
+    
+    async def discuss_task_stream(self, 
+                                  student_question: str, 
+                                  concept_name: str, 
+                                  task_question: str, 
+                                  chapter_title: Optional[str] = None) -> AsyncIterator[str]:
+        """
+        Потоковое обсуждение задачи: фрагменты ответа выдаются по мере генерации
+        
+        Ответ кэшируется после получения последнего фрагмента.
+        
+        Args:
+            student_question: Вопрос студента
+            concept_name: Название понятия
+            task_question: Вопрос задачи
+            chapter_title: Название главы (опционально)
+            
+        Yields:
+            Фрагменты текста ответа
+        """
+        if _is_invalid_question(student_question):
+            logger.warning("Некорректный вопрос по задаче отклонен")
+            yield _INVALID_QUESTION_ANSWER
+            return
+        
+        try:
+            ready_answer, messages, cache_context, embedding = await self._prepare_discussion(
+                student_question, concept_name, task_question, chapter_title
+            )
+            if ready_answer is not None:
+                yield ready_answer
+                return
+            
+            answer_parts = []
+            async for delta in self.openrouter_client.stream_completion(
+                messages, temperature=0.7, **LLM_ROUTES["discussion"]
+            ):
+                answer_parts.append(delta)
+                yield delta
+            
+            answer = "".join(answer_parts)
+            logger.info("Сгенерирован потоковый ответ на вопрос по задаче: %s...", student_question[:50])
+            if answer:
+                self._answer_cache.put(student_question, answer, cache_context, embedding)
+            
+        except Exception as e:
+            logger.error("Ошибка при потоковом обсуждении задачи: %s", e, exc_info=logger.isEnabledFor(logging.DEBUG))
+            yield _CONSULTATION_ERROR_ANSWER
+    
+    async def _prepare_discussion(self, 
+                                  student_question: str, 
+                                  concept_name: str, 
+                                  task_question: str, 
+                                  chapter_title: Optional[str] = None
+                                  ) -> Tuple[Optional[str], Optional[List[Dict[str, str]]], Hashable, Any]:
+        """
+        Подготовка обсуждения задачи: готовый ответ или сообщения для модели
+        
+        Args:
+            student_question: Вопрос студента
+            concept_name: Название понятия
+            task_question: Вопрос задачи
+            chapter_title: Название главы (опционально)
+            
+        Returns:
+            Кортеж (готовый ответ или None, сообщения для модели или None,
+            контекст кэша ответов, эмбеддинг вопроса или None)
+        """
+        # Проверяем, что concept_name не пустой
+        if not concept_name or concept_name.strip() == "":
+            logger.warning("Пустое имя понятия в запросе")
+            
+            # Попробуем получить информацию о главе
+            chapter_info_text = ""
+            chapter_info = await self._get_chapter_info(chapter_title)
+            if chapter_info:
+                chapter_info_text = f"\n\nМы обсуждаем главу '{chapter_title}'. "
+                if 'main_ideas' in chapter_info:
+                    chapter_info_text += f"Основные идеи главы: {chapter_info['main_ideas']}"
+            
+            return (f"Я не могу определить, о каком понятии идет речь. "
+                    f"Пожалуйста, уточните название понятия, которое вы хотите обсудить.{chapter_info_text}",
+                    None, None, None)
+        
+        # Ответ зависит от понятия, задачи и главы: вопрос сравнивается
+        # с ранее заданными только в этом же контексте
+        cache_context = (concept_name, task_question, chapter_title)
+        cached_answer, embedding = await lookup_cached_answer(
+            self._answer_cache, self.openrouter_client, student_question, cache_context
+        )
+        if cached_answer is not None:
+            logger.info("Ответ на вопрос по задаче взят из кэша")
+            return cached_answer, None, cache_context, embedding
+        
+        # Понятие и информацию о главе получаем одним запросом,
+        # не блокируя цикл событий
+        concept_with_chapter = await asyncio.to_thread(
+            self.neo4j_client.get_concept_with_chapter, concept_name, chapter_title
+        )
+        concept = concept_with_chapter["concept"]
+        chapter_info = concept_with_chapter["chapter_info"]
+        
+        if not concept:
+            logger.warning("Не найдено понятие: %s", concept_name)
+            return (f"К сожалению, я не нашел информации о понятии '{concept_name}'. Пожалуйста, уточните название понятия.",
+                    None, cache_context, embedding)
+        
+        concept_definition = concept.get('definition', 'Определение отсутствует')
+        
+        # Контекст главы, если указана
+        chapter_context = "Информация о главе отсутствует."
+        if chapter_info:
+            chapter_context = (
+                f"Название главы: {chapter_title}\n"
+                f"Основные идеи: {chapter_info.get('main_ideas', 'Не указаны')}\n"
+            )
+        
+        # Формируем системный промпт: часть до вопроса студента одинакова
+        # на всех шагах обсуждения задачи и кэшируется провайдером
+        prompt_head, prompt_tail = split_discussion_system_prompt(
+            concept_name=concept_name,
+            concept_definition=concept_definition,
+            task_question=task_question,
+            chapter_context=chapter_context,
+            student_question=student_question
+        )
+        
+        # Формируем сообщения для модели
+        messages = [
+            system_message(prompt_head, prompt_tail),
+            {"role": "user", "content": DISCUSSION_ANSWER_TEMPLATE.format(student_question=student_question)}
+        ]
+        return None, messages, cache_context, embedding
     
     async def provide_guidance_after_incorrect_answer(self, 
                                                      student_answer: str, 
@@ -255,27 +723,80 @@ class TutorAssistant:
         Returns:
             Подсказка
         """
+        if _is_invalid_question(student_answer):
+            logger.warning("Некорректный ответ студента по понятию %s отклонен", concept_name)
+            return _INVALID_QUESTION_ANSWER
+        
         try:
-            # Формируем сообщения для модели
-            messages = [
-                {"role": "system", "content": "Ты - опытный педагог, помогающий студентам разобраться в ошибках."},
-                {"role": "user", "content": INCORRECT_ANSWER_GUIDANCE_PROMPT.format(
-                    student_answer=student_answer,
-                    correct_answer=correct_answer,
-                    concept_name=concept_name
-                )}
-            ]
+            messages = self._guidance_messages(student_answer, correct_answer, concept_name)
             
             # Отправляем запрос к модели
-            response = await self.openrouter_client.generate_completion(messages, temperature=0.7)
-            guidance = response["choices"][0]["message"]["content"]
+            response = await self.openrouter_client.generate_completion_batched(
+                messages, temperature=0.7, **LLM_ROUTES["guidance"]
+            )
+            guidance = response.content
             
-            logger.info(f"Сгенерирована подсказка после неправильного ответа для понятия {concept_name}")
+            logger.info("Сгенерирована подсказка после неправильного ответа для понятия %s", concept_name)
             return guidance
             
         except Exception as e:
-            logger.error(f"Ошибка при генерации подсказки: {str(e)}\n{traceback.format_exc()}")
-            return "Произошла ошибка при анализе вашего ответа. Попробуйте ещё раз или задайте вопрос."
+            logger.error("Ошибка при генерации подсказки: %s", e, exc_info=logger.isEnabledFor(logging.DEBUG))
+            return _GUIDANCE_ERROR_ANSWER
+    
+    async def provide_guidance_after_incorrect_answer_stream(self, 
+                                                            student_answer: str, 
+                                                            correct_answer: str, 
+                                                            concept_name: str) -> AsyncIterator[str]:
+        """
+        Потоковая подсказка после неправильного ответа
+        
+        Args:
+            student_answer: Ответ студента
+            correct_answer: Правильный ответ
+            concept_name: Название понятия
+            
+        Yields:
+            Фрагменты текста подсказки
+        """
+        if _is_invalid_question(student_answer):
+            logger.warning("Некорректный ответ студента по понятию %s отклонен", concept_name)
+            yield _INVALID_QUESTION_ANSWER
+            return
+        
+        try:
+            messages = self._guidance_messages(student_answer, correct_answer, concept_name)
+            async for delta in self.openrouter_client.stream_completion(
+                messages, temperature=0.7, **LLM_ROUTES["guidance"]
+            ):
+                yield delta
+            
+            logger.info("Сгенерирована потоковая подсказка после неправильного ответа для понятия %s", concept_name)
+            
+        except Exception as e:
+            logger.error("Ошибка при потоковой генерации подсказки: %s", e, exc_info=logger.isEnabledFor(logging.DEBUG))
+            yield _GUIDANCE_ERROR_ANSWER
+    
+    @staticmethod
+    def _guidance_messages(student_answer: str, correct_answer: str, concept_name: str) -> List[Dict[str, str]]:
+        """
+        Формирование сообщений для модели для подсказки после неправильного ответа
+        
+        Args:
+            student_answer: Ответ студента
+            correct_answer: Правильный ответ
+            concept_name: Название понятия
+            
+        Returns:
+            Список сообщений
+        """
+        return [
+            {"role": "system", "content": "Ты - опытный педагог, помогающий студентам разобраться в ошибках."},
+            {"role": "user", "content": INCORRECT_ANSWER_GUIDANCE_TEMPLATE.format(
+                student_answer=student_answer,
+                correct_answer=correct_answer,
+                concept_name=concept_name
+            )}
+        ]
     
     async def explain_after_multiple_attempts(self, 
                                             concept_name: str, 
@@ -295,40 +816,122 @@ class TutorAssistant:
             Подробное объяснение
         """
         try:
-            # Получаем информацию о понятии
-            concept = self.neo4j_client.get_concept_by_name(concept_name, chapter_title)
-            
-            if not concept:
-                logger.warning(f"Не найдено понятие: {concept_name}")
-                return f"К сожалению, я не нашел информации о понятии '{concept_name}'. Пожалуйста, уточните название понятия."
-            
-            concept_definition = concept.get('definition', 'Определение отсутствует')
-            
-            # Формируем сообщения для модели
-            messages = [
-                {"role": "system", "content": "Ты - опытный преподаватель, объясняющий сложные понятия доступным языком."},
-                {"role": "user", "content": EXPLANATION_AFTER_ATTEMPTS_PROMPT.format(
-                    concept_name=concept_name,
-                    concept_definition=concept_definition,
-                    task_question=task_question,
-                    correct_answer=correct_answer
-                )}
-            ]
+            ready_answer, messages = await self._prepare_explanation(
+                concept_name, task_question, correct_answer, chapter_title
+            )
+            if ready_answer is not None:
+                return ready_answer
             
             # Отправляем запрос к модели
-            response = await self.openrouter_client.generate_completion(messages, temperature=0.7, max_tokens=1500)
-            explanation = response["choices"][0]["message"]["content"]
+            response = await self.openrouter_client.generate_completion_batched(
+                messages, temperature=0.7, **LLM_ROUTES["explanation"]
+            )
+            explanation = response.content
             
-            logger.info(f"Сгенерировано подробное объяснение для понятия {concept_name}")
+            logger.info("Сгенерировано подробное объяснение для понятия %s", concept_name)
             return explanation
             
         except Exception as e:
-            logger.error(f"Ошибка при генерации объяснения: {str(e)}\n{traceback.format_exc()}")
-            return "Произошла ошибка при подготовке объяснения. Пожалуйста, обратитесь к преподавателю."
+            logger.error("Ошибка при генерации объяснения: %s", e, exc_info=logger.isEnabledFor(logging.DEBUG))
+            return _EXPLANATION_ERROR_ANSWER
+    
+    async def explain_after_multiple_attempts_stream(self, 
+                                                     concept_name: str, 
+                                                     task_question: str, 
+                                                     correct_answer: str,
+                                                     chapter_title: Optional[str] = None) -> AsyncIterator[str]:
+        """
+        Потоковое подробное объяснение после нескольких неудачных попыток
+        
+        Args:
+            concept_name: Название понятия
+            task_question: Вопрос задачи
+            correct_answer: Правильный ответ
+            chapter_title: Название главы (опционально)
+            
+        Yields:
+            Фрагменты текста объяснения
+        """
+        try:
+            ready_answer, messages = await self._prepare_explanation(
+                concept_name, task_question, correct_answer, chapter_title
+            )
+            if ready_answer is not None:
+                yield ready_answer
+                return
+            
+            async for delta in self.openrouter_client.stream_completion(
+                messages, temperature=0.7, **LLM_ROUTES["explanation"]
+            ):
+                yield delta
+            
+            logger.info("Сгенерировано потоковое подробное объяснение для понятия %s", concept_name)
+            
+        except Exception as e:
+            logger.error("Ошибка при потоковой генерации объяснения: %s", e, exc_info=logger.isEnabledFor(logging.DEBUG))
+            yield _EXPLANATION_ERROR_ANSWER
+    
+    async def _prepare_explanation(self, 
+                                   concept_name: str, 
+                                   task_question: str, 
+                                   correct_answer: str,
+                                   chapter_title: Optional[str] = None
+                                   ) -> Tuple[Optional[str], Optional[List[Dict[str, str]]]]:
+        """
+        Подготовка объяснения: готовый ответ или сообщения для модели
+        
+        Args:
+            concept_name: Название понятия
+            task_question: Вопрос задачи
+            correct_answer: Правильный ответ
+            chapter_title: Название главы (опционально)
             
+        Returns:
+            Кортеж (готовый ответ или None, сообщения для модели или None)
+        """
+        # Получаем информацию о понятии
+        concept = await asyncio.to_thread(self.neo4j_client.get_concept_by_name, concept_name, chapter_title)
+        
+        if not concept:
+            logger.warning("Не найдено понятие: %s", concept_name)
+            return (f"К сожалению, я не нашел информации о понятии '{concept_name}'. Пожалуйста, уточните название понятия.",
+                    None)
+        
+        concept_definition = concept.get('definition', 'Определение отсутствует')
+        
+        # Формируем сообщения для модели
+        messages = [
+            {"role": "system", "content": "Ты - опытный преподаватель, объясняющий сложные понятия доступным языком."},
+            {"role": "user", "content": EXPLANATION_AFTER_ATTEMPTS_TEMPLATE.format(
+                concept_name=concept_name,
+                concept_definition=concept_definition,
+                task_question=task_question,
+                correct_answer=correct_answer
+            )}
+        ]
+        return None, messages
+            
+    def _schedule_log_discussion(self, student_id: str, concept_name: str, question: str,
+                                 answer: str, chapter_title: Optional[str] = None) -> None:
+        """
+        Постановка обсуждения в очередь на запись без ожидания результата
+        
+        Args:
+            student_id: ID студента
+            concept_name: Название понятия
+            question: Вопрос студента
+            answer: Ответ репетитора
+            chapter_title: Название главы (опционально)
+        """
+        if not self._log_writer.put(student_id, question, answer, chapter_title):
+            logger.warning("Обсуждение по понятию %s не сохранено", concept_name)
+    
     def log_discussion(self, student_id: str, concept_name: str, question: str, answer: str, chapter_title: Optional[str] = None) -> None:
         """
-        Сохранение обсуждения в базе данных
+        Сохранение обсуждения в базе данных (синхронно)
+        
+        Обсуждения записываются пакетами через очередь; метод оставлен
+        для разовой записи из синхронного кода.
         
         Args:
             student_id: ID студента
@@ -345,6 +948,6 @@ class TutorAssistant:
                 answer=answer,
                 chapter_title=chapter_title
             )
-            logger.info(f"Сохранено обсуждение для студента {student_id} по понятию {concept_name}")
+            logger.info("Сохранено обсуждение для студента %s по понятию %s", student_id, concept_name)
         except Exception as e:
-            logger.error(f"Ошибка при логировании обсуждения: {str(e)}") 
\ No newline at end of file
+            logger.error("Ошибка при логировании обсуждения: %s", e) 
\ No newline at end of file
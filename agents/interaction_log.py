@@ -0,0 +1,189 @@
+"""
+Фоновая запись взаимодействий студентов с помощниками в Neo4j.
+
+Взаимодействия ставятся в очередь без ожидания записи и сохраняются
+пакетами одним запросом UNWIND (Neo4jClient.save_assistant_interactions_bulk).
+"""
+import asyncio
+import logging
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from ai_tutor.database.neo4j_client import Neo4jClient, get_shared_client
+
+logger = logging.getLogger(__name__)
+
+# Максимальный размер пакета и максимальное ожидание его заполнения (в секундах)
+LOG_BATCH_SIZE = 50
+LOG_BATCH_WAIT = 0.2
+# Максимальная длина очереди: при переполнении новые записи отбрасываются
+LOG_QUEUE_MAX_SIZE = 1000
+
+
+class InteractionLogWriter:
+    """
+    Очередь взаимодействий с фоновой пакетной записью в Neo4j
+    """
+
+    def __init__(self, neo4j_client: Neo4jClient, batch_size: int = LOG_BATCH_SIZE,
+                 batch_wait: float = LOG_BATCH_WAIT, max_queue_size: int = LOG_QUEUE_MAX_SIZE):
+        """
+        Инициализация очереди записи
+
+        Args:
+            neo4j_client: Клиент для работы с Neo4j
+            batch_size: Максимальный размер пакета
+            batch_wait: Максимальное ожидание заполнения пакета в секундах
+            max_queue_size: Максимальная длина очереди
+        """
+        self.neo4j_client = neo4j_client
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.max_queue_size = max_queue_size
+        # Очередь и фоновая задача создаются при первом обращении
+        # внутри работающего цикла событий
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def put(self, student_id: str, question: str, answer: str,
+            chapter_title: Optional[str] = None) -> bool:
+        """
+        Постановка взаимодействия в очередь на запись без ожидания результата
+
+        Args:
+            student_id: ID студента
+            question: Вопрос студента
+            answer: Ответ помощника
+            chapter_title: Название главы (опционально)
+
+        Returns:
+            True, если взаимодействие поставлено в очередь
+        """
+        item = {
+            "student_id": student_id,
+            "question": question,
+            "answer": answer,
+            "chapter_title": chapter_title,
+            # Время фиксируется при постановке в очередь, а не при записи пакета
+            "created_at": int(time.time() * 1000)
+        }
+        loop = asyncio.get_running_loop()
+        task = self._task
+        if task is not None and not task.done() and task.get_loop() is not loop:
+            task_loop = task.get_loop()
+            if task_loop.is_running():
+                # Очередь работает в другом цикле событий: передаем запись в него
+                task_loop.call_soon_threadsafe(self._enqueue, self._queue, item)
+                return True
+            # Цикл очереди остановлен без close(): оставшиеся в ней записи уже не сохранить
+            if self._queue.qsize():
+                logger.warning("Цикл событий очереди записи остановлен, не сохранено взаимодействий: %d",
+                               self._queue.qsize())
+            task = None
+        if task is None or task.done():
+            self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+            self._task = loop.create_task(self._run())
+        return self._enqueue(self._queue, item)
+
+    @staticmethod
+    def _enqueue(queue: asyncio.Queue, item: Dict[str, Any]) -> bool:
+        """
+        Добавление взаимодействия в очередь (вызывается в цикле событий очереди)
+
+        Args:
+            queue: Очередь записи
+            item: Взаимодействие
+
+        Returns:
+            True, если взаимодействие поставлено в очередь
+        """
+        try:
+            queue.put_nowait(item)
+        except asyncio.QueueFull:
+            logger.warning("Очередь записи взаимодействий переполнена, взаимодействие студента %s не сохранено",
+                           item["student_id"])
+            return False
+        return True
+
+    async def close(self) -> None:
+        """
+        Ожидание записи всех взаимодействий из очереди и остановка фоновой задачи
+
+        Вызывается перед закрытием цикла событий, в котором работает очередь.
+        """
+        task = self._task
+        if task is None or task.get_loop() is not asyncio.get_running_loop():
+            return
+        if not task.done():
+            await self._queue.join()
+            task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        self._task = None
+        self._queue = None
+
+    async def _run(self) -> None:
+        """
+        Фоновая запись взаимодействий пакетами
+
+        Пакет отправляется, когда в нем набралось batch_size взаимодействий
+        или с момента получения первого прошло batch_wait секунд.
+        """
+        loop = asyncio.get_running_loop()
+        queue = self._queue
+        while True:
+            batch = [await queue.get()]
+            deadline = loop.time() + self.batch_wait
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            try:
+                saved = await asyncio.to_thread(self.neo4j_client.save_assistant_interactions_bulk, batch)
+                logger.info("Сохранено взаимодействий: %d из %d", saved, len(batch))
+            except Exception as e:
+                logger.error("Ошибка при пакетной записи взаимодействий: %s", e, exc_info=True)
+            finally:
+                for _ in batch:
+                    queue.task_done()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Возвращает состояние очереди записи
+
+        Returns:
+            Словарь с длиной очереди и признаком работы фоновой задачи
+        """
+        return {
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "running": self._task is not None and not self._task.done()
+        }
+
+
+# Общая для процесса очередь записи (см. get_shared_log_writer)
+_shared_writer: Optional[InteractionLogWriter] = None
+_shared_writer_lock = threading.Lock()
+
+
+def get_shared_log_writer() -> InteractionLogWriter:
+    """
+    Получение общей для процесса очереди записи взаимодействий
+
+    Очередь создается при первом обращении и пишет через общий клиент Neo4j.
+    Все помощники ставят взаимодействия в нее, поэтому при остановке
+    достаточно дождаться записи одной очереди (InteractionLogWriter.close).
+
+    Returns:
+        Очередь записи взаимодействий
+    """
+    global _shared_writer
+    if _shared_writer is None:
+        with _shared_writer_lock:
+            if _shared_writer is None:
+                _shared_writer = InteractionLogWriter(get_shared_client())
+    return _shared_writer
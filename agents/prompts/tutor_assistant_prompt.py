@@ -1,6 +1,9 @@
 """
 Промпты для туториального ассистента, отвечающего на вопросы студентов по задачам
 """
+from functools import lru_cache
+from string import Formatter
+from typing import List, Tuple
 
 # Системный промпт для обсуждения задачи
 DISCUSSION_SYSTEM_PROMPT = """
@@ -110,4 +113,117 @@ EXPLANATION_AFTER_ATTEMPTS_PROMPT = """
 Определение: {concept_definition}
 Задача: {task_question}
 Правильный ответ: {correct_answer}
-""" 
\ No newline at end of file
+""" 
+
+
+class CompiledPrompt:
+    """
+    Шаблон промпта, разобранный один раз при импорте
+    
+    Метод format принимает те же именованные аргументы, что и str.format,
+    но не разбирает шаблон заново при каждом вызове: текст собирается
+    из заранее выделенных литеральных частей и значений полей.
+    """
+    
+    def __init__(self, template: str):
+        """
+        Разбор шаблона
+        
+        Args:
+            template: Шаблон с полями вида {name} (без спецификаторов формата)
+        """
+        self._parts: List[Tuple[str, str]] = []
+        for literal, field, format_spec, conversion in Formatter().parse(template):
+            if format_spec or conversion:
+                raise ValueError(f"Спецификаторы формата не поддерживаются: {{{field}}}")
+            self._parts.append((literal, field))
+    
+    def format(self, **kwargs) -> str:
+        """
+        Подстановка значений полей
+        
+        Args:
+            **kwargs: Значения полей шаблона
+            
+        Returns:
+            Готовый текст промпта
+        """
+        chunks = []
+        for literal, field in self._parts:
+            chunks.append(literal)
+            if field is not None:
+                chunks.append(str(kwargs[field]))
+        return "".join(chunks)
+
+
+# Разобранные шаблоны для использования в обработке запросов
+DISCUSSION_SYSTEM_TEMPLATE = CompiledPrompt(DISCUSSION_SYSTEM_PROMPT)
+GENERAL_CONSULTATION_SYSTEM_TEMPLATE = CompiledPrompt(GENERAL_CONSULTATION_SYSTEM_PROMPT)
+GENERAL_CONSULTATION_TEMPLATE = CompiledPrompt(GENERAL_CONSULTATION_PROMPT)
+DISCUSSION_ANSWER_TEMPLATE = CompiledPrompt(DISCUSSION_ANSWER_PROMPT)
+INCORRECT_ANSWER_GUIDANCE_TEMPLATE = CompiledPrompt(INCORRECT_ANSWER_GUIDANCE_PROMPT)
+EXPLANATION_AFTER_ATTEMPTS_TEMPLATE = CompiledPrompt(EXPLANATION_AFTER_ATTEMPTS_PROMPT)
+
+# Системный промпт обсуждения задачи, разделенный по месту вопроса студента:
+# начало зависит только от задачи и повторяется на каждом шаге диалога
+_DISCUSSION_PROMPT_HEAD, _, _DISCUSSION_PROMPT_TAIL = DISCUSSION_SYSTEM_PROMPT.partition("{student_question}")
+_DISCUSSION_HEAD_TEMPLATE = CompiledPrompt(_DISCUSSION_PROMPT_HEAD)
+
+
+@lru_cache(maxsize=512)
+def _discussion_prompt_head(concept_name: str, concept_definition: str,
+                            task_question: str, chapter_context: str) -> str:
+    """
+    Начало системного промпта обсуждения задачи (кэшируется)
+    """
+    return _DISCUSSION_HEAD_TEMPLATE.format(
+        concept_name=concept_name,
+        concept_definition=concept_definition,
+        task_question=task_question,
+        chapter_context=chapter_context
+    )
+
+
+def split_discussion_system_prompt(concept_name: str, concept_definition: str, task_question: str,
+                                   chapter_context: str, student_question: str) -> Tuple[str, str]:
+    """
+    Системный промпт обсуждения задачи, разделенный на постоянную и изменяемую части
+    
+    Постоянная часть зависит только от задачи и одинакова (побайтово) на всех
+    шагах диалога, поэтому может кэшироваться на стороне провайдера модели.
+    
+    Args:
+        concept_name: Название понятия
+        concept_definition: Определение понятия
+        task_question: Вопрос задачи
+        chapter_context: Контекст главы
+        student_question: Вопрос студента
+        
+    Returns:
+        Кортеж (часть до вопроса студента, вопрос студента с окончанием промпта)
+    """
+    head = _discussion_prompt_head(concept_name, concept_definition, task_question, chapter_context)
+    return head, student_question + _DISCUSSION_PROMPT_TAIL
+
+
+def build_discussion_system_prompt(concept_name: str, concept_definition: str, task_question: str,
+                                   chapter_context: str, student_question: str) -> str:
+    """
+    Системный промпт обсуждения задачи
+    
+    Результат совпадает с DISCUSSION_SYSTEM_TEMPLATE.format(...), но часть промпта
+    до вопроса студента собирается один раз для каждой задачи.
+    
+    Args:
+        concept_name: Название понятия
+        concept_definition: Определение понятия
+        task_question: Вопрос задачи
+        chapter_context: Контекст главы
+        student_question: Вопрос студента
+        
+    Returns:
+        Готовый текст системного промпта
+    """
+    return "".join(split_discussion_system_prompt(
+        concept_name, concept_definition, task_question, chapter_context, student_question
+    ))
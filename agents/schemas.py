@@ -0,0 +1,63 @@
+"""
+Схемы данных, возвращаемых моделью через OpenRouter API.
+
+Ответы модели приводятся к этим схемам один раз сразу после получения,
+значения по умолчанию задаются декларативно в моделях.
+"""
+from typing import Any, List, Optional, Union
+
+from pydantic import BaseModel, ConfigDict, model_validator
+
+
+class TaskOption(BaseModel):
+    """
+    Вариант ответа шаблонной задачи
+    """
+    model_config = ConfigDict(extra="allow")
+
+    label: str
+    text: str = ""
+    is_correct: bool = False
+    explanation: str = ""
+
+
+class GeneratedTask(BaseModel):
+    """
+    Задача, сгенерированная моделью (или заглушка)
+    """
+    model_config = ConfigDict(extra="allow")
+
+    question: str
+    task_type: str
+    difficulty: str = ""
+    concept_name: str = ""
+    options: List[TaskOption] = []
+    criteria: List[Any] = []
+    hints: List[Any] = []
+
+
+class CheckResult(BaseModel):
+    """
+    Результат проверки ответа студента моделью
+    """
+    model_config = ConfigDict(extra="allow")
+
+    is_correct: bool = False
+    score: Optional[Union[int, float]] = None
+    explanation: str = ""
+    feedback: str = ""
+    recommendations: List[Any] = []
+    next_steps: List[Any] = []
+
+    @model_validator(mode="after")
+    def _fill_defaults(self) -> "CheckResult":
+        """
+        Заполнение отсутствующих полей: отзыв берется из пояснения,
+        оценка по 10-балльной шкале - по правильности ответа
+        """
+        if not self.feedback and self.explanation:
+            self.feedback = self.explanation
+        if self.score is None:
+            # Если ответ правильный, даем оценку 7, иначе 4
+            self.score = 7 if self.is_correct else 4
+        return self
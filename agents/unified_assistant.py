@@ -9,11 +9,14 @@
 """
 import logging
 import asyncio
-import traceback
 import re
-from typing import Dict, List, Any, Optional, Set, Union
+from typing import Any, Callable, Dict, Hashable, List, Optional, Union
 
+from ai_tutor.agents.answer_cache import AnswerCache, load_projection, lookup_cached_answer
+from ai_tutor.agents.interaction_log import InteractionLogWriter, get_shared_log_writer
+from ai_tutor.agents.definitions.tutor_assistant import _INVALID_QUESTION_ANSWER, _is_invalid_question
 from ai_tutor.database.neo4j_client import Neo4jClient
+from ai_tutor.database.query_cache import QueryCache, MISSING
 # Проверяем доступность SentenceTransformer
 try:
     from sentence_transformers import SentenceTransformer
@@ -23,19 +26,30 @@ except ImportError:
     logging.getLogger(__name__).warning("Не удалось импортировать sentence_transformers. Будет использоваться текстовый поиск.")
 
 from ai_tutor.database.enhanced_search import EnhancedCourseSearch, FallbackSearch
-from ai_tutor.api.openrouter import OpenRouterClient
-from ai_tutor.config.settings import COURSE_NAME, CHAPTERS
+from ai_tutor.api.openrouter import OpenRouterClient, system_message
+from ai_tutor.config.settings import COURSE_NAME, CHAPTERS, EMBEDDING_PCA_PATH, LLM_ROUTES
 from ai_tutor.agents.prompts.tutor_assistant_prompt import (
-    DISCUSSION_SYSTEM_PROMPT,
-    DISCUSSION_ANSWER_PROMPT,
-    INCORRECT_ANSWER_GUIDANCE_PROMPT,
-    EXPLANATION_AFTER_ATTEMPTS_PROMPT,
-    GENERAL_CONSULTATION_SYSTEM_PROMPT,
-    GENERAL_CONSULTATION_PROMPT
+    split_discussion_system_prompt,
+    DISCUSSION_ANSWER_TEMPLATE,
+    INCORRECT_ANSWER_GUIDANCE_TEMPLATE,
+    EXPLANATION_AFTER_ATTEMPTS_TEMPLATE,
+    GENERAL_CONSULTATION_SYSTEM_TEMPLATE,
+    GENERAL_CONSULTATION_TEMPLATE
 )
 
 logger = logging.getLogger(__name__)
 
+# Параметры кэшей понятий и глав: граф знаний во время работы почти не меняется
+CONCEPT_CACHE_SIZE = 2048
+CHAPTER_CACHE_SIZE = 512
+LOOKUP_CACHE_TTL = 300  # 5 минут
+# Параметры кэша ответов на вопросы по задачам
+ANSWER_CACHE_SIZE = 1024
+ANSWER_CACHE_THRESHOLD = 0.92
+
+# Список глав курса для системного промпта (не меняется между запросами)
+_CHAPTERS_LIST = "\n".join(f"- {chapter}" for chapter in CHAPTERS)
+
 
 class UnifiedAssistant:
     """
@@ -58,17 +72,32 @@ class UnifiedAssistant:
     способ обработки и генерации ответа.
     """
     
-    def __init__(self, neo4j_client: Neo4jClient, openrouter_client: OpenRouterClient):
+    def __init__(self, neo4j_client: Neo4jClient, openrouter_client: OpenRouterClient,
+                 log_writer: Optional[InteractionLogWriter] = None):
         """
         Инициализация универсального агента
         
         Args:
             neo4j_client: Клиент для работы с Neo4j
             openrouter_client: Клиент для работы с OpenRouter API
+            log_writer: Очередь записи взаимодействий (по умолчанию - общая для процесса)
         """
         self.neo4j_client = neo4j_client
         self.openrouter_client = openrouter_client
         
+        # Кэши результатов запросов понятий и глав к Neo4j
+        self._concept_cache = QueryCache("unified_concepts", CONCEPT_CACHE_SIZE, LOOKUP_CACHE_TTL)
+        self._chapter_cache = QueryCache("unified_chapters", CHAPTER_CACHE_SIZE, LOOKUP_CACHE_TTL)
+        
+        # Кэш ответов на вопросы по задачам (точное и семантическое совпадение вопроса)
+        self._answer_cache = AnswerCache(
+            max_size=ANSWER_CACHE_SIZE, threshold=ANSWER_CACHE_THRESHOLD,
+            projection=load_projection(EMBEDDING_PCA_PATH)
+        )
+        
+        # Очередь взаимодействий для записи в Neo4j пакетами (общая для всех помощников)
+        self._log_writer = log_writer if log_writer is not None else get_shared_log_writer()
+        
         # Инициализация улучшенного поиска
         try:
             logger.info("Инициализация улучшенного семантического поиска с векторными embeddings...")
@@ -112,14 +141,109 @@ class UnifiedAssistant:
             self.enhanced_search = FallbackSearch()
             logger.info("Инициализирована заглушка для текстового поиска из-за ValueError")
         except Exception as e:
-            logger.error(f"Непредвиденная ошибка при инициализации улучшенного поиска: {str(e)}")
-            logger.error(traceback.format_exc())
+            logger.exception("Непредвиденная ошибка при инициализации улучшенного поиска: %s", e)
             logger.warning("Будет использован текстовый поиск (заглушка)")
             self.use_enhanced_search = False
             # Используем заглушку FallbackSearch
             self.enhanced_search = FallbackSearch()
             logger.info("Инициализирована заглушка для текстового поиска из-за неизвестной ошибки")
     
+    # --- КЭШИРОВАНИЕ ЗАПРОСОВ К NEO4J ---
+    
+    async def _cached(self, cache: QueryCache, key: Hashable, func: Callable, *args) -> Any:
+        """
+        Получение результата запроса из кэша или выполнение запроса в отдельном потоке
+        
+        Пустой результат тоже кэшируется, чтобы не повторять запрос
+        для отсутствующих понятий.
+        
+        Args:
+            cache: Кэш для хранения результата
+            key: Ключ кэша
+            func: Синхронная функция запроса к Neo4j
+            *args: Аргументы функции
+            
+        Returns:
+            Результат запроса
+        """
+        value = cache.get(key)
+        if value is MISSING:
+            value = await asyncio.to_thread(func, *args)
+            cache.set(key, value)
+        return value
+    
+    async def _get_concept(self, concept_name: str, chapter_title: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Получение понятия по названию с учетом кэша
+        
+        Args:
+            concept_name: Название понятия
+            chapter_title: Название главы (для контекстных определений)
+            
+        Returns:
+            Понятие с определением
+        """
+        return await self._cached(
+            self._concept_cache, (concept_name, chapter_title),
+            self.neo4j_client.get_concept_by_name, concept_name, chapter_title
+        )
+    
+    async def _get_chapter_info(self, chapter_title: str) -> Dict[str, Any]:
+        """
+        Получение информации о главе с учетом кэша
+        
+        Args:
+            chapter_title: Название главы
+            
+        Returns:
+            Информация о главе
+        """
+        return await self._cached(
+            self._chapter_cache, chapter_title, self.neo4j_client.get_chapter_info, chapter_title
+        )
+    
+    async def _find_chapter_info(self, chapter_title: Optional[str]) -> Optional[Dict[str, Any]]:
+        """
+        Получение информации о главе без выброса исключений
+        
+        Args:
+            chapter_title: Название главы (опционально)
+            
+        Returns:
+            Информация о главе или None, если глава не указана или запрос не удался
+        """
+        if not chapter_title:
+            return None
+        try:
+            return await self._get_chapter_info(chapter_title)
+        except Exception as e:
+            logger.warning("Ошибка при получении информации о главе %s: %s", chapter_title, e)
+            return None
+    
+    def _get_chapter_info_sync(self, chapter_title: str) -> Dict[str, Any]:
+        """
+        Получение информации о главе с учетом кэша из синхронного кода
+        
+        Args:
+            chapter_title: Название главы
+            
+        Returns:
+            Информация о главе
+        """
+        value = self._chapter_cache.get(chapter_title)
+        if value is MISSING:
+            value = self.neo4j_client.get_chapter_info(chapter_title)
+            self._chapter_cache.set(chapter_title, value)
+        return value
+    
+    def invalidate_caches(self) -> None:
+        """
+        Сброс кэшей понятий и глав (вызывается после изменения графа знаний)
+        """
+        self._concept_cache.invalidate()
+        self._chapter_cache.invalidate()
+        self._answer_cache.invalidate()
+    
     # --- ОСНОВНЫЕ ПУБЛИЧНЫЕ МЕТОДЫ ---
     
     async def answer_question(self, question: str, 
@@ -138,8 +262,14 @@ class UnifiedAssistant:
         Returns:
             Ответ на вопрос
         """
+        # Некорректные вопросы отклоняются до обращения к Neo4j и модели
+        # (пустой вопрос обрабатывается в методах ниже)
+        if _is_invalid_question(question):
+            logger.warning("Некорректный вопрос отклонен")
+            return _INVALID_QUESTION_ANSWER
+        
         try:
-            logger.info(f"Получен вопрос: '{question[:50]}...'")
+            logger.info("Получен вопрос: '%.50s...'", question)
             
             # Определяем тип запроса на основе контекста
             if context and (context.get('task_question') or context.get('concept_name')):
@@ -165,18 +295,14 @@ class UnifiedAssistant:
                 if context is not None and 'concept_name' in context:
                     concept_name = context.get('concept_name')
                 
-                self.log_interaction(
-                    student_id=student_id,
-                    question=question,
-                    answer=answer,
-                    concept_name=concept_name,
-                    chapter_title=chapter_title
-                )
+                # Запись в Neo4j выполняется в фоне пакетами и не задерживает ответ
+                if not self._log_writer.put(student_id, question, answer, chapter_title):
+                    logger.warning("Взаимодействие по понятию %s не сохранено", concept_name)
             
             return answer
             
         except Exception as e:
-            logger.error(f"Ошибка при ответе на вопрос: {str(e)}\n{traceback.format_exc()}")
+            logger.exception("Ошибка при ответе на вопрос: %s", e)
             return "Произошла ошибка при обработке вашего вопроса. Пожалуйста, попробуйте еще раз позже."
 
     def answer_question_sync(self, question: str, 
@@ -211,9 +337,11 @@ class UnifiedAssistant:
                     )
                 )
             finally:
+                # Дожидаемся фоновой записи взаимодействий перед закрытием цикла
+                loop.run_until_complete(self._log_writer.close())
                 loop.close()
         except Exception as e:
-            logger.error(f"Ошибка в синхронной обертке answer_question_sync: {str(e)}\n{traceback.format_exc()}")
+            logger.exception("Ошибка в синхронной обертке answer_question_sync: %s", e)
             return "Произошла ошибка при обработке вашего вопроса. Пожалуйста, попробуйте еще раз позже."
     
     async def provide_guidance_after_incorrect_answer(self, 
@@ -235,7 +363,7 @@ class UnifiedAssistant:
             # Формируем сообщения для модели
             messages = [
                 {"role": "system", "content": "Ты - опытный педагог, помогающий студентам разобраться в ошибках."},
-                {"role": "user", "content": INCORRECT_ANSWER_GUIDANCE_PROMPT.format(
+                {"role": "user", "content": INCORRECT_ANSWER_GUIDANCE_TEMPLATE.format(
                     student_answer=student_answer,
                     correct_answer=correct_answer,
                     concept_name=concept_name
@@ -243,14 +371,16 @@ class UnifiedAssistant:
             ]
             
             # Отправляем запрос к модели
-            response = await self.openrouter_client.generate_completion(messages, temperature=0.7)
-            guidance = response["choices"][0]["message"]["content"]
+            response = await self.openrouter_client.generate_completion_batched(
+                messages, temperature=0.7, **LLM_ROUTES["guidance"]
+            )
+            guidance = response.content
             
             logger.info(f"Сгенерирована подсказка после неправильного ответа для понятия {concept_name}")
             return guidance
             
         except Exception as e:
-            logger.error(f"Ошибка при генерации подсказки: {str(e)}\n{traceback.format_exc()}")
+            logger.exception("Ошибка при генерации подсказки: %s", e)
             return "Произошла ошибка при анализе вашего ответа. Попробуйте ещё раз или задайте вопрос."
     
     async def explain_after_multiple_attempts(self, 
@@ -271,8 +401,9 @@ class UnifiedAssistant:
             Подробное объяснение
         """
         try:
-            # Получаем информацию о понятии
-            concept = self.neo4j_client.get_concept_by_name(concept_name, chapter_title)
+            # Получаем информацию о понятии (запрос к Neo4j в отдельном потоке,
+            # чтобы не блокировать цикл событий)
+            concept = await self._get_concept(concept_name, chapter_title)
             
             if not concept:
                 logger.warning(f"Не найдено понятие: {concept_name}")
@@ -283,7 +414,7 @@ class UnifiedAssistant:
             # Формируем сообщения для модели
             messages = [
                 {"role": "system", "content": "Ты - опытный преподаватель, объясняющий сложные понятия доступным языком."},
-                {"role": "user", "content": EXPLANATION_AFTER_ATTEMPTS_PROMPT.format(
+                {"role": "user", "content": EXPLANATION_AFTER_ATTEMPTS_TEMPLATE.format(
                     concept_name=concept_name,
                     concept_definition=concept_definition,
                     task_question=task_question,
@@ -292,14 +423,16 @@ class UnifiedAssistant:
             ]
             
             # Отправляем запрос к модели
-            response = await self.openrouter_client.generate_completion(messages, temperature=0.7, max_tokens=1500)
-            explanation = response["choices"][0]["message"]["content"]
+            response = await self.openrouter_client.generate_completion_batched(
+                messages, temperature=0.7, **LLM_ROUTES["explanation"]
+            )
+            explanation = response.content
             
             logger.info(f"Сгенерировано подробное объяснение для понятия {concept_name}")
             return explanation
             
         except Exception as e:
-            logger.error(f"Ошибка при генерации объяснения: {str(e)}\n{traceback.format_exc()}")
+            logger.exception("Ошибка при генерации объяснения: %s", e)
             return "Произошла ошибка при подготовке объяснения. Пожалуйста, обратитесь к преподавателю."
     
     # --- ВНУТРЕННИЕ МЕТОДЫ ОБРАБОТКИ ЗАПРОСОВ ---
@@ -322,7 +455,8 @@ class UnifiedAssistant:
                 logger.info(f"Выполняется УЛУЧШЕННЫЙ семантический поиск для запроса: '{query[:50]}...'")
                 
                 # Используем улучшенный поиск с ранжированием
-                results = self.enhanced_search.semantic_search_with_ranking(
+                results = await asyncio.to_thread(
+                    self.enhanced_search.semantic_search_with_ranking,
                     query=query,
                     limit=limit,
                     threshold=threshold
@@ -336,8 +470,7 @@ class UnifiedAssistant:
                 
                 return results
             except Exception as e:
-                logger.error(f"Ошибка в улучшенном поиске: {str(e)}")
-                logger.error(traceback.format_exc())
+                logger.exception("Ошибка в улучшенном поиске: %s", e)
                 # Если произошла ошибка, используем резервный базовый поиск
                 logger.info("Переключаемся на стандартный поиск из-за ошибки")
                 return await self._fallback_standard_search(query, limit, threshold)
@@ -359,7 +492,8 @@ class UnifiedAssistant:
             Список релевантных понятий/документов
         """
         try:
-            results = self.neo4j_client.semantic_search(
+            results = await asyncio.to_thread(
+                self.neo4j_client.semantic_search,
                 query=query,
                 limit=limit,
                 min_similarity=threshold
@@ -367,8 +501,7 @@ class UnifiedAssistant:
             logger.info(f"Стандартный семантический поиск вернул {len(results)} результатов")
             return results
         except Exception as e:
-            logger.error(f"Ошибка в стандартном поиске: {str(e)}")
-            logger.error(traceback.format_exc())
+            logger.exception("Ошибка в стандартном поиске: %s", e)
             return []
     
     async def _answer_by_keywords(self, question: str, chapter_title: Optional[str] = None) -> str:
@@ -388,7 +521,7 @@ class UnifiedAssistant:
             logger.info(f"Извлечены ключевые слова: {', '.join(keywords)}")
             
             # 2. Ищем релевантные понятия
-            concepts = self.neo4j_client.search_concepts_by_keywords(keywords, chapter_title)
+            concepts = await asyncio.to_thread(self.neo4j_client.search_concepts_by_keywords, keywords, chapter_title)
             
             if not concepts:
                 logger.warning(f"Не найдено понятий по запросу: {question}")
@@ -397,7 +530,8 @@ class UnifiedAssistant:
             logger.info(f"Найдено {len(concepts)} релевантных понятий")
             
             # 3. Формируем контекст
-            context = self._build_concept_context(concepts, chapter_title)
+            # (построение контекста обращается к Neo4j, поэтому выполняется в отдельном потоке)
+            context = await asyncio.to_thread(self._build_concept_context, concepts, chapter_title)
             
             # 4. Генерируем ответ с помощью LLM
             messages = [
@@ -416,13 +550,13 @@ class UnifiedAssistant:
             
             # Отправляем запрос к API
             response = await self.openrouter_client.generate_completion(messages, temperature=0.3)
-            answer = response["choices"][0]["message"]["content"]
+            answer = response.content
             
             logger.info(f"Сгенерирован ответ на вопрос: {question[:50]}...")
             return answer
             
         except Exception as e:
-            logger.error(f"Ошибка при ответе на вопрос: {str(e)}\n{traceback.format_exc()}")
+            logger.exception("Ошибка при ответе на вопрос: %s", e)
             return "Произошла ошибка при обработке вашего вопроса. Пожалуйста, попробуйте еще раз позже."
     
     async def _discuss_task(self, 
@@ -449,21 +583,33 @@ class UnifiedAssistant:
                 
                 # Попробуем получить информацию о главе
                 chapter_info_text = ""
-                if chapter_title:
-                    try:
-                        chapter_info = self.neo4j_client.get_chapter_info(chapter_title)
-                        if chapter_info:
-                            chapter_info_text = f"\n\nМы обсуждаем главу '{chapter_title}'. "
-                            if 'main_ideas' in chapter_info:
-                                chapter_info_text += f"Основные идеи главы: {chapter_info['main_ideas']}"
-                    except Exception as e:
-                        logger.warning(f"Ошибка при получении информации о главе: {str(e)}")
+                chapter_info = await self._find_chapter_info(chapter_title)
+                if chapter_info:
+                    chapter_info_text = f"\n\nМы обсуждаем главу '{chapter_title}'. "
+                    if 'main_ideas' in chapter_info:
+                        chapter_info_text += f"Основные идеи главы: {chapter_info['main_ideas']}"
                 
                 return (f"Я не могу определить, о каком понятии идет речь. "
                         f"Пожалуйста, уточните название понятия, которое вы хотите обсудить.{chapter_info_text}")
             
-            # Получаем информацию о понятии
-            concept = self.neo4j_client.get_concept_by_name(concept_name, chapter_title)
+            # Разные студенты часто задают по одной задаче одни и те же вопросы
+            # в разных формулировках: сначала ищем готовый ответ (точное совпадение,
+            # затем по эмбеддингу), сравнивая только вопросы в этом же контексте
+            cache_context = (concept_name, task_question, chapter_title)
+            cached_answer, embedding = await lookup_cached_answer(
+                self._answer_cache, self.openrouter_client, student_question, cache_context
+            )
+            if cached_answer is not None:
+                logger.info("Ответ на вопрос по задаче взят из кэша")
+                return cached_answer
+            
+            # Информацию о понятии и о главе запрашиваем одновременно, по одному разу
+            # (запросы к Neo4j в отдельных потоках, чтобы не блокировать цикл событий);
+            # ошибка получения главы не прерывает обсуждение
+            concept, chapter_info = await asyncio.gather(
+                self._get_concept(concept_name, chapter_title),
+                self._find_chapter_info(chapter_title)
+            )
             
             if not concept:
                 logger.warning(f"Не найдено понятие: {concept_name}")
@@ -471,18 +617,13 @@ class UnifiedAssistant:
             
             concept_definition = concept.get('definition', 'Определение отсутствует')
             
-            # Получаем контекст главы, если указана
+            # Контекст главы, если указана
             chapter_context = "Информация о главе отсутствует."
-            if chapter_title:
-                try:
-                    chapter_info = self.neo4j_client.get_chapter_info(chapter_title)
-                    if chapter_info:
-                        chapter_context = (
-                            f"Название главы: {chapter_title}\n"
-                            f"Основные идеи: {chapter_info.get('main_ideas', 'Не указаны')}\n"
-                        )
-                except Exception as e:
-                    logger.warning(f"Ошибка при получении информации о главе {chapter_title}: {str(e)}")
+            if chapter_info:
+                chapter_context = (
+                    f"Название главы: {chapter_title}\n"
+                    f"Основные идеи: {chapter_info.get('main_ideas', 'Не указаны')}\n"
+                )
             
             # Определяем максимальное количество токенов для первой попытки
             context_size = len(concept_definition) + len(chapter_context) + len(task_question) + len(student_question)
@@ -495,25 +636,29 @@ class UnifiedAssistant:
             # Добавляем инструкцию о необходимости развернутого ответа
             completion_instruction = "\n\nВАЖНО: Предоставь полный, развернутый ответ, который детально объясняет понятие и его связь с вопросом студента. Используй примеры и будь информативным."
             
-            # Формируем системный промпт
-            system_prompt = DISCUSSION_SYSTEM_PROMPT.format(
+            # Формируем системный промпт; основная часть не меняется между попытками,
+            # а часть до вопроса студента - и между шагами обсуждения задачи
+            # (ее обработка кэшируется провайдером)
+            prompt_head, prompt_tail = split_discussion_system_prompt(
                 concept_name=concept_name,
                 concept_definition=concept_definition,
                 task_question=task_question,
                 chapter_context=chapter_context,
                 student_question=student_question
-            ) + completion_instruction
+            )
             
             # Формируем сообщения для модели
             messages = [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": DISCUSSION_ANSWER_PROMPT.format(student_question=student_question)}
+                system_message(prompt_head, prompt_tail + completion_instruction),
+                {"role": "user", "content": DISCUSSION_ANSWER_TEMPLATE.format(student_question=student_question)}
             ]
             
             # Отправляем запрос к модели с возможностью повторных попыток
             max_attempts = 3  # Максимальное количество попыток
             current_attempt = 0
             answer = ""
+            # В кэш сохраняется только полноценный ответ модели
+            answer_complete = False
             
             while current_attempt < max_attempts:
                 current_attempt += 1
@@ -521,13 +666,13 @@ class UnifiedAssistant:
                 
                 try:
                     # Отправляем запрос к модели
-                    response = await self.openrouter_client.generate_completion(messages, temperature=0.7, max_tokens=max_tokens)
-                    answer = response["choices"][0]["message"]["content"]
+                    response = await self.openrouter_client.generate_completion_batched(messages, temperature=0.7, max_tokens=max_tokens)
+                    answer = response.content
                     
                     # Логируем информацию об ответе
-                    completion_tokens = response["usage"]["completion_tokens"]
-                    total_tokens = response["usage"]["total_tokens"]
-                    finish_reason = response["choices"][0]["finish_reason"]
+                    completion_tokens = response.usage.get("completion_tokens")
+                    total_tokens = response.usage.get("total_tokens")
+                    finish_reason = response.finish_reason
                     
                     logger.info(f"Сгенерирован ответ длиной {len(answer)} символов ({completion_tokens} токенов)")
                     logger.info(f"Завершено по причине: {finish_reason}, всего токенов: {total_tokens}")
@@ -540,16 +685,8 @@ class UnifiedAssistant:
                         # Модифицируем промпт для получения более полного ответа
                         completion_instruction = "\n\nКРИТИЧЕСКИ ВАЖНО: Предыдущий ответ был неполным. Необходимо дать МАКСИМАЛЬНО ДЕТАЛЬНЫЙ И РАЗВЕРНУТЫЙ ответ, с объяснением понятия и его применения в контексте вопроса студента."
                         
-                        system_prompt = DISCUSSION_SYSTEM_PROMPT.format(
-                            concept_name=concept_name,
-                            concept_definition=concept_definition,
-                            task_question=task_question,
-                            chapter_context=chapter_context,
-                            student_question=student_question
-                        ) + completion_instruction
-                        
                         messages = [
-                            {"role": "system", "content": system_prompt},
+                            system_message(prompt_head, prompt_tail + completion_instruction),
                             {"role": "user", "content": f"Пожалуйста, ответь РАЗВЕРНУТО на вопрос: {student_question}. Объясни понятие {concept_name} и его связь с вопросом."}
                         ]
                         
@@ -560,11 +697,11 @@ class UnifiedAssistant:
                         answer += "\n\n(Ответ был ограничен по размеру. Чтобы получить дополнительную информацию, задайте уточняющий вопрос.)"
                     
                     # Если ответ удовлетворительный, выходим из цикла
+                    answer_complete = True
                     break
                     
                 except Exception as e:
-                    logger.error(f"Ошибка при генерации ответа на задачу (попытка {current_attempt}): {str(e)}")
-                    logger.error(traceback.format_exc())
+                    logger.exception("Ошибка при генерации ответа на задачу (попытка %s): %s", current_attempt, e)
                     # Если это последняя попытка, устанавливаем сообщение об ошибке
                     if current_attempt == max_attempts:
                         answer = "Извините, произошла ошибка при генерации ответа. Пожалуйста, попробуйте задать вопрос иначе."
@@ -589,10 +726,12 @@ class UnifiedAssistant:
                 warning_msg = "Внимание: ответ получился очень объемным и будет отображаться по частям.\n\n"
                 answer = warning_msg + answer
             
+            if answer_complete:
+                self._answer_cache.put(student_question, answer, cache_context, embedding)
             return answer
             
         except Exception as e:
-            logger.error(f"Ошибка при обсуждении задачи: {str(e)}\n{traceback.format_exc()}")
+            logger.exception("Ошибка при обсуждении задачи: %s", e)
             return "Произошла ошибка при обработке вашего вопроса. Пожалуйста, попробуйте еще раз позже."
     
     async def _general_consultation(self, student_question: str, student_id: Optional[str] = None,
@@ -642,12 +781,12 @@ class UnifiedAssistant:
             if relevant_concepts:
                 for concept in relevant_concepts:
                     try:
-                        chapters = self.neo4j_client.get_chapters_for_concept(concept['name'])
+                        chapters = await asyncio.to_thread(self.neo4j_client.get_chapters_for_concept, concept['name'])
                         for chapter in chapters:
                             if chapter not in relevant_chapters:
                                 relevant_chapters.append(chapter)
                                 # Получаем информацию о главе
-                                chapter_info[chapter] = self.neo4j_client.get_chapter_info(chapter)
+                                chapter_info[chapter] = await self._get_chapter_info(chapter)
                     except Exception as e:
                         logger.warning(f"Ошибка при поиске глав для понятия {concept['name']}: {str(e)}")
             
@@ -672,7 +811,7 @@ class UnifiedAssistant:
                     
                     # Добавляем связанные понятия, если есть
                     try:
-                        related = self.neo4j_client.get_related_concepts(concept['name'])
+                        related = await asyncio.to_thread(self.neo4j_client.get_related_concepts, concept['name'])
                         if related:
                             query_context += "   Связанные понятия: "
                             query_context += ", ".join([f"{r['name']} ({r.get('relation_type', 'связано с')})" for r in related])
@@ -709,18 +848,19 @@ class UnifiedAssistant:
             # Добавляем инструкцию о длине в системный промпт
             completion_instruction = "\n\nВАЖНО: Предоставь полный, развернутый ответ с детальным объяснением понятий и их взаимосвязей. Ответ должен быть структурированным и информативным."
             
-            # 4. Формируем системный промпт
-            system_prompt = GENERAL_CONSULTATION_SYSTEM_PROMPT.format(
+            # 4. Формируем системный промпт; основная часть не меняется между попытками
+            base_system_prompt = GENERAL_CONSULTATION_SYSTEM_TEMPLATE.format(
                 course_name=COURSE_NAME,
-                chapters_list="\n".join([f"- {chapter}" for chapter in CHAPTERS]),
+                chapters_list=_CHAPTERS_LIST,
                 query_context=query_context,
                 student_question=student_question
-            ) + completion_instruction
+            )
+            system_prompt = base_system_prompt + completion_instruction
             
             # 5. Формируем сообщения для модели
             messages = [
                 {"role": "system", "content": system_prompt},
-                {"role": "user", "content": GENERAL_CONSULTATION_PROMPT.format(student_question=student_question)}
+                {"role": "user", "content": GENERAL_CONSULTATION_TEMPLATE.format(student_question=student_question)}
             ]
             
             # 6. Отправляем запрос к модели с возможностью повторных попыток
@@ -735,12 +875,12 @@ class UnifiedAssistant:
                 try:
                     # Отправляем запрос к модели
                     response = await self.openrouter_client.generate_completion(messages, temperature=0.7, max_tokens=max_tokens)
-                    answer = response["choices"][0]["message"]["content"]
+                    answer = response.content
                     
                     # Логируем информацию об ответе
-                    completion_tokens = response["usage"]["completion_tokens"]
-                    total_tokens = response["usage"]["total_tokens"]
-                    finish_reason = response["choices"][0]["finish_reason"]
+                    completion_tokens = response.usage.get("completion_tokens")
+                    total_tokens = response.usage.get("total_tokens")
+                    finish_reason = response.finish_reason
                     
                     logger.info(f"Сгенерирован ответ длиной {len(answer)} символов ({completion_tokens} токенов)")
                     logger.info(f"Завершено по причине: {finish_reason}, всего токенов: {total_tokens}")
@@ -753,12 +893,7 @@ class UnifiedAssistant:
                         # Модифицируем промпт для получения более полного ответа
                         completion_instruction = "\n\nКРИТИЧЕСКИ ВАЖНО: Предыдущий ответ был неполным. Твоя задача - дать МАКСИМАЛЬНО ПОЛНЫЙ И РАЗВЕРНУТЫЙ ответ, минимум 500-1000 слов. Объясни все понятия подробно, с примерами и взаимосвязями."
                         
-                        system_prompt = GENERAL_CONSULTATION_SYSTEM_PROMPT.format(
-                            course_name=COURSE_NAME,
-                            chapters_list="\n".join([f"- {chapter}" for chapter in CHAPTERS]),
-                            query_context=query_context,
-                            student_question=student_question
-                        ) + completion_instruction
+                        system_prompt = base_system_prompt + completion_instruction
                         
                         messages = [
                             {"role": "system", "content": system_prompt},
@@ -775,8 +910,7 @@ class UnifiedAssistant:
                     break
                     
                 except Exception as e:
-                    logger.error(f"Ошибка при генерации ответа (попытка {current_attempt}): {str(e)}")
-                    logger.error(traceback.format_exc())
+                    logger.exception("Ошибка при генерации ответа (попытка %s): %s", current_attempt, e)
                     # Если это последняя попытка, устанавливаем сообщение об ошибке
                     if current_attempt == max_attempts:
                         answer = "Извините, произошла ошибка при генерации ответа. Пожалуйста, попробуйте переформулировать вопрос или задать его позже."
@@ -812,7 +946,7 @@ class UnifiedAssistant:
             return answer
             
         except Exception as e:
-            logger.error(f"Ошибка при общей консультации: {str(e)}\n{traceback.format_exc()}")
+            logger.exception("Ошибка при общей консультации: %s", e)
             return "Произошла ошибка при обработке вашего вопроса. Пожалуйста, попробуйте еще раз позже."
     
     def _extract_keywords(self, question: str) -> List[str]:
@@ -892,7 +1026,7 @@ class UnifiedAssistant:
         # Добавляем информацию о главе, если указана
         if chapter_title:
             try:
-                chapter_info = self.neo4j_client.get_chapter_info(chapter_title)
+                chapter_info = self._get_chapter_info_sync(chapter_title)
                 if chapter_info and 'main_ideas' in chapter_info:
                     chapter_text = f"Информация о главе '{chapter_title}':\n"
                     chapter_text += f"Основные идеи: {chapter_info['main_ideas']}\n"
@@ -906,7 +1040,10 @@ class UnifiedAssistant:
                       concept_name: Optional[str] = "Общая консультация",
                       chapter_title: Optional[str] = None) -> None:
         """
-        Сохранение взаимодействия в базе данных
+        Сохранение взаимодействия в базе данных (синхронно)
+        
+        Ответы на вопросы записываются пакетами через очередь; метод оставлен
+        для разовой записи из синхронного кода.
         
         Args:
             student_id: ID студента
@@ -923,9 +1060,9 @@ class UnifiedAssistant:
                 answer=answer,
                 chapter_title=chapter_title
             )
-            logger.info(f"Сохранено взаимодействие для студента {student_id} по понятию {concept_name}")
+            logger.info("Сохранено взаимодействие для студента %s по понятию %s", student_id, concept_name)
         except Exception as e:
-            logger.error(f"Ошибка при логировании взаимодействия: {str(e)}")
+            logger.error("Ошибка при логировании взаимодействия: %s", e)
     
     def close(self) -> None:
         """
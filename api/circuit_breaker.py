@@ -0,0 +1,150 @@
+"""
+Автоматический выключатель (circuit breaker) для вызовов внешних API.
+
+После серии неудачных вызовов выключатель "размыкается" и в течение
+паузы вызовы не выполняются вовсе - вызывающий код сразу использует
+запасной вариант, а не ждет тайм-аута от недоступного сервиса.
+По истечении паузы пропускается один пробный вызов (полуоткрытое
+состояние): при успехе выключатель замыкается, при ошибке пауза
+увеличивается экспоненциально со случайным разбросом.
+"""
+import logging
+import random
+import threading
+import time
+from typing import Any, Dict
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """
+    Вызов отклонен, так как выключатель разомкнут
+    """
+
+
+class CircuitBreaker:
+    """
+    Потокобезопасный автоматический выключатель с состояниями closed/open/half-open
+    """
+
+    def __init__(self, name: str, fail_threshold: int = 5, reset_timeout: float = 60.0,
+                 max_reset_timeout: float = 600.0, jitter: float = 0.1):
+        """
+        Инициализация выключателя
+
+        Args:
+            name: Имя выключателя (используется в логах и статистике)
+            fail_threshold: Количество ошибок подряд, после которого выключатель размыкается
+            reset_timeout: Начальная пауза перед пробным вызовом в секундах
+            max_reset_timeout: Максимальная пауза перед пробным вызовом в секундах
+            jitter: Доля случайного разброса паузы
+        """
+        self.name = name
+        self.fail_threshold = fail_threshold
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self.jitter = jitter
+        self._state = CLOSED
+        self._failures = 0
+        # Количество размыканий подряд (для экспоненциального увеличения паузы)
+        self._open_count = 0
+        self._opened_until = 0.0
+        self._trial_in_progress = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        """
+        Текущее состояние выключателя
+        """
+        return self._state
+
+    def is_open(self) -> bool:
+        """
+        Проверка, нужно ли отклонить вызов
+
+        В полуоткрытом состоянии пропускается только один пробный вызов,
+        остальные отклоняются до получения его результата.
+
+        Returns:
+            True, если вызов выполнять не следует
+        """
+        with self._lock:
+            if self._state == CLOSED:
+                return False
+            if self._state == OPEN:
+                if time.monotonic() < self._opened_until:
+                    return True
+                self._state = HALF_OPEN
+                self._trial_in_progress = False
+                logger.info("Выключатель '%s' переходит в полуоткрытое состояние", self.name)
+            if self._trial_in_progress:
+                return True
+            self._trial_in_progress = True
+            return False
+
+    def record_success(self) -> None:
+        """
+        Регистрация успешного вызова
+        """
+        with self._lock:
+            if self._state != CLOSED:
+                logger.info("Выключатель '%s' замкнут после успешного вызова", self.name)
+            self._state = CLOSED
+            self._failures = 0
+            self._open_count = 0
+            self._trial_in_progress = False
+
+    def record_failure(self) -> None:
+        """
+        Регистрация неудачного вызова (ошибки или тайм-аута)
+        """
+        with self._lock:
+            self._failures += 1
+            if self._state == HALF_OPEN or self._failures >= self.fail_threshold:
+                self._open()
+
+    def release_trial(self) -> None:
+        """
+        Освобождение пробного вызова без результата (например, при его отмене)
+        
+        В полуоткрытом состоянии следующий вызов снова будет пропущен как пробный.
+        """
+        with self._lock:
+            self._trial_in_progress = False
+    
+    def _open(self) -> None:
+        """
+        Размыкание выключателя (вызывается под блокировкой)
+        """
+        self._open_count += 1
+        timeout = min(self.reset_timeout * (2 ** (self._open_count - 1)), self.max_reset_timeout)
+        timeout *= 1 + random.uniform(-self.jitter, self.jitter)
+        self._state = OPEN
+        self._opened_until = time.monotonic() + timeout
+        self._trial_in_progress = False
+        logger.warning(
+            "Выключатель '%s' разомкнут после %d ошибок, пауза %.1f с",
+            self.name, self._failures, timeout
+        )
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Возвращает состояние выключателя
+
+        Returns:
+            Словарь с состоянием выключателя
+        """
+        with self._lock:
+            return {
+                "name": self.name,
+                "state": self._state,
+                "failures": self._failures,
+                "open_count": self._open_count,
+                "retry_in": max(0.0, self._opened_until - time.monotonic()) if self._state == OPEN else 0.0
+            }
@@ -1,18 +1,533 @@
 """
 Модуль для работы с OpenRouter API для доступа к модели Grok
 """
-from typing import Dict, List, Any, Optional
+from typing import AsyncIterator, Dict, Hashable, List, Any, Optional, Set, Tuple
+import asyncio
+import hashlib
 import json
 import logging
 import re
+import threading
+from dataclasses import dataclass
+from functools import lru_cache
 
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
 import httpx
 
-from ai_tutor.config.settings import OPENROUTER_API_KEY, OPENROUTER_API_URL, GROK_MODEL
+from ai_tutor.config.settings import (
+    OPENROUTER_API_KEY, OPENROUTER_API_URL, GROK_MODEL, EMBEDDING_MODEL, REQUEST_TIMEOUT,
+    OPENROUTER_MAX_CONCURRENCY, PROMPT_CACHE_CONTROL
+)
+from ai_tutor.database.query_cache import QueryCache, MISSING
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
 
 logger = logging.getLogger(__name__)
 
+# Параметры пула HTTP-соединений к OpenRouter
+HTTP_POOL_LIMITS = httpx.Limits(
+    max_connections=200,
+    max_keepalive_connections=100,
+    keepalive_expiry=60
+)
+# Тайм-ауты запросов: короткий на установку соединения, общий - на генерацию ответа
+HTTP_TIMEOUT = httpx.Timeout(REQUEST_TIMEOUT, connect=5.0)
+
+# Максимальная пауза между фрагментами потокового ответа, в секундах
+STREAM_IDLE_TIMEOUT = 30
+
+
+
+@dataclass
+class Completion:
+    """
+    Ответ модели, разобранный один раз при получении
+    
+    Attributes:
+        content: Текст ответа
+        finish_reason: Причина завершения генерации ("stop", "length" и т.д.)
+        model: Модель, сгенерировавшая ответ
+        usage: Количество токенов (prompt_tokens, completion_tokens, total_tokens);
+            пустой словарь, если API его не вернул
+    """
+    __slots__ = ("content", "finish_reason", "model", "usage")
+    
+    content: str
+    finish_reason: Optional[str]
+    model: str
+    usage: Dict[str, int]
+
+
+def system_message(prefix: str, suffix: str = "") -> Dict[str, Any]:
+    """
+    Системное сообщение с постоянным началом, кэшируемым на стороне провайдера
+    
+    Начало передается отдельной текстовой частью с пометкой cache_control,
+    поэтому провайдер может повторно использовать результат обработки этого
+    префикса в следующих запросах. Изменяемая часть передается без пометки.
+    При отключенном PROMPT_CACHE_CONTROL сообщение - обычная строка.
+    
+    Args:
+        prefix: Постоянная часть промпта
+        suffix: Изменяемая часть промпта
+        
+    Returns:
+        Сообщение для списка messages
+    """
+    if not PROMPT_CACHE_CONTROL:
+        return {"role": "system", "content": prefix + suffix}
+    
+    content = [{"type": "text", "text": prefix, "cache_control": {"type": "ephemeral"}}]
+    if suffix:
+        content.append({"type": "text", "text": suffix})
+    return {"role": "system", "content": content}
+
+
+def _loads_json(text: str) -> Any:
+    """
+    Разбор JSON из ответа модели
+
+    При наличии orjson используется он, иначе стандартный json. Ошибка разбора
+    в обоих случаях - json.JSONDecodeError (orjson.JSONDecodeError - его подкласс).
+
+    Args:
+        text: Строка с JSON
+
+    Returns:
+        Разобранное значение
+    """
+    if ORJSON_AVAILABLE:
+        return orjson.loads(text)
+    return json.loads(text)
+
+
+_JSON_START_RE = re.compile(r'[\{\[]')
+
+# Ответы длиннее этого порога (в символах) разбираются вне цикла событий
+JSON_OFFLOAD_THRESHOLD = 32000
+
+# Границы JSON в уже разобранных ответах модели по хэшу текста ответа
+_json_span_cache = QueryCache("json_spans", max_size=512)
+
+
+# Декодер для разбора JSON с произвольной позиции текста
+_json_decoder = json.JSONDecoder()
+
+
+def _find_json(text: str) -> Tuple[Optional[Tuple[int, int]], Any]:
+    """
+    Поиск первого корректного JSON-объекта или массива в тексте
+    
+    С каждой открывающей скобки выполняется raw_decode: разбор останавливается
+    на конце первого полного JSON-значения (или на первой ошибке), поэтому
+    текст после JSON и неудачные кандидаты не разбираются целиком.
+    
+    Args:
+        text: Текстовый ответ
+        
+    Returns:
+        Границы найденного JSON в тексте и результат его разбора
+        либо (None, None), если JSON не найден
+    """
+    for match in _JSON_START_RE.finditer(text):
+        start = match.start()
+        try:
+            result, end = _json_decoder.raw_decode(text, start)
+        except json.JSONDecodeError:
+            continue
+        return (start, end), result
+    return None, None
+
+
+def _extract_json(text: str) -> Dict[str, Any]:
+    """
+    Извлечение первого корректного JSON-объекта или массива из текста
+    
+    Для уже встречавшихся ответов границы JSON берутся из кэша по хэшу
+    текста, и выполняется только json.loads найденного фрагмента
+    (каждый вызов возвращает новый объект).
+    
+    Args:
+        text: Текстовый ответ
+        
+    Returns:
+        Словарь из JSON; массив возвращается в поле "data", а если JSON
+        не найден - исходный текст в поле "raw_text"
+    """
+    digest = hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+    span = _json_span_cache.get(digest)
+    if span is MISSING:
+        span, result = _find_json(text)
+        _json_span_cache.set(digest, span)
+    elif span is not None:
+        result = json.loads(text[span[0]:span[1]])
+    
+    if span is None:
+        logger.error("Не удалось извлечь JSON из ответа: %s", text)
+        # Возвращаем пустой словарь с текстовым ответом
+        return {"raw_text": text}
+    return result if isinstance(result, dict) else {"data": result}
+
+
+async def _extract_json_async(text: str) -> Dict[str, Any]:
+    """
+    Асинхронное извлечение JSON из текстового ответа
+    
+    Большие ответы разбираются в отдельном потоке, чтобы поиск
+    и разбор JSON не блокировали цикл событий.
+    
+    Args:
+        text: Текстовый ответ
+        
+    Returns:
+        Результат _extract_json
+    """
+    if len(text) < JSON_OFFLOAD_THRESHOLD:
+        return _extract_json(text)
+    return await asyncio.to_thread(_extract_json, text)
+
+
+# Модель эмбеддингов общая для всех клиентов и загружается при первом обращении
+_embedding_model = None
+_embedding_model_failed = False
+_embedding_model_lock = threading.Lock()
+
+
+def _get_embedding_model():
+    """
+    Получение локальной модели эмбеддингов (загружается один раз на процесс)
+    
+    Returns:
+        Модель SentenceTransformer или None, если модель не задана или не загрузилась
+    """
+    global _embedding_model, _embedding_model_failed
+    if _embedding_model is not None or _embedding_model_failed or not EMBEDDING_MODEL:
+        return _embedding_model
+    with _embedding_model_lock:
+        if _embedding_model is None and not _embedding_model_failed:
+            try:
+                from sentence_transformers import SentenceTransformer
+                _embedding_model = SentenceTransformer(EMBEDDING_MODEL, device="cpu")
+                logger.info("Модель эмбеддингов загружена: %s", EMBEDDING_MODEL)
+            except Exception as e:
+                # Повторно не пытаемся: кэши работают и без семантического совпадения
+                _embedding_model_failed = True
+                logger.warning("Не удалось загрузить модель эмбеддингов %s: %s", EMBEDDING_MODEL, e)
+    return _embedding_model
+
+
+# Системный промпт генерации задач. Текст не меняется между запросами, поэтому,
+# как и промпт проверки, помечен как кэшируемый префикс (см. system_message)
+_TASK_SYSTEM_MESSAGE = system_message(
+    "Ты - ИИ-репетитор для студентов, изучающих курс 'Системное саморазвитие'. "
+    "Твоя задача - создавать учебные задачи для проверки знаний студентов. "
+    "ВАЖНО: В школе системного менеджмента изучение и усвоение понятий - это самое важное. "
+    "Все задачи, которые ты создаешь, должны быть НАЦЕЛЕНЫ НА ПРОВЕРКУ ЗНАНИЙ ПОНЯТИЙ "
+    "и их лучшего усвоения. Сфокусируйся на точном определении и понимании понятий, "
+    "их взаимосвязях и практическом применении. "
+    "Задачи должны быть связаны с понятиями из графа знаний и адаптированы "
+    "под уровень сложности."
+    "\n\nСТРОГИЕ ПРАВИЛА ФОРМАТИРОВАНИЯ:"
+    "\n1. ЗАПРЕЩЕНО использовать в вариантах ответов следующие фразы: 'Неверное определение', 'AI анализ', 'Из главы', 'определение в тексте отсутствует', 'может быть определено'"
+    "\n2. ЗАПРЕЩЕНО включать информацию об источниках определений, ссылки на главы или курс"
+    "\n3. ЗАПРЕЩЕНО включать служебные элементы JSON, теги, метки или подобные технические элементы"
+    "\n4. ЗАПРЕЩЕНО использовать шаблонные заглушки вместо содержательных вариантов ответов"
+    "\n5. Каждый вариант ответа должен быть конкретным, содержательным и завершенным определением"
+    "\n6. Неправильные варианты должны выглядеть правдоподобно, но содержать осмысленные ошибки"
+    "\n\nИспользуй естественный стиль текста без технических артефактов."
+    "\nЗадача должна быть четкой, понятной и профессиональной."
+)
+
+# Системный промпт проверки творческих ответов. Текст не меняется между запросами,
+# поэтому помечен как кэшируемый префикс (см. system_message): провайдеры, поддерживающие
+# кэширование промптов, не обрабатывают его заново для каждого студента
+_CHECK_SYSTEM_MESSAGE = system_message(
+    "Ты - ИИ-репетитор, использующий принципы мотивационного интервьюирования для обратной связи. "
+    "ВАЖНО: Твоя цель - создать поддерживающую, эмпатичную среду, где студент чувствует, что его слышат и ценят. "
+    "Используй эти основные принципы мотивационного интервьюирования:\n"
+    "1. Выражай эмпатию: признавай усилия студента, даже если ответ неверный\n"
+    "2. Развивай несоответствие: мягко указывай на расхождение между тем, что студент знает и что могло бы быть улучшено\n"
+    "3. Избегай споров: не критикуй напрямую, а предлагай альтернативные точки зрения\n"
+    "4. Поддерживай самоэффективность: подчеркивай способность студента улучшить свое понимание\n\n"
+    "Оценивая ответ студента, в первую очередь проверь, насколько глубоко и точно усвоено основное понятие, "
+    "о котором идет речь в задаче. Особое внимание обрати на то, понимает ли студент "
+    "суть понятия, его место в системе знаний и может ли применять его на практике. "
+    "Оцени ответ по 10-балльной шкале, где: "
+    "8-10 баллов - глубокое понимание понятия и его применения; "
+    "5-7 баллов - основное понимание понятия присутствует, но есть неточности; "
+    "1-4 балла - слабое понимание понятия или его неверное применение. "
+    "Твоя цель - дать объективную оценку и конструктивную обратную связь по ответу студента."
+)
+
+
+@lru_cache(maxsize=None)
+def _task_instructions(task_type: str, difficulty: str) -> Tuple[str, str]:
+    """
+    Неизменяемая часть запроса на генерацию задачи
+    
+    Зависит только от типа и сложности задачи, поэтому строится один раз
+    для каждого сочетания и затем берется из кэша.
+    
+    Args:
+        task_type: Тип задачи ("template" или "creative")
+        difficulty: Уровень сложности ("standard" или "advanced")
+        
+    Returns:
+        Описание задачи и инструкции по формату вывода
+    """
+    task_description = ""
+    if task_type == "template":
+        task_description = (
+            "Создай шаблонную задачу с множественным выбором (4 варианта ответа, только один правильный) "
+            "на основе данного понятия. Задача должна проверять именно понимание понятия, "
+            "а не просто факты. Важно, чтобы студент действительно осознал суть понятия и его место "
+            "в системе знаний."
+        )
+        if difficulty == "advanced":
+            task_description += (
+                "Задача должна быть продвинутого уровня, требующей глубокого понимания понятия и его связей. "
+                "Включи связанные понятия в формулировку задачи, чтобы проверить, как студент понимает "
+                "взаимосвязи между разными элементами системы."
+            )
+        else:
+            task_description += (
+                "Задача должна быть стандартного уровня, доступная для понимания. "
+                "Сфокусируйся на основных аспектах понятия и его ключевых характеристиках."
+            )
+    else:  # creative
+        task_description = (
+            "Создай творческую задачу, требующую развёрнутого ответа, "
+            "на основе данного понятия. Задача должна вести к более глубокому усвоению понятия "
+            "через размышление и творческое применение. Важно, чтобы студент не просто запомнил определение, "
+            "а осмыслил понятие и научился использовать его в разных контекстах."
+        )
+        if difficulty == "advanced":
+            task_description += (
+                "Задача должна быть продвинутого уровня, требовать анализа и синтеза информации. "
+                "Включи связанные понятия в формулировку задачи, чтобы студент мог построить "
+                "целостную картину и увидеть, как понятия образуют систему."
+            )
+        else:
+            task_description += (
+                "Задача должна быть стандартного уровня, доступная для понимания. "
+                "Сфокусируйся на практическом применении понятия и его связи с реальными ситуациями."
+            )
+    
+    format_instructions = ""
+    if task_type == "template":
+        format_instructions = """
+                Формат вывода задачи должен быть следующим:
+
+                Сначала задай вопрос о понятии. Затем перечисли варианты ответов в таком формате:
+
+                Варианты ответов:
+                
+                1. [Первый вариант ответа - неверный]
+                2. [Второй вариант ответа - неверный]
+                3. [Третий вариант ответа - правильное определение понятия]
+                4. [Четвертый вариант ответа - неверный]
+                
+                Подсказки:
+                - [Подсказка 1]
+                - [Подсказка 2]
+                
+                Тип: Задача с выбором ответа | Сложность: [Базовый/Продвинутый] уровень
+
+                ВАЖНО:
+                - Один из вариантов должен соответствовать правильному определению понятия
+                - Остальные варианты должны быть правдоподобными, но содержать ошибки или неточности
+                - НИКОГДА не используй в вариантах ответа формулировки "Неверное определение", "AI анализ" и т.п.
+                - НИКОГДА не включай источник определения (глава/курс) или другую служебную информацию
+                - Подсказки должны помогать разобраться в сути понятия, не раскрывая ответ напрямую
+                """
+    else:  # creative
+        format_instructions = """
+                Формат вывода задачи должен быть следующим:
+
+                Сначала сформулируй вопрос или творческое задание по понятию. Затем напиши критерии оценки и пример ответа:
+                
+                Критерии оценки:
+                - [Критерий 1 для оценки ответа]
+                - [Критерий 2]
+                - [Критерий 3]
+                
+                Пример хорошего ответа:
+                [Пример ответа на задание]
+                
+                Подсказки:
+                - [Подсказка 1]
+                - [Подсказка 2]
+                
+                Тип: Творческая задача | Сложность: [Базовый/Продвинутый] уровень
+                
+                ВАЖНО:
+                - Задание должно требовать от студента демонстрации понимания понятия
+                - Критерии должны быть конкретными и измеримыми
+                - Пример ответа должен демонстрировать глубокое понимание понятия
+                - НИКОГДА не включай служебную информацию или пометки в текст задания
+                """
+    
+    return task_description, format_instructions
+
+
+class _BatchDispatcher:
+    """
+    Группировка одновременно поступающих запросов к LLM в пакеты
+    
+    Запросы, пришедшие в течение короткого окна, отправляются вместе
+    (каждый своим HTTP-запросом), а их общее число одновременно
+    выполняемых запросов ограничено семафором. Одинаковые запросы
+    (те же сообщения и параметры) внутри пакета отправляются один раз.
+    """
+    
+    def __init__(self, openrouter_client: "OpenRouterClient", window: float = 0.02,
+                 max_batch: int = 32, max_concurrency: int = OPENROUTER_MAX_CONCURRENCY):
+        """
+        Инициализация диспетчера
+        
+        Args:
+            openrouter_client: Клиент для работы с OpenRouter API
+            window: Окно накопления запросов в секундах
+            max_batch: Максимальный размер пакета
+            max_concurrency: Максимальное число одновременных запросов к API
+        """
+        self.openrouter_client = openrouter_client
+        self.window = window
+        self.max_batch = max_batch
+        self.max_concurrency = max_concurrency
+        # Очередь и рабочая задача привязываются к циклу событий при первом запросе
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._batches: Set[asyncio.Task] = set()
+    
+    async def submit(self, messages: List[Dict[str, str]], **kwargs) -> Completion:
+        """
+        Постановка запроса к LLM в очередь и ожидание результата
+        
+        Args:
+            messages: Список сообщений для контекста
+            **kwargs: Параметры генерации (temperature, max_tokens)
+            
+        Returns:
+            Ответ модели
+        """
+        loop = asyncio.get_running_loop()
+        if self._loop is None or self._loop.is_closed():
+            # Цикл, к которому был привязан диспетчер, закрыт - его рабочая задача
+            # остановлена вместе с ним, привязываемся к текущему
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._batches.clear()
+            self._worker = loop.create_task(self._run(self._queue))
+        elif self._loop is not loop:
+            # Вызов из другого работающего цикла событий выполняется напрямую,
+            # без группировки и ограничения числа одновременных запросов
+            logger.warning("Запрос к LLM из другого цикла событий выполняется в обход диспетчера")
+            return await self.openrouter_client.generate_completion(messages, **kwargs)
+        
+        future = loop.create_future()
+        self._queue.put_nowait((messages, kwargs, future))
+        return await future
+    
+    async def _run(self, queue: asyncio.Queue) -> None:
+        """
+        Рабочий цикл: собирает запросы в пакеты и отправляет их
+        
+        Args:
+            queue: Очередь запросов; None в очереди - сигнал остановки
+        """
+        stopping = False
+        while not stopping:
+            item = await queue.get()
+            if item is None:
+                return
+            items = [item]
+            await asyncio.sleep(self.window)
+            while len(items) < self.max_batch and not queue.empty():
+                item = queue.get_nowait()
+                if item is None:
+                    # Сигнал остановки: отправляем уже собранный пакет и выходим
+                    stopping = True
+                    break
+                items.append(item)
+            
+            batch = asyncio.ensure_future(self._dispatch(items))
+            self._batches.add(batch)
+            batch.add_done_callback(self._batches.discard)
+    
+    async def aclose(self) -> None:
+        """
+        Остановка рабочей задачи диспетчера
+        
+        Запросы, уже поставленные в очередь, и отправленные пакеты выполняются
+        до конца. После остановки диспетчер привязывается к циклу событий
+        следующего запроса.
+        """
+        worker, loop, queue = self._worker, self._loop, self._queue
+        if worker is None:
+            return
+        self._loop = self._queue = self._worker = None
+        if loop is not asyncio.get_running_loop():
+            # Рабочую задачу другого цикла нельзя дождаться из текущего
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(worker.cancel)
+            return
+        queue.put_nowait(None)
+        await worker
+        batches = [batch for batch in self._batches if batch.get_loop() is loop]
+        if batches:
+            await asyncio.gather(*batches, return_exceptions=True)
+    
+    async def _dispatch(self, items: List[Tuple[List[Dict[str, str]], Dict[str, Any], asyncio.Future]]) -> None:
+        """
+        Параллельная отправка пакета запросов
+        
+        Args:
+            items: Список кортежей (сообщения, параметры, future для результата)
+        """
+        async def _call(messages, kwargs):
+            async with self._semaphore:
+                return await self.openrouter_client.generate_completion(messages, **kwargs)
+        
+        # Одинаковые запросы группируются: один вызов API на группу
+        groups: Dict[Hashable, Tuple[List[Dict[str, str]], Dict[str, Any], List[asyncio.Future]]] = {}
+        for messages, kwargs, future in items:
+            key = (
+                tuple((message.get("role"), str(message.get("content"))) for message in messages),
+                tuple(sorted(kwargs.items()))
+            )
+            group = groups.get(key)
+            if group is None:
+                groups[key] = (messages, kwargs, [future])
+            else:
+                group[2].append(future)
+        
+        results = await asyncio.gather(
+            *[_call(messages, kwargs) for messages, kwargs, _ in groups.values()],
+            return_exceptions=True
+        )
+        for (_, _, futures), result in zip(groups.values(), results):
+            for future in futures:
+                if future.done():
+                    continue
+                if isinstance(result, BaseException):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
 
 class OpenRouterClient:
     """
@@ -41,21 +556,98 @@ class OpenRouterClient:
             visible_part = api_key[:5] + "..." + api_key[-4:] if len(api_key) > 10 else "***"
             logger.info(f"Инициализация OpenRouter клиента с ключом {visible_part}, модель: {model}")
         
+        # Один HTTP-клиент с пулом соединений на весь срок жизни клиента:
+        # TCP/TLS-соединения с OpenRouter переиспользуются между запросами
+        # При наличии пакета h2 запросы идут по HTTP/2 (несколько запросов
+        # в одном соединении)
+        self._http_client = httpx.Client(limits=HTTP_POOL_LIMITS, timeout=HTTP_TIMEOUT, http2=HTTP2_AVAILABLE)
         self.client = OpenAI(
             base_url="https://openrouter.ai/api/v1",
-            api_key=api_key
+            api_key=api_key,
+            http_client=self._http_client,
+            timeout=HTTP_TIMEOUT
         )
         self.extra_headers = {
             "HTTP-Referer": "https://ai-tutor.ru",  # Укажите ваш домен
             "X-Title": "AI Tutor System"
         }
+        # Асинхронный клиент для потоковой генерации создается лениво,
+        # при первом вызове внутри работающего цикла событий
+        self._async_client: Optional[AsyncOpenAI] = None
+        # Группировка одновременных запросов к модели (см. generate_completion_batched)
+        self._batcher = _BatchDispatcher(self)
+    
+    def _get_async_client(self) -> AsyncOpenAI:
+        """
+        Получение асинхронного клиента OpenAI (создается при первом обращении)
+        
+        Returns:
+            Асинхронный клиент OpenAI
+        """
+        if self._async_client is None:
+            self._async_client = AsyncOpenAI(
+                base_url="https://openrouter.ai/api/v1",
+                api_key=self.api_key,
+                http_client=httpx.AsyncClient(limits=HTTP_POOL_LIMITS, timeout=HTTP_TIMEOUT, http2=HTTP2_AVAILABLE),
+                timeout=HTTP_TIMEOUT
+            )
+        return self._async_client
+    
+    def embed(self, text: str) -> Optional[Any]:
+        """
+        Вычисление нормализованного эмбеддинга текста локальной моделью
+        
+        Вызов блокирующий; из асинхронного кода выполняется в отдельном потоке.
+        Один раз вычисленный эмбеддинг вопроса передается дальше (поиск
+        и сохранение в кэш ответов), а не вычисляется заново.
+        
+        Args:
+            text: Текст
+            
+        Returns:
+            Вектор эмбеддинга или None, если модель эмбеддингов недоступна
+        """
+        model = _get_embedding_model()
+        if model is None:
+            return None
+        return model.encode(text, normalize_embeddings=True)
+    
+    def close(self) -> None:
+        """
+        Закрытие пула HTTP-соединений синхронного клиента
+        """
+        self.client.close()
+        logger.info("HTTP-соединения OpenRouter закрыты")
+    
+    async def aclose(self) -> None:
+        """
+        Закрытие всех HTTP-соединений клиента, включая асинхронный
+        
+        Сначала останавливается диспетчер запросов: запросы из его очереди
+        выполняются до закрытия соединений.
+        """
+        await self._batcher.aclose()
+        if self._async_client is not None:
+            await self._async_client.close()
+            self._async_client = None
+        self.close()
+    
+    async def __aenter__(self) -> "OpenRouterClient":
+        """
+        Использование клиента в async with: соединения закрываются при выходе
+        """
+        return self
+    
+    async def __aexit__(self, exc_type, exc_value, traceback) -> None:
+        await self.aclose()
     
     async def generate_completion(
         self, 
         messages: List[Dict[str, str]], 
         temperature: float = 0.7, 
-        max_tokens: int = 1000
-    ) -> Dict[str, Any]:
+        max_tokens: int = 1000,
+        model: Optional[str] = None
+    ) -> Completion:
         """
         Генерация завершений с помощью модели через OpenRouter API
         
@@ -63,51 +655,204 @@ class OpenRouterClient:
             messages: Список сообщений для контекста
             temperature: Температура генерации (разнообразие)
             max_tokens: Максимальное количество токенов в ответе
+            model: Модель (по умолчанию - модель клиента)
             
         Returns:
-            Ответ от API
+            Ответ модели
         """
         try:
-            completion = self.client.chat.completions.create(
+            # Синхронный вызов выполняется в отдельном потоке, чтобы не блокировать
+            # цикл событий; соединения берутся из общего пула
+            completion = await asyncio.to_thread(
+                self.client.chat.completions.create,
                 extra_headers=self.extra_headers,
-                model=self.model,
+                model=model or self.model,
                 messages=messages,
                 temperature=temperature,
                 max_tokens=max_tokens
             )
             
-            # Преобразуем объект в словарь для совместимости с существующим кодом
-            response = {
-                "choices": [
-                    {
-                        "message": {
-                            "content": completion.choices[0].message.content,
-                            "role": completion.choices[0].message.role
-                        },
-                        "index": completion.choices[0].index,
-                        "finish_reason": completion.choices[0].finish_reason
-                    }
-                ],
-                "id": completion.id,
-                "model": completion.model,
-                "usage": {
-                    "prompt_tokens": completion.usage.prompt_tokens,
-                    "completion_tokens": completion.usage.completion_tokens,
-                    "total_tokens": completion.usage.total_tokens
-                }
-            }
-            
-            return response
+            choice = completion.choices[0]
+            usage = completion.usage
+            return Completion(
+                content=choice.message.content or "",
+                finish_reason=choice.finish_reason,
+                model=completion.model,
+                usage={
+                    "prompt_tokens": usage.prompt_tokens,
+                    "completion_tokens": usage.completion_tokens,
+                    "total_tokens": usage.total_tokens
+                } if usage is not None else {}
+            )
         except Exception as e:
             logger.error(f"Ошибка при генерации завершения: {str(e)}")
             raise
     
+    async def generate_completion_batched(
+        self, 
+        messages: List[Dict[str, str]], 
+        temperature: float = 0.7, 
+        max_tokens: int = 1000,
+        model: Optional[str] = None
+    ) -> Completion:
+        """
+        Генерация завершения через общий для клиента диспетчер запросов
+        
+        Запросы, пришедшие одновременно, отправляются пакетом с ограничением
+        числа одновременных вызовов API; одинаковые запросы выполняются один раз.
+        
+        Args:
+            messages: Список сообщений для контекста
+            temperature: Температура генерации (разнообразие)
+            max_tokens: Максимальное количество токенов в ответе
+            model: Модель (по умолчанию - модель клиента)
+            
+        Returns:
+            Ответ от API в формате generate_completion
+        """
+        return await self._batcher.submit(messages, temperature=temperature, max_tokens=max_tokens, model=model)
+    
+    async def stream_completion(
+        self, 
+        messages: List[Dict[str, str]], 
+        temperature: float = 0.7, 
+        max_tokens: int = 1000,
+        model: Optional[str] = None
+    ) -> AsyncIterator[str]:
+        """
+        Потоковая генерация завершения через OpenRouter API (Server-Sent Events)
+        
+        Args:
+            messages: Список сообщений для контекста
+            temperature: Температура генерации (разнообразие)
+            max_tokens: Максимальное количество токенов в ответе
+            model: Модель (по умолчанию - модель клиента)
+            
+        Yields:
+            Фрагменты текста ответа по мере их генерации
+        """
+        stream = self._stream_chunks(messages, temperature, max_tokens, model)
+        try:
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                content = chunk.choices[0].delta.content
+                if content:
+                    yield content
+        finally:
+            await stream.aclose()
+    
+    async def _stream_chunks(
+        self, 
+        messages: List[Dict[str, str]], 
+        temperature: float, 
+        max_tokens: int,
+        model: Optional[str],
+        include_usage: bool = False
+    ) -> AsyncIterator[Any]:
+        """
+        Потоковый запрос к OpenRouter API с выдачей фрагментов ответа как есть
+        
+        Args:
+            messages: Список сообщений для контекста
+            temperature: Температура генерации (разнообразие)
+            max_tokens: Максимальное количество токенов в ответе
+            model: Модель (None - модель клиента)
+            include_usage: Запросить последний фрагмент с количеством токенов
+            
+        Yields:
+            Фрагменты ответа API (ChatCompletionChunk)
+        """
+        try:
+            stream = await self._get_async_client().chat.completions.create(
+                extra_headers=self.extra_headers,
+                model=model or self.model,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                stream=True,
+                **({"stream_options": {"include_usage": True}} if include_usage else {})
+            )
+            
+            async for chunk in stream:
+                yield chunk
+        except Exception as e:
+            logger.error(f"Ошибка при потоковой генерации завершения: {str(e)}")
+            raise
+    
+    async def collect_stream_completion(
+        self, 
+        messages: List[Dict[str, str]], 
+        temperature: float = 0.7, 
+        max_tokens: int = 1000,
+        model: Optional[str] = None,
+        idle_timeout: float = STREAM_IDLE_TIMEOUT
+    ) -> Completion:
+        """
+        Получение полного ответа модели через потоковый режим
+        
+        Ответ собирается из фрагментов по мере их поступления. Ограничено только
+        время ожидания очередного фрагмента, поэтому долгая генерация не упирается
+        в общий тайм-аут запроса (например, тайм-аут прокси на стороне OpenRouter).
+        
+        Args:
+            messages: Список сообщений для контекста
+            temperature: Температура генерации (разнообразие)
+            max_tokens: Максимальное количество токенов в ответе
+            model: Модель (по умолчанию - модель клиента)
+            idle_timeout: Максимальная пауза между фрагментами в секундах
+            
+        Returns:
+            Ответ в том же формате, что и generate_completion: причина завершения,
+            модель и количество токенов берутся из последних фрагментов потока
+            
+        Raises:
+            asyncio.TimeoutError: Если очередной фрагмент не пришел за idle_timeout
+        """
+        stream = self._stream_chunks(messages, temperature, max_tokens, model, include_usage=True)
+        parts = []
+        finish_reason = None
+        response_model = model or self.model
+        usage = None
+        try:
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(stream.__anext__(), timeout=idle_timeout)
+                except StopAsyncIteration:
+                    break
+                response_model = chunk.model or response_model
+                if chunk.usage is not None:
+                    # Количество токенов приходит в последнем фрагменте (без choices)
+                    usage = chunk.usage
+                if not chunk.choices:
+                    continue
+                choice = chunk.choices[0]
+                if choice.delta.content:
+                    parts.append(choice.delta.content)
+                if choice.finish_reason:
+                    finish_reason = choice.finish_reason
+        finally:
+            await stream.aclose()
+        
+        return Completion(
+            content="".join(parts),
+            finish_reason=finish_reason,
+            model=response_model,
+            usage={
+                "prompt_tokens": usage.prompt_tokens,
+                "completion_tokens": usage.completion_tokens,
+                "total_tokens": usage.total_tokens
+            } if usage is not None else {}
+        )
+    
     async def generate_task(
         self, 
         concept: Dict[str, Any], 
         related_concepts: List[Dict[str, Any]], 
         task_type: str, 
-        difficulty: str
+        difficulty: str,
+        stream: bool = False,
+        raise_errors: bool = False
     ) -> Dict[str, Any]:
         """
         Генерация задачи на основе понятия и связанных понятий
@@ -117,9 +862,15 @@ class OpenRouterClient:
             related_concepts: Связанные понятия
             task_type: Тип задачи ("template" или "creative")
             difficulty: Уровень сложности ("standard" или "advanced")
+            stream: Получать ответ модели в потоковом режиме
+            raise_errors: Передавать ошибки API вызывающему коду вместо запасной задачи
             
         Returns:
             Сгенерированная задача
+            
+        Raises:
+            asyncio.TimeoutError: В потоковом режиме, если модель перестала присылать фрагменты
+            Exception: Ошибка API или разбора ответа, если raise_errors=True
         """
         try:
             # Проверка API ключа
@@ -181,44 +932,6 @@ class OpenRouterClient:
                             
                         related_info += f"- {rc['name']} ({rc.get('relation_type', 'связано с')}): {rc['definition']}\n"
             
-            task_description = ""
-            if task_type == "template":
-                task_description = (
-                    "Создай шаблонную задачу с множественным выбором (4 варианта ответа, только один правильный) "
-                    "на основе данного понятия. Задача должна проверять именно понимание понятия, "
-                    "а не просто факты. Важно, чтобы студент действительно осознал суть понятия и его место "
-                    "в системе знаний."
-                )
-                if difficulty == "advanced":
-                    task_description += (
-                        "Задача должна быть продвинутого уровня, требующей глубокого понимания понятия и его связей. "
-                        "Включи связанные понятия в формулировку задачи, чтобы проверить, как студент понимает "
-                        "взаимосвязи между разными элементами системы."
-                    )
-                else:
-                    task_description += (
-                        "Задача должна быть стандартного уровня, доступная для понимания. "
-                        "Сфокусируйся на основных аспектах понятия и его ключевых характеристиках."
-                    )
-            else:  # creative
-                task_description = (
-                    "Создай творческую задачу, требующую развёрнутого ответа, "
-                    "на основе данного понятия. Задача должна вести к более глубокому усвоению понятия "
-                    "через размышление и творческое применение. Важно, чтобы студент не просто запомнил определение, "
-                    "а осмыслил понятие и научился использовать его в разных контекстах."
-                )
-                if difficulty == "advanced":
-                    task_description += (
-                        "Задача должна быть продвинутого уровня, требовать анализа и синтеза информации. "
-                        "Включи связанные понятия в формулировку задачи, чтобы студент мог построить "
-                        "целостную картину и увидеть, как понятия образуют систему."
-                    )
-                else:
-                    task_description += (
-                        "Задача должна быть стандартного уровня, доступная для понимания. "
-                        "Сфокусируйся на практическом применении понятия и его связи с реальными ситуациями."
-                    )
-            
             # Примеры вопросов из базы (если есть)
             question_examples = ""
             if concept.get('questions'):
@@ -226,83 +939,10 @@ class OpenRouterClient:
                 for q in concept['questions']:
                     question_examples += f"- {q}\n"
             
-            format_instructions = ""
-            if task_type == "template":
-                format_instructions = """
-                Формат вывода задачи должен быть следующим:
-
-                Сначала задай вопрос о понятии. Затем перечисли варианты ответов в таком формате:
-
-                Варианты ответов:
-                
-                1. [Первый вариант ответа - неверный]
-                2. [Второй вариант ответа - неверный]
-                3. [Третий вариант ответа - правильное определение понятия]
-                4. [Четвертый вариант ответа - неверный]
-                
-                Подсказки:
-                - [Подсказка 1]
-                - [Подсказка 2]
-                
-                Тип: Задача с выбором ответа | Сложность: [Базовый/Продвинутый] уровень
-
-                ВАЖНО:
-                - Один из вариантов должен соответствовать правильному определению понятия
-                - Остальные варианты должны быть правдоподобными, но содержать ошибки или неточности
-                - НИКОГДА не используй в вариантах ответа формулировки "Неверное определение", "AI анализ" и т.п.
-                - НИКОГДА не включай источник определения (глава/курс) или другую служебную информацию
-                - Подсказки должны помогать разобраться в сути понятия, не раскрывая ответ напрямую
-                """
-            else:  # creative
-                format_instructions = """
-                Формат вывода задачи должен быть следующим:
-
-                Сначала сформулируй вопрос или творческое задание по понятию. Затем напиши критерии оценки и пример ответа:
-                
-                Критерии оценки:
-                - [Критерий 1 для оценки ответа]
-                - [Критерий 2]
-                - [Критерий 3]
-                
-                Пример хорошего ответа:
-                [Пример ответа на задание]
-                
-                Подсказки:
-                - [Подсказка 1]
-                - [Подсказка 2]
-                
-                Тип: Творческая задача | Сложность: [Базовый/Продвинутый] уровень
-                
-                ВАЖНО:
-                - Задание должно требовать от студента демонстрации понимания понятия
-                - Критерии должны быть конкретными и измеримыми
-                - Пример ответа должен демонстрировать глубокое понимание понятия
-                - НИКОГДА не включай служебную информацию или пометки в текст задания
-                """
+            task_description, format_instructions = _task_instructions(task_type, difficulty)
             
             messages = [
-                {
-                    "role": "system",
-                    "content": (
-                        "Ты - ИИ-репетитор для студентов, изучающих курс 'Системное саморазвитие'. "
-                        "Твоя задача - создавать учебные задачи для проверки знаний студентов. "
-                        "ВАЖНО: В школе системного менеджмента изучение и усвоение понятий - это самое важное. "
-                        "Все задачи, которые ты создаешь, должны быть НАЦЕЛЕНЫ НА ПРОВЕРКУ ЗНАНИЙ ПОНЯТИЙ "
-                        "и их лучшего усвоения. Сфокусируйся на точном определении и понимании понятий, "
-                        "их взаимосвязях и практическом применении. "
-                        "Задачи должны быть связаны с понятиями из графа знаний и адаптированы "
-                        "под уровень сложности."
-                        "\n\nСТРОГИЕ ПРАВИЛА ФОРМАТИРОВАНИЯ:"
-                        "\n1. ЗАПРЕЩЕНО использовать в вариантах ответов следующие фразы: 'Неверное определение', 'AI анализ', 'Из главы', 'определение в тексте отсутствует', 'может быть определено'"
-                        "\n2. ЗАПРЕЩЕНО включать информацию об источниках определений, ссылки на главы или курс"
-                        "\n3. ЗАПРЕЩЕНО включать служебные элементы JSON, теги, метки или подобные технические элементы"
-                        "\n4. ЗАПРЕЩЕНО использовать шаблонные заглушки вместо содержательных вариантов ответов"
-                        "\n5. Каждый вариант ответа должен быть конкретным, содержательным и завершенным определением"
-                        "\n6. Неправильные варианты должны выглядеть правдоподобно, но содержать осмысленные ошибки"
-                        "\n\nИспользуй естественный стиль текста без технических артефактов."
-                        "\nЗадача должна быть четкой, понятной и профессиональной."
-                    )
-                },
+                _TASK_SYSTEM_MESSAGE,
                 {
                     "role": "user",
                     "content": (
@@ -317,13 +957,16 @@ class OpenRouterClient:
             
             try:
                 logger.info("Отправляем запрос к OpenRouter API")
-                response = await self.generate_completion(messages)
+                if stream:
+                    response = await self.collect_stream_completion(messages)
+                else:
+                    response = await self.generate_completion(messages)
                 
-                if not response or not response.get('choices'):
-                    logger.error(f"Неожиданный формат ответа от API: {response}")
-                    raise ValueError("Неожиданный формат ответа от API")
+                content = response.content
+                if not content:
+                    logger.error(f"Пустой ответ от API: {response}")
+                    raise ValueError("Пустой ответ от API")
                     
-                content = response['choices'][0]['message']['content']
                 logger.info("Получен ответ от OpenRouter API")
                 
                 # Извлекаем JSON данные между метками ```json и ```
@@ -332,26 +975,18 @@ class OpenRouterClient:
                 if match:
                     json_str = match.group(1)
                     logger.info("Извлечены JSON данные между метками ```json```")
-                    task = json.loads(json_str)
+                    task = _loads_json(json_str)
                     logger.info("JSON данные успешно преобразованы в словарь")
                 else:
-                    # Если данные не обернуты в тройные обратные кавычки
-                    # Пытаемся извлечь JSON напрямую
-                    json_start = content.find('{')
-                    json_end = content.rfind('}')
-                    
-                    if json_start != -1 and json_end != -1:
-                        json_str = content[json_start:json_end+1]
-                        try:
-                            task = json.loads(json_str)
-                            logger.info("JSON данные извлечены непосредственно из текста")
-                        except json.JSONDecodeError:
-                            logger.warning("Найденный JSON некорректен, пробуем обработать текстовый ответ")
-                            task = self._parse_text_response(content, concept)
-                    else:
-                        # Если не найден формат JSON, обрабатываем как текстовый ответ
+                    # Если данные не обернуты в тройные обратные кавычки,
+                    # ищем первый корректный JSON-объект в тексте
+                    task = await _extract_json_async(content)
+                    if "raw_text" in task or "data" in task:
+                        # Если объект JSON не найден, обрабатываем как текстовый ответ
                         logger.warning("JSON данные не найдены, обрабатываем как текстовый ответ")
                         task = self._parse_text_response(content, concept)
+                    else:
+                        logger.info("JSON данные извлечены непосредственно из текста")
                 
                 # Проверяем и структурируем данные
                 if task_type == "template":
@@ -423,8 +1058,14 @@ class OpenRouterClient:
             except Exception as api_error:
                 logger.error(f"Ошибка при вызове API: {str(api_error)}")
                 raise
+        except asyncio.TimeoutError:
+            # Тайм-аут потокового ответа обрабатывает вызывающий код
+            raise
         except Exception as e:
             logger.error(f"Ошибка при генерации задачи: {str(e)}")
+            if raise_errors:
+                # Вызывающий код сам учитывает ошибку (например, в выключателе) и строит заглушку
+                raise
             # Возвращаем запасной вариант задачи
             if task_type == "template":
                 return {
@@ -465,7 +1106,8 @@ class OpenRouterClient:
         self, 
         task: Dict[str, Any], 
         student_answer: str, 
-        concept: Dict[str, Any]
+        concept: Dict[str, Any],
+        raise_errors: bool = False
     ) -> Dict[str, Any]:
         """
         Проверка ответа студента
@@ -474,9 +1116,13 @@ class OpenRouterClient:
             task: Задача
             student_answer: Ответ студента
             concept: Понятие, к которому относится задача
+            raise_errors: Передавать ошибки API вызывающему коду вместо ответа с ключом "error"
             
         Returns:
             Результат проверки
+            
+        Raises:
+            Exception: Ошибка API, если raise_errors=True
         """
         task_type = task.get("task_type", "")
         
@@ -529,26 +1175,7 @@ class OpenRouterClient:
             criteria_text = "\n".join([f"- {c}" for c in criteria])
             
             messages = [
-                {
-                    "role": "system",
-                    "content": (
-                        "Ты - ИИ-репетитор, использующий принципы мотивационного интервьюирования для обратной связи. "
-                        "ВАЖНО: Твоя цель - создать поддерживающую, эмпатичную среду, где студент чувствует, что его слышат и ценят. "
-                        "Используй эти основные принципы мотивационного интервьюирования:\n"
-                        "1. Выражай эмпатию: признавай усилия студента, даже если ответ неверный\n"
-                        "2. Развивай несоответствие: мягко указывай на расхождение между тем, что студент знает и что могло бы быть улучшено\n"
-                        "3. Избегай споров: не критикуй напрямую, а предлагай альтернативные точки зрения\n"
-                        "4. Поддерживай самоэффективность: подчеркивай способность студента улучшить свое понимание\n\n"
-                        "Оценивая ответ студента, в первую очередь проверь, насколько глубоко и точно усвоено основное понятие, "
-                        "о котором идет речь в задаче. Особое внимание обрати на то, понимает ли студент "
-                        "суть понятия, его место в системе знаний и может ли применять его на практике. "
-                        "Оцени ответ по 10-балльной шкале, где: "
-                        "8-10 баллов - глубокое понимание понятия и его применения; "
-                        "5-7 баллов - основное понимание понятия присутствует, но есть неточности; "
-                        "1-4 балла - слабое понимание понятия или его неверное применение. "
-                        "Твоя цель - дать объективную оценку и конструктивную обратную связь по ответу студента."
-                    )
-                },
+                _CHECK_SYSTEM_MESSAGE,
                 {
                     "role": "user",
                     "content": (
@@ -572,48 +1199,39 @@ class OpenRouterClient:
             
             try:
                 response = await self.generate_completion(messages)
-                content = response['choices'][0]['message']['content']
+                content = response.content
                 
                 # Пытаемся извлечь JSON с результатом оценки
-                json_start = content.find('{')
-                json_end = content.rfind('}')
+                result = await _extract_json_async(content)
                 
-                if json_start != -1 and json_end != -1:
-                    result_json = content[json_start:json_end+1]
-                    try:
-                        result = json.loads(result_json)
-                        
-                        # Проверяем, что в результате есть нужные поля
-                        if 'is_correct' in result and 'feedback' in result:
-                            # Формируем улучшенную обратную связь с элементами мотивационного интервьюирования
-                            feedback = result.get('feedback', '')
-                            
-                            # Добавляем сильные стороны
-                            strengths = result.get('strengths', [])
-                            if strengths:
-                                feedback += "\n\n*Сильные стороны вашего ответа:*\n"
-                                for strength in strengths:
-                                    feedback += f"• {strength}\n"
-                            
-                            # Добавляем области для улучшения
-                            improvements = result.get('improvements', [])
-                            if improvements:
-                                feedback += "\n*Для размышления:*\n"
-                                for improvement in improvements:
-                                    feedback += f"• {improvement}\n"
-                            
-                            # Добавляем вопросы для рефлексии
-                            reflection_questions = result.get('reflection_questions', [])
-                            if reflection_questions:
-                                feedback += "\n*Вопросы для углубления понимания:*\n"
-                                for question in reflection_questions:
-                                    feedback += f"• {question}\n"
-                            
-                            result['feedback'] = feedback
-                            return result
-                    except json.JSONDecodeError:
-                        # Если не удалось декодировать JSON, используем весь текст как обратную связь
-                        logger.warning(f"Не удалось декодировать JSON из ответа: {content}")
+                # Проверяем, что в результате есть нужные поля
+                if 'is_correct' in result and 'feedback' in result:
+                    # Формируем улучшенную обратную связь с элементами мотивационного интервьюирования
+                    feedback = result.get('feedback', '')
+                    
+                    # Добавляем сильные стороны
+                    strengths = result.get('strengths', [])
+                    if strengths:
+                        feedback += "\n\n*Сильные стороны вашего ответа:*\n"
+                        for strength in strengths:
+                            feedback += f"• {strength}\n"
+                    
+                    # Добавляем области для улучшения
+                    improvements = result.get('improvements', [])
+                    if improvements:
+                        feedback += "\n*Для размышления:*\n"
+                        for improvement in improvements:
+                            feedback += f"• {improvement}\n"
+                    
+                    # Добавляем вопросы для рефлексии
+                    reflection_questions = result.get('reflection_questions', [])
+                    if reflection_questions:
+                        feedback += "\n*Вопросы для углубления понимания:*\n"
+                        for question in reflection_questions:
+                            feedback += f"• {question}\n"
+                    
+                    result['feedback'] = feedback
+                    return result
                 
                 # Если не удалось извлечь и обработать JSON, используем эвристики для определения оценки
                 is_correct = 'правильный' in content.lower() or 'верный' in content.lower() or 'глубокое понимание' in content.lower()
@@ -639,9 +1257,12 @@ class OpenRouterClient:
                 }
             except Exception as e:
                 logger.error(f"Ошибка при проверке ответа: {str(e)}")
+                if raise_errors:
+                    raise
                 # Возвращаем базовый ответ в случае ошибки с элементами мотивационного интервьюирования
                 return {
                     "is_correct": False,
+                    "error": str(e),
                     "feedback": "Спасибо за твой ответ. К сожалению, у нас возникли технические трудности при проверке. Не волнуйся, это не связано с качеством твоего ответа. Попробуем еще раз?",
                     "strengths": [],
                     "improvements": [],
@@ -15,7 +15,7 @@ from ai_tutor.bot.keyboards import (
 from ai_tutor.config.settings import TELEGRAM_TOKEN, CHAPTERS, TASK_TYPES, DIFFICULTY_LEVELS
 from ai_tutor.config.constants import MESSAGES
 from ai_tutor.database.models import Student, Task
-from ai_tutor.database.neo4j_client import Neo4jClient
+from ai_tutor.database.neo4j_client import get_shared_client
 from ai_tutor.api.openrouter import OpenRouterClient
 
 # Состояния диалога
@@ -28,8 +28,8 @@ PREFIX_DIFFICULTY = "difficulty:"
 
 logger = logging.getLogger(__name__)
 
-# Инициализация клиентов
-neo4j_client = Neo4jClient()
+# Инициализация клиентов: драйвер Neo4j общий с TutorCrew и агентами
+neo4j_client = get_shared_client()
 openrouter_client = OpenRouterClient()
 
 
@@ -20,9 +20,9 @@ sys.path.append('/app')
 from config.settings import TELEGRAM_TOKEN, CHAPTERS, TASK_TYPES, DIFFICULTY_LEVELS
 from config.constants import MESSAGES
 from agents.crew import TutorCrew
-from api.openrouter import OpenRouterClient
-from database.neo4j_client import Neo4jClient
 from agents.unified_assistant import UnifiedAssistant
+from agents.interaction_log import get_shared_log_writer
+from bot import handlers
 from bot.handlers import (
     start_command, help_command, task_command, cancel, unknown_command,
     select_chapter, select_task_type, select_difficulty, process_answer,
@@ -59,12 +59,18 @@ class TelegramBot:
         # Логгер
         self.logger = logging.getLogger(__name__)
         
-        # Инициализация клиентов
-        self.neo4j_client = Neo4jClient()
-        self.openrouter_client = OpenRouterClient()
+        # Клиенты общие с обработчиками диалога: один пул соединений с OpenRouter
+        # и общий драйвер Neo4j (get_shared_client), которым пользуются также
+        # TutorCrew и агенты
+        self.neo4j_client = handlers.neo4j_client
+        self.openrouter_client = handlers.openrouter_client
+        
+        # Очередь записи взаимодействий в Neo4j: одна на процесс, передается
+        # помощникам и дожидается записи при остановке бота
+        self.log_writer = get_shared_log_writer()
         
         # Инициализация объединенного ассистента
-        self.assistant = UnifiedAssistant(self.neo4j_client, self.openrouter_client)
+        self.assistant = UnifiedAssistant(self.neo4j_client, self.openrouter_client, log_writer=self.log_writer)
         
         # Инициализация бота
         self.application = ApplicationBuilder().token(token).build()
@@ -952,23 +958,18 @@ class TelegramBot:
         try:
             logger.info(f"Запуск генерации задачи: student_id={student_id}, глава={chapter_title}, тип={task_type}, сложность={difficulty}")
             
-            # Получаем текущий цикл событий
-            loop = asyncio.get_event_loop()
-            
-            # Логируем информацию перед вызовом
-            logger.info("Вызываем TutorCrew.full_tutor_process через run_in_executor")
+            # Вызываем асинхронную версию напрямую: запросы к Neo4j выполняются
+            # в пуле потоков TutorCrew, не занимая поток на все время генерации
+            logger.info("Вызываем TutorCrew.async_full_tutor_process")
             
-            result = await loop.run_in_executor(
-                None,
-                lambda: self.tutor_crew.full_tutor_process(
-                    student_id=student_id,
-                    chapter_title=chapter_title,
-                    task_type=task_type,
-                    difficulty=difficulty
-                )
+            result = await self.tutor_crew.async_full_tutor_process(
+                student_id=student_id,
+                chapter_title=chapter_title,
+                task_type=task_type,
+                difficulty=difficulty
             )
             
-            logger.info("Получен результат из TutorCrew.full_tutor_process")
+            logger.info("Получен результат из TutorCrew.async_full_tutor_process")
             
             # Проверяем наличие ошибки в результате
             if "error" in result.get("task", {}):
@@ -1014,15 +1015,11 @@ class TelegramBot:
             Результат проверки
         """
         try:
-            loop = asyncio.get_event_loop()
-            return await loop.run_in_executor(
-                None,
-                lambda: self.tutor_crew.check_answer(
-                    student_id=student_id,
-                    chapter_title=chapter_title,
-                    task=task,
-                    student_answer=student_answer
-                )
+            return await self.tutor_crew.async_check_answer(
+                student_id=student_id,
+                chapter_title=chapter_title,
+                task=task,
+                student_answer=student_answer
             )
         except Exception as e:
             logger.error(f"Ошибка при проверке ответа: {str(e)}")
@@ -1256,6 +1253,8 @@ class TelegramBot:
         logger.info("Остановка Telegram-бота")
         await self.application.stop()
         await self.application.shutdown()
+        await self.log_writer.close()
+        await self.openrouter_client.aclose()
 
     async def menu_button_handler(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         """
@@ -16,6 +16,10 @@ PROJECT_ROOT = BASE_DIR.parent
 NEO4J_URI = os.getenv("NEO4J_URI", "bolt://localhost:7687")
 NEO4J_USER = os.getenv("NEO4J_USER", "neo4j")
 NEO4J_PASSWORD = os.getenv("NEO4J_PASSWORD", "neo4j")
+# Прогрев кэша страниц Neo4j при запуске помощника
+NEO4J_WARMUP = os.getenv("NEO4J_WARMUP", "false").lower() == "true"
+# Количество потоков для синхронных запросов к Neo4j из асинхронного кода
+NEO4J_EXECUTOR_WORKERS = int(os.getenv("NEO4J_EXECUTOR_WORKERS", "8"))
 
 # Настройки Telegram
 TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN", "")
@@ -28,9 +32,36 @@ DEFAULT_MODEL = os.getenv("MODEL_NAME", "x-ai/grok-3-mini-beta")
 GROK_MODEL = os.getenv("MODEL_NAME", "x-ai/grok-3-mini-beta") # Используем переменную окружения вместо жесткого значения
 
 # Настройки LLM
+# Максимальное число одновременных запросов к OpenRouter
+OPENROUTER_MAX_CONCURRENCY = int(os.getenv("OPENROUTER_MAX_CONCURRENCY", "8"))
 TEMPERATURE = float(os.getenv("MODEL_TEMPERATURE", "0.7"))
 MAX_TOKENS = int(os.getenv("MODEL_MAX_TOKENS", "2000"))
 REQUEST_TIMEOUT = int(os.getenv("MODEL_REQUEST_TIMEOUT", "120"))
+# Пометка постоянной части системного промпта для кэширования на стороне провайдера
+# (cache_control в формате OpenRouter; провайдеры без поддержки ее игнорируют)
+PROMPT_CACHE_CONTROL = os.getenv("PROMPT_CACHE_CONTROL", "true").lower() == "true"
+# Быстрая модель для коротких ответов (по умолчанию - основная модель)
+SMALL_MODEL = os.getenv("SMALL_MODEL_NAME", GROK_MODEL)
+# Модель и лимит токенов по типу запроса к LLM: короткие подсказки и обсуждения
+# задач идут на быструю модель, подробные объяснения - на основную
+LLM_ROUTES = {
+    "discussion": {"model": SMALL_MODEL, "max_tokens": int(os.getenv("DISCUSSION_MAX_TOKENS", "400"))},
+    "guidance": {"model": SMALL_MODEL, "max_tokens": int(os.getenv("GUIDANCE_MAX_TOKENS", "250"))},
+    "explanation": {"model": GROK_MODEL, "max_tokens": int(os.getenv("EXPLANATION_MAX_TOKENS", "1500"))},
+}
+# Локальная модель SentenceTransformer для эмбеддингов вопросов в кэшах ответов
+# (пустое значение отключает семантическое совпадение, остается только точное)
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "")
+# Матрица проекции эмбеддингов на главные компоненты (.npy, см. agents.answer_cache.fit_projection);
+# пустое значение - векторы сравниваются без проекции
+EMBEDDING_PCA_PATH = os.getenv("EMBEDDING_PCA_PATH", "")
+# Пакетная обработка консультаций: число одновременно обрабатываемых запросов
+# и максимальный размер пакета
+CONSULTATION_BATCH_CONCURRENCY = int(os.getenv("CONSULTATION_BATCH_CONCURRENCY", "8"))
+CONSULTATION_BATCH_MAX_SIZE = 100
+# Максимальная длина вопроса студента в символах: более длинные вопросы
+# отклоняются без обращения к модели
+MAX_QUESTION_LENGTH = int(os.getenv("MAX_QUESTION_LENGTH", "4096"))
 
 # Настройки CrewAI
 MAX_CONSECUTIVE_AUTO_REPLIES = int(os.getenv("MAX_CONSECUTIVE_AUTO_REPLIES", "3"))
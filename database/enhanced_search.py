@@ -558,7 +558,7 @@ class EnhancedCourseSearch:
                 # Фильтр по типу источника
                 source_filter = ""
                 if source_types and len(source_types) > 0:
-                    source_filter = "AND n.source_type IN $source_types"
+                    source_filter = "WHERE n.source_type IN $source_types"
                     logger.debug(f"Установлен фильтр по типам источников: {source_types}")
                 
                 # Получаем все понятия за один запрос, ограничиваем количество
@@ -576,8 +576,8 @@ class EnhancedCourseSearch:
                         n.chapters_mentions AS chapters_mentions,
                         n.example AS example,
                         n.questions AS questions
-                    LIMIT {max_records}
-                """, source_types=source_types)
+                    LIMIT $max_records
+                """, source_types=source_types, max_records=max_records)
                 
                 # Преобразуем в список для однократного обхода
                 all_records = list(records)
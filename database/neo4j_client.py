@@ -1,22 +1,105 @@
 """
 Клиент для работы с Neo4j - графовой базой данных для хранения понятий и связей курса
 """
-from typing import Dict, List, Any, Optional, Union
+from typing import Dict, List, Any, Optional, Sequence, Union
 import logging
 import re
-import traceback
 import os
+import atexit
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
-from neo4j import GraphDatabase
+from neo4j import GraphDatabase, AsyncGraphDatabase
 from neo4j.exceptions import ServiceUnavailable, AuthError
 
+from ai_tutor.database.query_cache import QueryCache, MISSING
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
 # Заменяем импорт из ai_tutor на прямое использование переменных окружения
 NEO4J_URI = os.getenv("NEO4J_URI", "bolt://localhost:7687")
 NEO4J_USER = os.getenv("NEO4J_USER", "neo4j")
 NEO4J_PASSWORD = os.getenv("NEO4J_PASSWORD", "password")
 
+# Параметры пула соединений драйвера
+NEO4J_MAX_POOL_SIZE = int(os.getenv("NEO4J_MAX_POOL_SIZE", "50"))
+NEO4J_ACQUISITION_TIMEOUT = int(os.getenv("NEO4J_ACQUISITION_TIMEOUT", "30"))
+# TCP keep-alive для соединений пула (простаивающие соединения не обрываются сетью)
+NEO4J_KEEP_ALIVE = os.getenv("NEO4J_KEEP_ALIVE", "true").lower() == "true"
+# Количество соединений, открываемых заранее при подключении (0 - не прогревать пул)
+NEO4J_WARM_POOL_SIZE = int(os.getenv("NEO4J_WARM_POOL_SIZE", "4"))
+
+# Максимальное количество глав в кэше информации о главах клиента
+CHAPTER_INFO_CACHE_SIZE = 512
+
+# Свойство понятия с векторным эмбеддингом (см. database/create_vector_index.py)
+CONCEPT_EMBEDDING_FIELD = "combined_embedding"
+
 logger = logging.getLogger(__name__)
 
+# Индексы по свойствам, через которые запросы клиента находят начальные узлы.
+# Без них каждый MATCH по {id: ...}/{title: ...}/{name: ...} просматривает все узлы метки
+SCHEMA_INDEXES = [
+    "CREATE INDEX student_id IF NOT EXISTS FOR (s:Student) ON (s.id)",
+    "CREATE INDEX student_telegram_id IF NOT EXISTS FOR (s:Student) ON (s.telegram_id)",
+    "CREATE INDEX chapter_title IF NOT EXISTS FOR (ch:Chapter) ON (ch.title)",
+    "CREATE INDEX concept_name IF NOT EXISTS FOR (c:Concept) ON (c.name)",
+    "CREATE INDEX course_name IF NOT EXISTS FOR (c:Course) ON (c.name)",
+]
+
+def _excluded_param(excluded: Optional[Sequence[str]]) -> List[str]:
+    """
+    Подготовка списка исключаемых понятий для параметра запроса
+    
+    Повторы удаляются (с сохранением порядка), чтобы проверка
+    NOT c.name IN $excluded не сравнивала одно и то же имя несколько раз.
+    
+    Args:
+        excluded: Названия исключаемых понятий (опционально)
+        
+    Returns:
+        Список уникальных названий
+    """
+    if not excluded:
+        return []
+    return list(dict.fromkeys(excluded))
+
+
+# Допустимое имя типа связи (тип связи нельзя передать параметром запроса)
+_RELATION_TYPE_RE = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+
+class ChapterTable:
+    """
+    Таблица глав курса: названия и основные идеи в параллельных списках,
+    индексируемых целочисленным ID главы
+    """
+    
+    def __init__(self, records: List[Dict[str, Any]]):
+        """
+        Построение таблицы по результатам запроса
+        
+        Args:
+            records: Записи с полями title и main_ideas
+        """
+        self.titles: List[str] = []
+        self.main_ideas: List[Optional[str]] = []
+        self.id_of: Dict[str, int] = {}
+        for record in records:
+            title = record.get("title")
+            if title is None or title in self.id_of:
+                continue
+            self.id_of[title] = len(self.titles)
+            self.titles.append(title)
+            self.main_ideas.append(record.get("main_ideas"))
+    
+    def __len__(self) -> int:
+        return len(self.titles)
+
 
 class Neo4jClient:
     """
@@ -36,18 +119,106 @@ class Neo4jClient:
         self.user = user
         self.password = password
         self.driver = None
+        # Асинхронный драйвер создается лениво, внутри работающего цикла событий
+        self.async_driver = None
+        # Информация о главах почти не меняется: кэшируем ее с ограниченным временем жизни,
+        # чтобы изменения глав в графе подхватывались без перезапуска
+        self._chapter_info_cache = QueryCache("chapter_info", max_size=CHAPTER_INFO_CACHE_SIZE)
+        self._chapter_info_lock = threading.Lock()
+        self._chapter_table: Optional[ChapterTable] = None
+        # Матрица эмбеддингов понятий для векторного поиска в памяти процесса;
+        # загружается из графа при первом поиске (см. rebuild_embedding_matrix)
+        self._embedding_matrix = None
+        self._embedding_concepts: Optional[List[Dict[str, Any]]] = None
+        self._embedding_lock = threading.Lock()
         self.connect()
     
     def connect(self) -> None:
         """
         Подключение к базе данных Neo4j
+        
+        Драйвер с пулом соединений создается один раз; повторные вызовы
+        ничего не делают. Доступность сервера проверяется при создании драйвера.
         """
+        if self.driver is not None:
+            return
+        
         try:
-            self.driver = GraphDatabase.driver(self.uri, auth=(self.user, self.password))
-            logger.info("Успешное подключение к Neo4j: %s", self.uri)
+            self.driver = GraphDatabase.driver(
+                self.uri,
+                auth=(self.user, self.password),
+                max_connection_pool_size=NEO4J_MAX_POOL_SIZE,
+                connection_acquisition_timeout=NEO4J_ACQUISITION_TIMEOUT,
+                keep_alive=NEO4J_KEEP_ALIVE
+            )
         except (ServiceUnavailable, AuthError) as e:
             logger.error("Ошибка подключения к Neo4j: %s", str(e))
             raise
+        
+        try:
+            self.driver.verify_connectivity()
+            logger.info("Успешное подключение к Neo4j: %s", self.uri)
+        except (ServiceUnavailable, AuthError) as e:
+            # Ошибка соединения проявится при первом запросе; драйвер переподключится сам
+            logger.warning("Neo4j пока недоступен (%s): %s", self.uri, str(e))
+            return
+        
+        self.ensure_indexes()
+        self.warm_pool()
+    
+    def warm_pool(self, size: int = NEO4J_WARM_POOL_SIZE) -> None:
+        """
+        Открытие соединений пула заранее, до первых запросов студентов
+        
+        Несколько сессий одновременно выполняют RETURN 1, поэтому драйвер
+        устанавливает size соединений (TCP, TLS, bolt handshake) и оставляет
+        их в пуле. Ошибка прогрева не прерывает работу клиента.
+        
+        Args:
+            size: Количество соединений
+        """
+        size = min(size, NEO4J_MAX_POOL_SIZE)
+        if size <= 0:
+            return
+        
+        # Барьер удерживает сессии открытыми, пока не будут открыты все size сессий:
+        # иначе следующая сессия получила бы уже освобожденное соединение
+        barrier = threading.Barrier(size)
+        
+        def _ping() -> None:
+            try:
+                with self.driver.session() as session:
+                    session.run("RETURN 1").consume()
+                    barrier.wait(timeout=NEO4J_ACQUISITION_TIMEOUT)
+            except threading.BrokenBarrierError:
+                pass
+            except Exception:
+                # Остальные сессии не ждут соединение, которое не будет открыто
+                barrier.abort()
+                raise
+        
+        try:
+            with ThreadPoolExecutor(max_workers=size, thread_name_prefix="neo4j-warmup") as executor:
+                for future in [executor.submit(_ping) for _ in range(size)]:
+                    future.result()
+            logger.info("Пул соединений Neo4j прогрет: %d соединений", size)
+        except Exception as e:
+            logger.warning("Не удалось прогреть пул соединений Neo4j: %s", str(e))
+    
+    def ensure_indexes(self) -> None:
+        """
+        Создание индексов, необходимых для запросов клиента
+        
+        Операторы идемпотентны (IF NOT EXISTS), поэтому безопасны при каждом
+        подключении. Ошибка создания индекса не прерывает работу клиента.
+        """
+        try:
+            with self.driver.session() as session:
+                for statement in SCHEMA_INDEXES:
+                    session.run(statement).consume()
+            logger.debug("Индексы Neo4j проверены")
+        except Exception as e:
+            logger.warning("Не удалось создать индексы Neo4j: %s", str(e))
     
     def close(self) -> None:
         """
@@ -55,8 +226,56 @@ class Neo4jClient:
         """
         if self.driver:
             self.driver.close()
+            self.driver = None
             logger.info("Соединение с Neo4j закрыто")
     
+    async def async_close(self) -> None:
+        """
+        Закрытие асинхронного драйвера Neo4j
+        """
+        if self.async_driver:
+            await self.async_driver.close()
+            self.async_driver = None
+            logger.info("Асинхронное соединение с Neo4j закрыто")
+    
+    def _get_async_driver(self):
+        """
+        Получение асинхронного драйвера Neo4j (создается при первом обращении)
+        
+        Returns:
+            Асинхронный драйвер Neo4j
+        """
+        if self.async_driver is None:
+            self.async_driver = AsyncGraphDatabase.driver(
+                self.uri,
+                auth=(self.user, self.password),
+                max_connection_pool_size=NEO4J_MAX_POOL_SIZE,
+                connection_acquisition_timeout=NEO4J_ACQUISITION_TIMEOUT
+            )
+        return self.async_driver
+    
+    async def async_execute_read(self, query: str, params: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """
+        Асинхронное выполнение Cypher-запроса на чтение
+        
+        Args:
+            query: Cypher-запрос
+            params: Параметры запроса
+        
+        Returns:
+            Список результатов запроса
+        """
+        async def _work(tx):
+            result = await tx.run(query, params or {})
+            return await result.data()
+        
+        try:
+            async with self._get_async_driver().session() as session:
+                return await session.execute_read(_work)
+        except Exception as e:
+            logger.error("Ошибка выполнения асинхронного запроса: %s", str(e))
+            raise
+    
     def execute_query(self, query: str, params: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
         """
         Выполнение Cypher-запроса
@@ -190,7 +409,7 @@ class Neo4jClient:
         self,
         chapter_title: str,
         difficulty: str = "basic",
-        excluded_concepts: List[str] = None
+        excluded_concepts: Optional[Sequence[str]] = None
     ) -> Dict[str, Any]:
         """
         Получение случайного понятия из главы с учетом сложности
@@ -203,7 +422,7 @@ class Neo4jClient:
         Returns:
             Случайное понятие
         """
-        excluded = excluded_concepts or []
+        excluded = _excluded_param(excluded_concepts)
         
         # Для продвинутого уровня выбираем понятия, имеющие больше связей
         if difficulty == "advanced":
@@ -279,6 +498,61 @@ class Neo4jClient:
         
         return processed_concept
     
+    def get_random_concept_with_related(
+        self,
+        chapter_title: str,
+        difficulty: str = "basic",
+        excluded_concepts: Optional[Sequence[str]] = None,
+        limit: int = 5
+    ) -> Dict[str, Any]:
+        """
+        Получение случайного понятия из главы с учетом сложности вместе со связанными понятиями
+        
+        Выполняет за один запрос то же, что get_random_concept_by_chapter_and_difficulty
+        и get_related_concepts: понятия с подходящим для уровня количеством связей
+        выбираются в первую очередь, при их отсутствии берется любое понятие главы.
+        
+        Args:
+            chapter_title: Название главы
+            difficulty: Уровень сложности (basic/advanced)
+            excluded_concepts: Список понятий для исключения
+            limit: Ограничение по количеству связанных понятий
+        
+        Returns:
+            Случайное понятие с полем "related" (список связанных понятий)
+            или пустой словарь, если понятий нет
+        """
+        query = """
+        MATCH (ch:Chapter {title: $chapter_title})<-[:MENTIONED_IN]-(c:Concept)
+        WHERE NOT c.name IN $excluded_concepts
+        WITH c, size((c)-[]-(:Concept)) as relation_count
+        WITH c, relation_count,
+             CASE WHEN $advanced THEN relation_count > 2 ELSE relation_count <= 2 END as preferred
+        ORDER BY preferred DESC, rand()
+        LIMIT 1
+        OPTIONAL MATCH (c)-[r]->(related:Concept)
+        WITH c, relation_count, collect(CASE WHEN related IS NULL THEN NULL ELSE {
+            name: related.name, definition: related.definition,
+            relation_type: type(r), chapters_mentions: related.chapters_mentions
+        } END)[..$limit] AS related
+        RETURN c.name as name, c.definition as definition, c.example as example, 
+               c.questions as questions, c.chapters_mentions as chapters_mentions,
+               relation_count, related
+        """
+        result = self.execute_query(query, {
+            "chapter_title": chapter_title,
+            "excluded_concepts": _excluded_param(excluded_concepts),
+            "advanced": difficulty == "advanced",
+            "limit": limit
+        })
+        
+        if not result:
+            return {}
+        
+        # Контекстное определение для главы применяем только к выбранному понятию,
+        # как и при раздельных запросах
+        return self._apply_chapter_mentions(result, chapter_title)[0]
+    
     def get_related_concepts(
         self, concept_name: str, chapter_title: Optional[str] = None, 
         relation_type: Optional[str] = None, limit: int = 5
@@ -296,6 +570,9 @@ class Neo4jClient:
             Список связанных понятий
         """
         if relation_type:
+            # Тип связи подставляется в текст запроса, поэтому проверяем его формат
+            if not _RELATION_TYPE_RE.match(relation_type):
+                raise ValueError(f"Недопустимый тип связи: {relation_type}")
             query = f"""
             MATCH (c:Concept {{name: $concept_name}})-[r:{relation_type}]->(related:Concept)
             RETURN related.name as name, related.definition as definition, 
@@ -340,6 +617,87 @@ class Neo4jClient:
         else:
             return related_concepts
     
+    def get_chapter_bundle(
+        self, chapter_title: str, limit: int = 20, related_limit: int = 5
+    ) -> List[Dict[str, Any]]:
+        """
+        Получение понятий главы вместе со связанными понятиями одним запросом
+        
+        Args:
+            chapter_title: Название главы
+            limit: Ограничение по количеству понятий
+            related_limit: Ограничение по количеству связанных понятий для каждого понятия
+        
+        Returns:
+            Список понятий главы; у каждого в поле "related" список связанных понятий
+        """
+        query = """
+        MATCH (ch:Chapter {title: $chapter_title})<-[:MENTIONED_IN]-(c:Concept)
+        WITH c LIMIT $limit
+        OPTIONAL MATCH (c)-[r]->(related:Concept)
+        WITH c, collect(CASE WHEN related IS NULL THEN NULL ELSE {
+            name: related.name, definition: related.definition,
+            relation_type: type(r), chapters_mentions: related.chapters_mentions
+        } END)[..$related_limit] AS related
+        RETURN c.name as name, c.definition as definition, c.example as example, 
+               c.questions as questions, c.chapters_mentions as chapters_mentions,
+               related
+        """
+        concepts = self.execute_query(query, {
+            "chapter_title": chapter_title,
+            "limit": limit,
+            "related_limit": related_limit
+        })
+        
+        # Контекстные определения применяем и к понятиям главы, и к связанным понятиям
+        processed_concepts = self._apply_chapter_mentions(concepts, chapter_title)
+        for concept in processed_concepts:
+            concept["related"] = self._apply_chapter_mentions(concept.get("related") or [], chapter_title)
+        
+        return processed_concepts
+    
+    def pick_random_concept(
+        self, chapter_title: str, excluded: Optional[Sequence[str]] = None, related_limit: int = 5
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Выбор случайного понятия главы вместе со связанными понятиями
+        
+        Случайный выбор выполняется на стороне Neo4j, поэтому по сети
+        передается только одно понятие, а не весь список понятий главы.
+        
+        Args:
+            chapter_title: Название главы
+            excluded: Названия понятий, которые не нужно выбирать (опционально)
+            related_limit: Ограничение по количеству связанных понятий
+        
+        Returns:
+            Понятие с полем "related" (список связанных понятий) или None, если понятий нет
+        """
+        query = """
+        MATCH (ch:Chapter {title: $chapter_title})<-[:MENTIONED_IN]-(c:Concept)
+        WHERE NOT c.name IN $excluded
+        WITH c ORDER BY rand() LIMIT 1
+        OPTIONAL MATCH (c)-[r]->(related:Concept)
+        WITH c, collect(CASE WHEN related IS NULL THEN NULL ELSE {
+            name: related.name, definition: related.definition,
+            relation_type: type(r), chapters_mentions: related.chapters_mentions
+        } END)[..$related_limit] AS related
+        RETURN c.name as name, c.definition as definition, c.example as example, 
+               c.questions as questions, c.chapters_mentions as chapters_mentions,
+               related
+        """
+        concepts = self.execute_query(query, {
+            "chapter_title": chapter_title,
+            "excluded": _excluded_param(excluded),
+            "related_limit": related_limit
+        })
+        if not concepts:
+            return None
+        
+        concept = self._apply_chapter_mentions(concepts, chapter_title)[0]
+        concept["related"] = self._apply_chapter_mentions(concept.get("related") or [], chapter_title)
+        return concept
+    
     def update_student_progress(
         self, 
         student_id: str, 
@@ -500,29 +858,7 @@ class Neo4jClient:
         if not results:
             return {}
         
-        concept = results[0]
-        
-        # Если задана глава, обрабатываем контекстное определение
-        if chapter_title and concept.get("chapters_mentions"):
-            try:
-                import json
-                # Пытаемся распарсить JSON с упоминаниями по главам
-                chapters_mentions = json.loads(concept["chapters_mentions"]) if isinstance(concept["chapters_mentions"], str) else concept["chapters_mentions"]
-                
-                # Если есть определение для этой главы, используем его
-                if chapter_title in chapters_mentions:
-                    chapter_info = chapters_mentions[chapter_title]
-                    if "definition" in chapter_info:
-                        concept["definition"] = chapter_info["definition"]
-                    if "example" in chapter_info:
-                        concept["example"] = chapter_info["example"]
-                    if "questions" in chapter_info:
-                        concept["questions"] = chapter_info["questions"]
-            except Exception as e:
-                # Логируем ошибку и используем общее определение
-                logging.error(f"Ошибка при обработке chapters_mentions для понятия {concept_name}: {e}")
-        
-        return concept
+        return self._apply_chapter_mentions(results[:1], chapter_title)[0]
 
     def save_student(self, student):
         """
@@ -680,6 +1016,35 @@ class Neo4jClient:
         }
         return self.execute_query(query, params)
     
+    def save_assistant_interactions_bulk(self, interactions: List[Dict[str, Any]]) -> int:
+        """
+        Сохранение нескольких взаимодействий с помощником одним запросом
+        
+        Args:
+            interactions: Список словарей с ключами student_id, question, answer,
+                chapter_title и created_at (время в миллисекундах)
+            
+        Returns:
+            Количество сохраненных взаимодействий
+        """
+        if not interactions:
+            return 0
+        
+        query = """
+        UNWIND $rows AS row
+        MATCH (s:Student {telegram_id: row.student_id})
+        CREATE (i:Interaction {
+            question: row.question,
+            answer: row.answer,
+            chapter_title: row.chapter_title,
+            created_at: row.created_at
+        })
+        CREATE (s)-[:ASKED]->(i)
+        RETURN count(i) AS saved
+        """
+        results = self.execute_query(query, {"rows": interactions})
+        return results[0]["saved"] if results else 0
+    
     def search_concepts_by_keywords(self, keywords, chapter_title=None, limit=10):
         """
         Поиск понятий по ключевым словам
@@ -692,43 +1057,78 @@ class Neo4jClient:
         Returns:
             Список понятий, соответствующих ключевым словам
         """
-        # Составляем условия для поиска по каждому ключевому слову
-        keyword_conditions = []
-        for i, keyword in enumerate(keywords):
-            # Ищем ключевое слово в названии или определении понятия
-            keyword_conditions.append(f"c.name =~ '(?i).*{keyword}.*' OR c.definition =~ '(?i).*{keyword}.*'")
+        query, params = self._build_keyword_search_query(keywords, chapter_title, limit)
+        results = self.execute_query(query, params)
+        return self._apply_chapter_mentions(results, chapter_title)
+    
+    async def async_search_concepts_by_keywords(self, keywords, chapter_title=None, limit=10):
+        """
+        Асинхронный поиск понятий по ключевым словам
         
-        # Объединяем условия через ИЛИ
-        keyword_query = " OR ".join(keyword_conditions)
+        Args:
+            keywords: Список ключевых слов
+            chapter_title: Название главы (опционально)
+            limit: Ограничение по количеству результатов
+            
+        Returns:
+            Список понятий, соответствующих ключевым словам
+        """
+        query, params = self._build_keyword_search_query(keywords, chapter_title, limit)
+        results = await self.async_execute_read(query, params)
+        return self._apply_chapter_mentions(results, chapter_title)
+    
+    def _build_keyword_search_query(self, keywords, chapter_title=None, limit=10):
+        """
+        Построение запроса поиска понятий по ключевым словам
         
-        # Базовый запрос
+        Args:
+            keywords: Список ключевых слов
+            chapter_title: Название главы (опционально)
+            limit: Ограничение по количеству результатов
+            
+        Returns:
+            Кортеж (Cypher-запрос, параметры запроса)
+        """
+        # Текст запроса не зависит от ключевых слов: они передаются параметром,
+        # поэтому Neo4j повторно использует скомпилированный план выполнения
         if chapter_title:
             # Если указана глава, ищем только понятия, связанные с этой главой
-            query = f"""
-            MATCH (ch:Chapter {{title: $chapter_title}})<-[:MENTIONED_IN]-(c:Concept)
-            WHERE {keyword_query}
+            query = """
+            MATCH (ch:Chapter {title: $chapter_title})<-[:MENTIONED_IN]-(c:Concept)
+            WHERE any(kw IN $keywords WHERE toLower(c.name) CONTAINS kw OR toLower(c.definition) CONTAINS kw)
             RETURN c.name as name, c.definition as definition, c.example as example, 
                   c.questions as questions, c.chapters_mentions as chapters_mentions
             LIMIT $limit
             """
         else:
             # Иначе ищем по всей базе знаний
-            query = f"""
+            query = """
             MATCH (c:Concept)
-            WHERE {keyword_query}
+            WHERE any(kw IN $keywords WHERE toLower(c.name) CONTAINS kw OR toLower(c.definition) CONTAINS kw)
             RETURN c.name as name, c.definition as definition, c.example as example, 
                   c.questions as questions, c.chapters_mentions as chapters_mentions
             LIMIT $limit
             """
         
         params = {
+            "keywords": [keyword.lower() for keyword in keywords],
             "chapter_title": chapter_title,
             "limit": limit
         }
         
-        # Выполняем запрос
-        results = self.execute_query(query, params)
+        return query, params
+    
+    def _apply_chapter_mentions(self, results, chapter_title=None):
+        """
+        Замена общих определений понятий на определения из указанной главы
         
+        Args:
+            results: Результаты поиска понятий
+            chapter_title: Название главы (опционально)
+            
+        Returns:
+            Обработанный список понятий
+        """
         # Обрабатываем результаты, извлекая контекстные определения
         processed_results = []
         for concept in results:
@@ -783,6 +1183,149 @@ class Neo4jClient:
         
         return self.execute_query(query, params)
     
+    async def async_get_concept_connections(self, concept_name, limit=10):
+        """
+        Асинхронное получение связей понятия с другими понятиями
+        
+        Args:
+            concept_name: Название понятия
+            limit: Ограничение по количеству результатов
+            
+        Returns:
+            Список связей понятия
+        """
+        query = """
+        MATCH (c:Concept {name: $concept_name})-[r]->(related:Concept)
+        RETURN type(r) as type, related.name as concept
+        LIMIT $limit
+        """
+        
+        params = {
+            "concept_name": concept_name,
+            "limit": limit
+        }
+        
+        return await self.async_execute_read(query, params)
+    
+    def get_concept_connections_batch(self, concept_names: List[str], limit: int = 10) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Получение связей сразу для нескольких понятий одним запросом
+        
+        Args:
+            concept_names: Список названий понятий
+            limit: Ограничение по количеству связей для каждого понятия
+            
+        Returns:
+            Словарь {название понятия: список связей}
+        """
+        if not concept_names:
+            return {}
+        
+        query = """
+        UNWIND $concept_names AS concept_name
+        MATCH (c:Concept {name: concept_name})-[r]->(related:Concept)
+        WITH concept_name, collect({type: type(r), concept: related.name})[..$limit] AS relations
+        RETURN concept_name, relations
+        """
+        
+        params = {
+            "concept_names": list(concept_names),
+            "limit": limit
+        }
+        
+        results = self.execute_query(query, params)
+        return {record["concept_name"]: record["relations"] for record in results}
+    
+    async def async_get_concept_connections_batch(self, concept_names: List[str], limit: int = 10) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Асинхронное получение связей сразу для нескольких понятий одним запросом
+        
+        Args:
+            concept_names: Список названий понятий
+            limit: Ограничение по количеству связей для каждого понятия
+            
+        Returns:
+            Словарь {название понятия: список связей}
+        """
+        if not concept_names:
+            return {}
+        
+        query = """
+        UNWIND $concept_names AS concept_name
+        MATCH (c:Concept {name: concept_name})-[r]->(related:Concept)
+        WITH concept_name, collect({type: type(r), concept: related.name})[..$limit] AS relations
+        RETURN concept_name, relations
+        """
+        
+        params = {
+            "concept_names": list(concept_names),
+            "limit": limit
+        }
+        
+        results = await self.async_execute_read(query, params)
+        return {record["concept_name"]: record["relations"] for record in results}
+    
+    def _get_cached_chapter_info(self, chapter_title: str) -> Optional[Dict[str, Any]]:
+        """
+        Получение информации о главе из кэша клиента
+        
+        Args:
+            chapter_title: Название главы
+            
+        Returns:
+            Информация о главе или None, если ее нет в кэше
+        """
+        chapter_info = self._chapter_info_cache.get(chapter_title)
+        return None if chapter_info is MISSING else chapter_info
+    
+    def _cache_chapter_info(self, chapter_title: str, chapter_info: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Сохранение информации о главе в кэш клиента (пустые результаты не кэшируются)
+        
+        Args:
+            chapter_title: Название главы
+            chapter_info: Информация о главе
+            
+        Returns:
+            Та же информация о главе
+        """
+        if chapter_info:
+            self._chapter_info_cache.set(chapter_title, chapter_info)
+        return chapter_info
+    
+    def clear_chapter_info_cache(self) -> None:
+        """
+        Сброс кэша информации о главах (вызывается после изменения глав в графе)
+        """
+        self._chapter_info_cache.invalidate()
+        with self._chapter_info_lock:
+            self._chapter_table = None
+    
+    def get_chapter_table(self, refresh: bool = False) -> ChapterTable:
+        """
+        Получение таблицы всех глав курса (загружается одним запросом и хранится в клиенте)
+        
+        Args:
+            refresh: Перезагрузить таблицу из графа
+            
+        Returns:
+            Таблица глав
+        """
+        with self._chapter_info_lock:
+            table = self._chapter_table
+        if table is not None and not refresh:
+            return table
+        query = """
+        MATCH (ch:Chapter)
+        RETURN ch.title AS title, ch.main_ideas AS main_ideas
+        ORDER BY title
+        """
+        table = ChapterTable(self.execute_query(query))
+        with self._chapter_info_lock:
+            self._chapter_table = table
+        logger.info("Загружена таблица глав: %d", len(table))
+        return table
+    
     def get_chapter_info(self, chapter_title):
         """
         Получение информации о главе
@@ -793,6 +1336,9 @@ class Neo4jClient:
         Returns:
             Информация о главе
         """
+        cached = self._get_cached_chapter_info(chapter_title)
+        if cached is not None:
+            return cached
         query = """
         MATCH (ch:Chapter {title: $chapter_title})
         RETURN ch
@@ -800,8 +1346,111 @@ class Neo4jClient:
         results = self.execute_query(query, {"chapter_title": chapter_title})
         if not results:
             return {}
-        return results[0].get("ch", {})
+        return self._cache_chapter_info(chapter_title, results[0].get("ch", {}))
+    
+    async def async_get_chapter_info(self, chapter_title):
+        """
+        Асинхронное получение информации о главе
+        
+        Args:
+            chapter_title: Название главы
+            
+        Returns:
+            Информация о главе
+        """
+        cached = self._get_cached_chapter_info(chapter_title)
+        if cached is not None:
+            return cached
+        query = """
+        MATCH (ch:Chapter {title: $chapter_title})
+        RETURN ch
+        """
+        results = await self.async_execute_read(query, {"chapter_title": chapter_title})
+        if not results:
+            return {}
+        return self._cache_chapter_info(chapter_title, results[0].get("ch", {}))
+    
+    def get_concept_with_chapter(self, concept_name: str,
+                                 chapter_title: Optional[str] = None) -> Dict[str, Dict[str, Any]]:
+        """
+        Получение понятия и информации о главе одним запросом
+        
+        Заменяет пару вызовов get_concept_by_name и get_chapter_info. Если глава
+        уже есть в кэше клиента, запрашивается только понятие.
+        
+        Args:
+            concept_name: Название понятия
+            chapter_title: Название главы (опционально)
+            
+        Returns:
+            Словарь с ключами concept и chapter_info (пустые словари, если не найдены)
+        """
+        chapter_info = self._get_cached_chapter_info(chapter_title) if chapter_title else {}
+        if chapter_info is not None:
+            return {
+                "concept": self.get_concept_by_name(concept_name, chapter_title),
+                "chapter_info": chapter_info
+            }
+        
+        query = """
+        OPTIONAL MATCH (c:Concept {name: $concept_name})
+        OPTIONAL MATCH (ch:Chapter {title: $chapter_title})
+        RETURN c.name as name, c.definition as definition, c.example as example,
+               c.questions as questions, c.chapters_mentions as chapters_mentions, ch
+        """
+        results = self.execute_query(query, {"concept_name": concept_name, "chapter_title": chapter_title})
+        if not results:
+            return {"concept": {}, "chapter_info": {}}
+        
+        record = results[0]
+        chapter_info = self._cache_chapter_info(chapter_title, record.pop("ch", None) or {})
+        concept = {}
+        if record.get("name") is not None:
+            concept = self._apply_chapter_mentions([record], chapter_title)[0]
+        return {"concept": concept, "chapter_info": chapter_info}
 
+    def get_concept_context_bulk(
+        self, concept_names: List[str], related_limit: int = 5
+    ) -> Dict[str, Dict[str, List[Dict[str, Any]]]]:
+        """
+        Получение глав и связанных понятий сразу для нескольких понятий одним запросом
+        
+        Заменяет последовательные вызовы get_chapters_for_concept, get_chapter_info
+        и get_related_concepts для каждого понятия.
+        
+        Args:
+            concept_names: Список названий понятий
+            related_limit: Ограничение по количеству связанных понятий для каждого понятия
+            
+        Returns:
+            Словарь {название понятия: {"chapters": [название главы],
+            "related": [{name, relation_type}]}}; основные идеи глав берутся
+            из таблицы глав (get_chapter_table)
+        """
+        if not concept_names:
+            return {}
+        
+        query = """
+        UNWIND $concept_names AS concept_name
+        MATCH (c:Concept {name: concept_name})
+        OPTIONAL MATCH (c)-[:MENTIONED_IN]->(ch:Chapter)
+        WITH concept_name, c, collect(DISTINCT ch.title) AS chapters
+        OPTIONAL MATCH (c)-[r]->(related:Concept)
+        WITH concept_name, chapters, collect(CASE WHEN related IS NULL THEN NULL ELSE {
+            name: related.name, relation_type: type(r)
+        } END)[..$related_limit] AS related
+        RETURN concept_name, chapters, related
+        """
+        
+        results = self.execute_query(query, {
+            "concept_names": list(concept_names),
+            "related_limit": related_limit
+        })
+        return {
+            record["concept_name"]: {"chapters": record["chapters"], "related": record["related"]}
+            for record in results
+        }
+    
     def get_chapters_for_concept(self, concept_name: str) -> List[str]:
         """
         Получение списка глав, в которых упоминается понятие
@@ -940,6 +1589,123 @@ class Neo4jClient:
             return []
             
         except Exception as e:
-            logger.error(f"Ошибка при выполнении семантического поиска: {str(e)}")
-            logger.error(traceback.format_exc())
+            logger.exception("Ошибка при выполнении семантического поиска: %s", e)
+            return []
+
+    
+    def rebuild_embedding_matrix(self) -> int:
+        """
+        Загрузка эмбеддингов всех понятий одной плотной матрицей
+        
+        Вызывается при первом векторном поиске и после изменения понятий
+        в графе (например, после пересчета эмбеддингов).
+        
+        Returns:
+            Количество загруженных понятий
+        """
+        if not NUMPY_AVAILABLE:
+            return 0
+        query = f"""
+        MATCH (c:Concept)
+        WHERE c.{CONCEPT_EMBEDDING_FIELD} IS NOT NULL
+        RETURN c.name as name, c.definition as definition, c.example as example,
+               c.source_type as source_type, c.credibility_score as credibility_score,
+               c.{CONCEPT_EMBEDDING_FIELD} as embedding
+        """
+        results = self.execute_query(query)
+        concepts = []
+        vectors = []
+        for record in results:
+            embedding = record.pop("embedding")
+            if vectors and len(embedding) != len(vectors[0]):
+                logger.warning("Эмбеддинг понятия %s другой размерности пропущен", record.get("name"))
+                continue
+            concepts.append(record)
+            vectors.append(embedding)
+        
+        matrix = None
+        if vectors:
+            matrix = np.asarray(vectors, dtype=np.float32)
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            # Нормализуем строки, чтобы сходство считалось одним умножением на вектор
+            matrix /= np.where(norms == 0.0, 1.0, norms)
+        
+        with self._embedding_lock:
+            self._embedding_matrix = matrix
+            self._embedding_concepts = concepts
+        logger.info("Загружена матрица эмбеддингов понятий: %d", len(concepts))
+        return len(concepts)
+    
+    def semantic_search_fast(self, query_embedding: Any, top_k: int = 5,
+                             min_similarity: float = 0.5) -> List[Dict[str, Any]]:
+        """
+        Векторный поиск понятий по эмбеддингу запроса в памяти процесса
+        
+        Сходство со всеми понятиями считается одним матричным умножением,
+        из результатов выбираются top_k лучших без полной сортировки.
+        
+        Args:
+            query_embedding: Эмбеддинг запроса (той же модели, что и эмбеддинги понятий)
+            top_k: Максимальное количество результатов
+            min_similarity: Минимальное косинусное сходство
+            
+        Returns:
+            Список понятий в формате semantic_search (пустой, если поиск невозможен)
+        """
+        if not NUMPY_AVAILABLE or query_embedding is None:
             return []
+        with self._embedding_lock:
+            matrix = self._embedding_matrix
+            concepts = self._embedding_concepts
+        if concepts is None:
+            self.rebuild_embedding_matrix()
+            with self._embedding_lock:
+                matrix = self._embedding_matrix
+                concepts = self._embedding_concepts
+        if matrix is None:
+            return []
+        
+        vector = np.asarray(query_embedding, dtype=np.float32).ravel()
+        norm = float(np.linalg.norm(vector))
+        if norm == 0.0 or vector.shape[0] != matrix.shape[1]:
+            return []
+        scores = matrix @ (vector / norm)
+        
+        k = min(top_k, scores.shape[0])
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        
+        results = []
+        for index in top:
+            similarity = float(scores[index])
+            if similarity < min_similarity:
+                break
+            concept = dict(concepts[index])
+            concept["similarity"] = similarity
+            concept["weighted_score"] = similarity * (concept.get("credibility_score") or 1.0)
+            results.append(concept)
+        return results
+
+
+# Общий клиент Neo4j для всего процесса
+_shared_client: Optional[Neo4jClient] = None
+_shared_client_lock = threading.Lock()
+
+
+def get_shared_client() -> Neo4jClient:
+    """
+    Получение общего для процесса клиента Neo4j
+    
+    Клиент создается при первом обращении, все агенты используют один драйвер
+    и его пул соединений. Соединение закрывается при завершении процесса.
+    
+    Returns:
+        Клиент Neo4j
+    """
+    global _shared_client
+    if _shared_client is None:
+        with _shared_client_lock:
+            if _shared_client is None:
+                _shared_client = Neo4jClient()
+                atexit.register(_shared_client.close)
+    return _shared_client
@@ -0,0 +1,117 @@
+"""
+Модуль LRU-кэша с ограниченным временем жизни записей.
+Используется для кэширования результатов запросов к Neo4j,
+которые редко меняются (понятия, связи, информация о главах).
+"""
+
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Tuple
+
+from ai_tutor.config.constants import CACHE_TTL
+
+logger = logging.getLogger(__name__)
+
+# Маркер отсутствия значения в кэше (None - допустимое кэшируемое значение)
+MISSING = object()
+
+
+class QueryCache:
+    """
+    Потокобезопасный LRU-кэш с TTL для результатов запросов
+    """
+
+    def __init__(self, name: str, max_size: int = 4096, ttl: int = CACHE_TTL):
+        """
+        Инициализация кэша
+
+        Args:
+            name: Имя кэша (используется в логах и статистике)
+            max_size: Максимальное количество записей
+            ttl: Время жизни записи в секундах
+        """
+        self.name = name
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Any:
+        """
+        Получение значения из кэша
+
+        Args:
+            key: Ключ записи
+
+        Returns:
+            Закэшированное значение или MISSING, если записи нет или она устарела
+        """
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None:
+                timestamp, value = item
+                if time.monotonic() - timestamp <= self.ttl:
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return MISSING
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """
+        Сохранение значения в кэш
+
+        Args:
+            key: Ключ записи
+            value: Значение
+        """
+        with self._lock:
+            self._data[key] = (time.monotonic(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Hashable) -> None:
+        """
+        Удаление записи из кэша
+
+        Args:
+            key: Ключ записи
+        """
+        with self._lock:
+            self._data.pop(key, None)
+
+    def invalidate(self) -> None:
+        """
+        Полная очистка кэша
+        """
+        with self._lock:
+            size = len(self._data)
+            self._data.clear()
+        logger.info("Кэш '%s' очищен. Удалено %s записей.", self.name, size)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Возвращает статистику использования кэша
+
+        Returns:
+            Словарь со статистикой кэша
+        """
+        total = self.hits + self.misses
+        return {
+            "name": self.name,
+            "entries": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "ttl": self.ttl,
+            "max_size": self.max_size
+        }
+
+    def __len__(self) -> int:
+        return len(self._data)
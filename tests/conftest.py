@@ -0,0 +1,22 @@
+"""
+Общие настройки тестов: модули проекта импортируются от корня репозитория
+"""
+import importlib.util
+import os
+import sys
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+sys.path.insert(0, ROOT_DIR)
+
+# Модули проекта импортируют друг друга с префиксом ai_tutor (как в контейнере);
+# если пакет не установлен, регистрируем корень репозитория под этим именем
+if importlib.util.find_spec("ai_tutor") is None:
+    _spec = importlib.util.spec_from_file_location(
+        "ai_tutor",
+        os.path.join(ROOT_DIR, "__init__.py"),
+        submodule_search_locations=[ROOT_DIR]
+    )
+    _package = importlib.util.module_from_spec(_spec)
+    sys.modules["ai_tutor"] = _package
+    _spec.loader.exec_module(_package)
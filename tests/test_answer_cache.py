@@ -0,0 +1,79 @@
+"""
+Тесты кэша ответов: точное и семантическое совпадение вопроса
+"""
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("neo4j")
+pytest.importorskip("openai")
+pytest.importorskip("dotenv")
+
+from ai_tutor.agents.answer_cache import AnswerCache, normalize_question
+
+
+def _vector(*values):
+    return np.array(values, dtype=np.float32)
+
+
+def test_normalize_question():
+    assert normalize_question("  Что такое   СИСТЕМА?! ") == "что такое система"
+
+
+def test_exact_hit_ignores_case_and_punctuation():
+    cache = AnswerCache(max_size=8)
+    cache.put("Что такое система?", "Ответ", context="Глава 1")
+
+    assert cache.get("что такое система", context="Глава 1") == "Ответ"
+    assert cache.get_stats()["hits"] == 1
+
+
+def test_exact_hit_is_scoped_to_context():
+    cache = AnswerCache(max_size=8)
+    cache.put("Что такое система?", "Ответ", context="Глава 1")
+
+    assert cache.get("Что такое система?", context="Глава 2") is None
+
+
+def test_semantic_hit_above_threshold():
+    cache = AnswerCache(max_size=8, threshold=0.9)
+    cache.put("Что такое система?", "Ответ", context="Глава 1", embedding=_vector(1.0, 0.0, 0.0))
+
+    answer = cache.get("Объясните понятие системы", context="Глава 1", embedding=_vector(0.99, 0.1, 0.0))
+
+    assert answer == "Ответ"
+    assert cache.get_stats()["semantic_hits"] == 1
+
+
+def test_semantic_miss_below_threshold():
+    cache = AnswerCache(max_size=8, threshold=0.9)
+    cache.put("Что такое система?", "Ответ", context="Глава 1", embedding=_vector(1.0, 0.0, 0.0))
+
+    assert cache.get("Что такое эмерджентность?", context="Глава 1", embedding=_vector(0.0, 1.0, 0.0)) is None
+    assert cache.get_stats()["misses"] == 1
+
+
+def test_semantic_hit_uses_best_match():
+    cache = AnswerCache(max_size=8, threshold=0.5)
+    cache.put("Вопрос 1", "Ответ 1", context="ctx", embedding=_vector(1.0, 0.0))
+    cache.put("Вопрос 2", "Ответ 2", context="ctx", embedding=_vector(0.0, 1.0))
+
+    assert cache.get("Похожий на второй", context="ctx", embedding=_vector(0.2, 1.0)) == "Ответ 2"
+
+
+def test_exact_entries_are_evicted_lru():
+    cache = AnswerCache(max_size=2)
+    cache.put("Вопрос 1", "Ответ 1")
+    cache.put("Вопрос 2", "Ответ 2")
+    cache.put("Вопрос 3", "Ответ 3")
+
+    assert cache.get("Вопрос 1") is None
+    assert cache.get("Вопрос 3") == "Ответ 3"
+
+
+def test_invalidate_clears_both_levels():
+    cache = AnswerCache(max_size=8)
+    cache.put("Вопрос", "Ответ", context="ctx", embedding=_vector(1.0, 0.0))
+    cache.invalidate()
+
+    assert cache.get("Вопрос", context="ctx", embedding=_vector(1.0, 0.0)) is None
+    assert cache.get_stats()["semantic_entries"] == 0
@@ -0,0 +1,81 @@
+"""
+Тесты переходов состояний автоматического выключателя
+"""
+from api.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+
+
+def _open_breaker(reset_timeout=60.0):
+    breaker = CircuitBreaker("test", fail_threshold=3, reset_timeout=reset_timeout, jitter=0.0)
+    for _ in range(3):
+        breaker.record_failure()
+    return breaker
+
+
+def test_closed_until_threshold():
+    breaker = CircuitBreaker("test", fail_threshold=3)
+    breaker.record_failure()
+    breaker.record_failure()
+
+    assert breaker.state == CLOSED
+    assert not breaker.is_open()
+
+
+def test_success_resets_failure_count():
+    breaker = CircuitBreaker("test", fail_threshold=3)
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+
+    assert breaker.state == CLOSED
+
+
+def test_opens_after_threshold_and_rejects_calls():
+    breaker = _open_breaker()
+
+    assert breaker.state == OPEN
+    assert breaker.is_open()
+    assert breaker.get_stats()["retry_in"] > 0
+
+
+def test_half_open_lets_one_trial_through():
+    breaker = _open_breaker(reset_timeout=0.0)
+
+    assert not breaker.is_open()
+    assert breaker.state == HALF_OPEN
+    # Пока пробный вызов не завершен, остальные отклоняются
+    assert breaker.is_open()
+
+
+def test_trial_success_closes():
+    breaker = _open_breaker(reset_timeout=0.0)
+    breaker.is_open()
+    breaker.record_success()
+
+    assert breaker.state == CLOSED
+    assert not breaker.is_open()
+    assert breaker.get_stats()["open_count"] == 0
+
+
+def test_trial_failure_reopens_with_longer_pause():
+    breaker = _open_breaker(reset_timeout=0.0)
+    breaker.is_open()
+    breaker.reset_timeout = 10.0
+    breaker.record_failure()
+
+    assert breaker.state == OPEN
+    assert breaker.get_stats()["open_count"] == 2
+    # Вторая пауза подряд вдвое длиннее начальной
+    assert breaker.get_stats()["retry_in"] > 10.0
+
+
+def test_release_trial_allows_next_trial():
+    breaker = _open_breaker(reset_timeout=0.0)
+    assert not breaker.is_open()
+    assert breaker.is_open()
+
+    breaker.release_trial()
+
+    assert breaker.state == HALF_OPEN
+    assert not breaker.is_open()
@@ -0,0 +1,78 @@
+"""
+Тесты выключателя вызовов OpenRouter API в TutorCrew без сети и базы данных
+"""
+import asyncio
+
+import pytest
+
+pytest.importorskip("neo4j")
+pytest.importorskip("openai")
+httpx = pytest.importorskip("httpx")
+
+from ai_tutor.agents import crew as crew_module
+from ai_tutor.api.circuit_breaker import CircuitBreaker
+from ai_tutor.api.openrouter import OpenRouterClient
+
+CONCEPT = {"name": "Система", "definition": "Определение системы", "related": []}
+
+
+class _FakeNeo4jClient:
+    def pick_random_concept(self, chapter_title, excluded_concepts=None):
+        return dict(CONCEPT)
+
+
+def _make_crew(monkeypatch):
+    """
+    Команда с клиентом OpenRouter, у которого нет соединения с API
+    """
+    monkeypatch.setattr(crew_module, "get_shared_client", _FakeNeo4jClient)
+    monkeypatch.setattr(crew_module, "_breaker", CircuitBreaker("test", fail_threshold=5))
+
+    client = OpenRouterClient.__new__(OpenRouterClient)
+    client.api_key = "test-key"
+    client.calls = 0
+
+    async def generate_completion(*args, **kwargs):
+        client.calls += 1
+        raise httpx.ConnectError("Connection refused")
+
+    client.generate_completion = generate_completion
+    client.collect_stream_completion = generate_completion
+    return crew_module.TutorCrew(client), client
+
+
+def test_connect_error_opens_breaker_after_five_calls(monkeypatch):
+    tutor_crew, client = _make_crew(monkeypatch)
+
+    async def run():
+        tasks = []
+        for _ in range(6):
+            tasks.append(await tutor_crew.async_generate_task("Глава 1", "template", "standard"))
+        return tasks
+
+    try:
+        tasks = asyncio.run(run())
+    finally:
+        tutor_crew.close()
+
+    # Пять ошибок соединения размыкают выключатель, шестой вызов до API не доходит
+    assert client.calls == 5
+    assert crew_module._breaker.is_open()
+    assert all(task["task_type"] == "template" for task in tasks)
+
+
+def test_connect_error_in_check_counts_as_failure(monkeypatch):
+    tutor_crew, client = _make_crew(monkeypatch)
+    task = {"task_type": "creative", "question": "Что такое система?", "concept_name": ""}
+
+    async def run():
+        return await tutor_crew.async_check_answer("student", "Глава 1", task, "Ответ")
+
+    try:
+        result = asyncio.run(run())
+    finally:
+        tutor_crew.close()
+
+    assert client.calls == 1
+    assert crew_module._breaker.get_stats()["failures"] == 1
+    assert "error" not in result
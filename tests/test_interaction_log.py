@@ -0,0 +1,66 @@
+"""
+Тесты фоновой пакетной записи взаимодействий без подключения к Neo4j
+"""
+import asyncio
+
+import pytest
+
+pytest.importorskip("neo4j")
+pytest.importorskip("openai")
+pytest.importorskip("dotenv")
+
+from ai_tutor.agents.interaction_log import InteractionLogWriter
+
+
+class _FakeNeo4jClient:
+    def __init__(self):
+        self.batches = []
+
+    def save_assistant_interactions_bulk(self, batch):
+        self.batches.append([item["question"] for item in batch])
+        return len(batch)
+
+
+def test_interactions_are_written_in_batches():
+    client = _FakeNeo4jClient()
+    writer = InteractionLogWriter(client, batch_size=2, batch_wait=0.05)
+
+    async def run():
+        for i in range(5):
+            assert writer.put("student", f"Вопрос {i}", "Ответ", "Глава 1")
+        await writer.close()
+
+    asyncio.run(run())
+
+    assert client.batches == [["Вопрос 0", "Вопрос 1"], ["Вопрос 2", "Вопрос 3"], ["Вопрос 4"]]
+
+
+def test_close_drains_queue_and_stops_task():
+    client = _FakeNeo4jClient()
+    writer = InteractionLogWriter(client, batch_size=50, batch_wait=10.0)
+
+    async def run():
+        writer.put("student", "Вопрос", "Ответ")
+        # Пакет не заполнен и ожидание не истекло: запись выполняет close()
+        await writer.close()
+        return writer.get_stats()
+
+    stats = asyncio.run(run())
+
+    assert client.batches == [["Вопрос"]]
+    assert stats == {"queued": 0, "running": False}
+
+
+def test_full_queue_rejects_interaction():
+    client = _FakeNeo4jClient()
+    writer = InteractionLogWriter(client, batch_size=1, max_queue_size=1)
+
+    async def run():
+        accepted = [writer.put("student", f"Вопрос {i}", "Ответ") for i in range(3)]
+        await writer.close()
+        return accepted
+
+    accepted = asyncio.run(run())
+
+    assert accepted[0] is True
+    assert False in accepted
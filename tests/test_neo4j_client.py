@@ -0,0 +1,107 @@
+"""
+Тесты получения понятий в Neo4jClient без подключения к базе
+"""
+import json
+import threading
+
+import pytest
+
+pytest.importorskip("neo4j")
+
+from database.neo4j_client import Neo4jClient
+from ai_tutor.database.query_cache import QueryCache
+
+CHAPTERS_MENTIONS = json.dumps({
+    "Глава 1": {"definition": "Определение из главы 1", "example": "Пример из главы 1"}
+})
+
+
+def _concept_record():
+    return {
+        "name": "Система",
+        "definition": "Общее определение",
+        "example": "Общий пример",
+        "questions": [],
+        "chapters_mentions": CHAPTERS_MENTIONS
+    }
+
+
+def _make_client(results):
+    """
+    Клиент без драйвера: execute_query возвращает заданные записи
+    """
+    client = Neo4jClient.__new__(Neo4jClient)
+    client._chapter_info_cache = QueryCache("chapter_info", max_size=16)
+    client._chapter_info_lock = threading.Lock()
+    client.queries = []
+
+    def execute_query(query, params=None):
+        client.queries.append(params)
+        return [dict(record) for record in results]
+
+    client.execute_query = execute_query
+    return client
+
+
+def test_get_concept_by_name_uses_chapter_definition():
+    client = _make_client([_concept_record()])
+
+    concept = client.get_concept_by_name("Система", "Глава 1")
+
+    assert concept["name"] == "Система"
+    assert concept["definition"] == "Определение из главы 1"
+    assert concept["example"] == "Пример из главы 1"
+
+
+def test_get_concept_by_name_without_chapter_keeps_general_definition():
+    client = _make_client([_concept_record()])
+
+    concept = client.get_concept_by_name("Система")
+
+    assert concept["definition"] == "Общее определение"
+
+
+def test_get_concept_by_name_not_found():
+    client = _make_client([])
+
+    assert client.get_concept_by_name("Нет такого", "Глава 1") == {}
+
+
+def test_get_concept_with_chapter_single_query():
+    record = _concept_record()
+    record["ch"] = {"title": "Глава 1", "main_ideas": "Основные идеи"}
+    client = _make_client([record])
+
+    result = client.get_concept_with_chapter("Система", "Глава 1")
+
+    assert len(client.queries) == 1
+    assert result["concept"]["definition"] == "Определение из главы 1"
+    assert "ch" not in result["concept"]
+    assert result["chapter_info"] == {"title": "Глава 1", "main_ideas": "Основные идеи"}
+
+
+def test_get_concept_with_chapter_uses_cached_chapter():
+    client = _make_client([_concept_record()])
+    client._cache_chapter_info("Глава 1", {"title": "Глава 1", "main_ideas": "Основные идеи"})
+
+    result = client.get_concept_with_chapter("Система", "Глава 1")
+
+    assert result["concept"]["definition"] == "Определение из главы 1"
+    assert result["chapter_info"]["main_ideas"] == "Основные идеи"
+
+
+def test_get_concept_with_chapter_concept_not_found():
+    client = _make_client([{"name": None, "ch": {"title": "Глава 1"}}])
+
+    result = client.get_concept_with_chapter("Нет такого", "Глава 1")
+
+    assert result["concept"] == {}
+    assert result["chapter_info"] == {"title": "Глава 1"}
+
+
+def test_chapter_info_cache_expires():
+    client = _make_client([])
+    client._chapter_info_cache = QueryCache("chapter_info", max_size=16, ttl=0)
+    client._cache_chapter_info("Глава 1", {"title": "Глава 1"})
+
+    assert client._get_cached_chapter_info("Глава 1") is None
@@ -0,0 +1,119 @@
+"""
+Тесты разбора ответов модели и группировки запросов без обращения к API
+"""
+import asyncio
+
+import pytest
+
+pytest.importorskip("openai")
+pytest.importorskip("httpx")
+pytest.importorskip("dotenv")
+
+from ai_tutor.api.openrouter import Completion, _BatchDispatcher, _extract_json, _find_json
+
+
+def test_find_json_returns_span_of_first_valid_value():
+    text = 'Ответ: {"is_correct": true} и еще {"x": 1}'
+
+    span, result = _find_json(text)
+
+    assert result == {"is_correct": True}
+    assert text[span[0]:span[1]] == '{"is_correct": true}'
+
+
+def test_find_json_skips_invalid_candidates():
+    text = 'Варианты {A, B} не JSON, а это JSON: {"question": "Что такое {система}?"}'
+
+    span, result = _find_json(text)
+
+    assert result == {"question": "Что такое {система}?"}
+
+
+def test_find_json_without_json():
+    assert _find_json("Просто текст без скобок") == (None, None)
+
+
+def test_extract_json_wraps_arrays_and_plain_text():
+    assert _extract_json('Список: [1, 2, 3]') == {"data": [1, 2, 3]}
+    assert _extract_json("Ответ без JSON") == {"raw_text": "Ответ без JSON"}
+
+
+def test_extract_json_cached_span_returns_new_object():
+    text = 'Результат: {"options": [{"label": "A"}]} конец'
+
+    first = _extract_json(text)
+    first["options"].append({"label": "B"})
+    second = _extract_json(text)
+
+    assert second == {"options": [{"label": "A"}]}
+
+
+class _FakeClient:
+    def __init__(self, error=None):
+        self.calls = []
+        self.error = error
+
+    async def generate_completion(self, messages, **kwargs):
+        self.calls.append((messages, kwargs))
+        await asyncio.sleep(0)
+        if self.error is not None:
+            raise self.error
+        return Completion(content=messages[-1]["content"], finish_reason="stop", model="test", usage={})
+
+
+def _message(text):
+    return [{"role": "user", "content": text}]
+
+
+def test_dispatcher_deduplicates_identical_requests():
+    client = _FakeClient()
+    dispatcher = _BatchDispatcher(client, window=0.01)
+
+    async def run():
+        results = await asyncio.gather(
+            dispatcher.submit(_message("вопрос"), temperature=0.5),
+            dispatcher.submit(_message("вопрос"), temperature=0.5),
+            dispatcher.submit(_message("вопрос"), temperature=0.9),
+            dispatcher.submit(_message("другой вопрос"), temperature=0.5),
+        )
+        await dispatcher.aclose()
+        return results
+
+    results = asyncio.run(run())
+
+    # Одинаковые сообщения и параметры - один вызов API на всех ожидающих
+    assert len(client.calls) == 3
+    assert [result.content for result in results] == ["вопрос", "вопрос", "вопрос", "другой вопрос"]
+
+
+def test_dispatcher_passes_error_to_every_waiter():
+    client = _FakeClient(error=RuntimeError("API недоступен"))
+    dispatcher = _BatchDispatcher(client, window=0.01)
+
+    async def run():
+        results = await asyncio.gather(
+            dispatcher.submit(_message("вопрос")),
+            dispatcher.submit(_message("вопрос")),
+            return_exceptions=True
+        )
+        await dispatcher.aclose()
+        return results
+
+    results = asyncio.run(run())
+
+    assert len(client.calls) == 1
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+
+def test_dispatcher_aclose_sends_queued_requests():
+    client = _FakeClient()
+    dispatcher = _BatchDispatcher(client, window=0.01)
+
+    async def run():
+        pending = asyncio.ensure_future(dispatcher.submit(_message("вопрос")))
+        await asyncio.sleep(0)
+        await dispatcher.aclose()
+        return pending.result()
+
+    assert asyncio.run(run()).content == "вопрос"
+    assert dispatcher._worker is None
@@ -0,0 +1,75 @@
+"""
+Тесты LRU-кэша с ограниченным временем жизни записей
+"""
+import pytest
+
+from ai_tutor.database import query_cache
+from ai_tutor.database.query_cache import MISSING, QueryCache
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = _Clock()
+    monkeypatch.setattr(query_cache, "time", fake)
+    return fake
+
+
+def test_missing_key_returns_sentinel(clock):
+    cache = QueryCache("test", max_size=4, ttl=10)
+
+    assert cache.get("key") is MISSING
+    assert cache.get_stats()["misses"] == 1
+
+
+def test_none_is_a_cached_value(clock):
+    cache = QueryCache("test", max_size=4, ttl=10)
+    cache.set("key", None)
+
+    assert cache.get("key") is None
+    assert cache.get_stats()["hits"] == 1
+
+
+def test_entry_expires_after_ttl(clock):
+    cache = QueryCache("test", max_size=4, ttl=10)
+    cache.set("key", "value")
+
+    clock.now += 10
+    assert cache.get("key") == "value"
+
+    clock.now += 1
+    assert cache.get("key") is MISSING
+    assert len(cache) == 0
+
+
+def test_least_recently_used_entry_is_evicted(clock):
+    cache = QueryCache("test", max_size=2, ttl=10)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    # Обращение к "a" делает самой старой запись "b"
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("a") == 1
+    assert cache.get("b") is MISSING
+    assert cache.get("c") == 3
+
+
+def test_pop_and_invalidate(clock):
+    cache = QueryCache("test", max_size=4, ttl=10)
+    cache.set("a", 1)
+    cache.set("b", 2)
+
+    cache.pop("a")
+    cache.pop("missing")
+    assert cache.get("a") is MISSING
+
+    cache.invalidate()
+    assert len(cache) == 0
@@ -0,0 +1,93 @@
+"""
+Тесты разбиения понятий по доле правильных ответов и выбора сложности
+"""
+import pytest
+
+pytest.importorskip("crewai")
+pytest.importorskip("neo4j")
+pytest.importorskip("openai")
+pytest.importorskip("dotenv")
+
+from ai_tutor.agents.definitions import task_adapter
+from ai_tutor.agents.definitions.task_adapter import _split_concepts_by_ratio, _suggest_difficulty
+
+
+def _old_split(progress):
+    """
+    Исходное правило: доля < 0.5 - проблемное понятие, доля > 0.8 - усвоенное
+    """
+    problem, strong = [], []
+    for item in progress:
+        ratio = item.get('correct', 0) / max(item.get('attempts', 1), 1)
+        if ratio < 0.5:
+            problem.append(item.get('concept_name'))
+        elif ratio > 0.8:
+            strong.append(item.get('concept_name'))
+    return problem, strong
+
+
+def _old_difficulty(total_correct, total_attempts):
+    """
+    Исходное правило Neo4jClient.suggest_difficulty_level
+    """
+    if not total_attempts:
+        return "basic"
+    return "advanced" if total_correct / total_attempts > 0.7 else "basic"
+
+
+def _progress_grid():
+    # Все сочетания до 10 попыток, включая границы 0.5 и 0.8 и нулевые попытки
+    progress = []
+    for attempts in range(0, 11):
+        for correct in range(0, attempts + 1):
+            progress.append({
+                "concept_name": f"Понятие {correct}/{attempts}",
+                "correct": correct,
+                "attempts": attempts
+            })
+    return progress
+
+
+def test_split_matches_old_thresholds():
+    progress = _progress_grid()
+
+    assert _split_concepts_by_ratio(progress) == _old_split(progress)
+
+
+def test_split_boundaries():
+    progress = [
+        {"concept_name": "Половина", "correct": 1, "attempts": 2},
+        {"concept_name": "Четыре пятых", "correct": 4, "attempts": 5},
+        {"concept_name": "Без попыток", "correct": 0, "attempts": 0},
+    ]
+
+    # Без попыток доля считается от одной попытки и равна нулю
+    assert _split_concepts_by_ratio(progress) == (["Без попыток"], [])
+
+
+@pytest.mark.parametrize("use_numba", [True, False])
+def test_split_vectorized_path_matches_old_thresholds(monkeypatch, use_numba):
+    if not task_adapter.NUMPY_AVAILABLE:
+        pytest.skip("NumPy недоступен")
+    if use_numba and not task_adapter.NUMBA_AVAILABLE:
+        pytest.skip("Numba недоступна")
+    progress = _progress_grid() * 5
+    monkeypatch.setattr(task_adapter, "NUMPY_MIN_ITEMS", 1)
+    monkeypatch.setattr(task_adapter, "NUMBA_AVAILABLE", use_numba)
+
+    assert _split_concepts_by_ratio(progress) == _old_split(progress)
+
+
+def test_suggest_difficulty_matches_old_rule():
+    for attempts in range(0, 21):
+        for correct in range(0, attempts + 1):
+            progress = [
+                {"correct": correct // 2, "attempts": attempts // 2},
+                {"correct": correct - correct // 2, "attempts": attempts - attempts // 2},
+            ]
+            assert _suggest_difficulty(progress) == _old_difficulty(correct, attempts)
+
+
+def test_suggest_difficulty_without_progress():
+    assert _suggest_difficulty([]) == "basic"
+    assert _suggest_difficulty([{"correct": None, "attempts": None}]) == "basic"
@@ -0,0 +1,51 @@
+"""
+Тесты заранее разобранных шаблонов промптов
+"""
+import pytest
+
+pytest.importorskip("neo4j")
+pytest.importorskip("openai")
+pytest.importorskip("dotenv")
+
+from ai_tutor.agents.prompts.tutor_assistant_prompt import (
+    DISCUSSION_SYSTEM_PROMPT, DISCUSSION_SYSTEM_TEMPLATE, CompiledPrompt
+)
+
+
+def test_format_matches_str_format():
+    template = "Понятие: {name}\nОпределение: {definition}\n{name}?"
+    values = {"name": "Система", "definition": "Совокупность элементов"}
+
+    assert CompiledPrompt(template).format(**values) == template.format(**values)
+
+
+def test_escaped_braces_and_extra_arguments():
+    template = 'Ответ в JSON: {{"answer": "{answer}"}}'
+
+    assert CompiledPrompt(template).format(answer="да", unused="x") == 'Ответ в JSON: {"answer": "да"}'
+
+
+def test_values_are_converted_to_str():
+    assert CompiledPrompt("Попыток: {count}").format(count=3) == "Попыток: 3"
+
+
+def test_missing_field_raises_key_error():
+    with pytest.raises(KeyError):
+        CompiledPrompt("{name}").format()
+
+
+def test_format_spec_is_rejected():
+    with pytest.raises(ValueError):
+        CompiledPrompt("{score:.2f}")
+
+
+def test_module_template_matches_source_prompt():
+    values = {
+        "concept_name": "Система",
+        "concept_definition": "Совокупность элементов",
+        "task_question": "Что такое система?",
+        "chapter_context": "Глава 1",
+        "student_question": "Почему?"
+    }
+
+    assert DISCUSSION_SYSTEM_TEMPLATE.format(**values) == DISCUSSION_SYSTEM_PROMPT.format(**values)